@@ -1,32 +1,76 @@
-import errno, json, network, urequests as rq
-from machine import Pin, SoftI2C
+import errno, gc, json, network
+from machine import Timer
 from time import sleep, sleep_ms
 from rotary_irq_esp import RotaryIRQ
+from button_irq_esp import ButtonIRQ
 from lcd_api import LcdApi
 from i2c_lcd import I2cLcd
+from lcd_setup import open_lcd
+from lcd_glyphs import GlyphManager
+from lcd_render import RenderQueue
+from lcd_marquee import Marquee, RowMarquee
+from json_scan import JsonScanner
+from http_pool import HttpPool
+from retry_policy import RetryPolicy, host_of
+from rate_limit import RateLimiter, Deferred
+from refresh_scheduler import RefreshScheduler
+from price_cache import PriceCache
+from symbol_catalog import SymbolCatalog
+from ticker_stream import TickerStream
 
 # api base url
 apiBase = "https://api.binance.com/api/v3"
+# ticker fields read from the responses, the rest is skipped as it arrives
+tickerFields = ["symbol", "lastPrice", "highPrice", "lowPrice", "priceChangePercent", "openPrice", "price"]
+# exchangeInfo fields read into the local symbol list
+catalogFields = ["symbols[*].symbol", "symbols[*].status", "symbols[*].baseAsset"]
+# price source while tracking: "STREAM" gets every change pushed over the
+# <symbol>@miniTicker WebSocket streams (polling REST again while the stream
+# is down), "REST" polls the api every 5 seconds
+priceSource = "STREAM"
+# bounds of the refresh interval in ms when polling, each symbol is refreshed
+# more often the faster its price moves
+refreshMin = 2000
+refreshMax = 30000
+# prices younger than this (ms) are used again instead of requested. Keep it
+# below refreshMin, so a due refresh always requests the price
+cacheTtl = 1500
 
 # I2C Lcd parameters
 I2C_ADDR     = 0x27
 I2C_NUM_ROWS = 4
 I2C_NUM_COLS = 20
+# I2C Lcd bus configuration, "backend" is "soft" (SoftI2C) or "hard" (hardware
+# I2C peripheral) and "freq" can be "auto" to use the fastest reliable speed
+lcdConfig = {"backend":"soft", "bus":0, "sda":21, "scl":22, "freq":400000}
+try:
+    with open("lcd.json", "r") as f:
+        lcdConfig.update(json.loads(f.read()))
+        print("Lcd config: "+str(lcdConfig))
+except OSError:
+    with open("lcd.json", "w") as f:
+        f.write(json.dumps(lcdConfig))
+        print("lcd.json created")
 # I2C Lcd initialization
-i2c = SoftI2C(sda=Pin(21), scl=Pin(22), freq=400000)
-lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
-del I2C_ADDR,I2C_NUM_ROWS,I2C_NUM_COLS
+lcd, lcdFreq = open_lcd(lcdConfig, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+print(f"Lcd on {lcdConfig['backend']} I2C at {lcdFreq} Hz")
+del I2C_ADDR,I2C_NUM_ROWS,I2C_NUM_COLS,lcdConfig
 
 lcd.display_on()
 
-# create custom characters
+# create custom characters, uploaded to the lcd when first used
+glyphs = GlyphManager(lcd)
 # right arrow character
-lcd.custom_char(0, bytearray([0x10,0x18,0x1C,0x1E,0x1E,0x1C,0x18,0x10]))
-lcd.custom_char(1, bytearray([0x01,0x03,0x07,0x0F,0x0F,0x07,0x03,0x01]))
-lcd.custom_char(2, bytearray([0x04,0x0E,0x1F,0x04,0x04,0x04,0x04,0x04]))
-lcd.custom_char(3, bytearray([0x04,0x04,0x04,0x04,0x04,0x1F,0x0E,0x04]))
-lcd.custom_char(4, bytearray([0x00,0x01,0x01,0x01,0x01,0x01,0x01,0x00]))
-lcd.custom_char(5, bytearray([0x00,0x10,0x10,0x10,0x10,0x10,0x10,0x00]))
+glyphs.define("right", bytearray([0x10,0x18,0x1C,0x1E,0x1E,0x1C,0x18,0x10]))
+glyphs.define("left", bytearray([0x01,0x03,0x07,0x0F,0x0F,0x07,0x03,0x01]))
+glyphs.define("up", bytearray([0x04,0x0E,0x1F,0x04,0x04,0x04,0x04,0x04]))
+glyphs.define("down", bytearray([0x04,0x04,0x04,0x04,0x04,0x1F,0x0E,0x04]))
+glyphs.define("sepL", bytearray([0x00,0x01,0x01,0x01,0x01,0x01,0x01,0x00]))
+glyphs.define("sepR", bytearray([0x00,0x10,0x10,0x10,0x10,0x10,0x10,0x00]))
+
+# draw screens in the background so the main loop isn't held up by the lcd
+render = RenderQueue(lcd)
+render.start_timer(Timer(0))
 
 # display welcome message
 lcd.putstr("""\
@@ -40,19 +84,72 @@ sleep(0.5)
 lcd.backlight_on()
 sleep(1)
 
-# initialize rotary encoder instance
-clkPin = 15
-dtPin = 4
-r = RotaryIRQ(pin_num_clk=clkPin,
-              pin_num_dt=dtPin,
+# initialize rotary encoder instance, fast turns move up to ACCEL items per
+# detent in long lists
+ACCEL = 8
+# encoder pins, swapped by the "Reverse knob" option
+knobConfig = {"clk":15, "dt":4}
+try:
+    with open("knob.json", "r") as f:
+        knobConfig.update(json.loads(f.read()))
+        print("Knob config: "+str(knobConfig))
+except OSError:
+    with open("knob.json", "w") as f:
+        f.write(json.dumps(knobConfig))
+        print("knob.json created")
+r = RotaryIRQ(pin_num_clk=knobConfig["clk"],
+              pin_num_dt=knobConfig["dt"],
               min_val=0,
               max_val=0,
               reverse=False,
-              range_mode=RotaryIRQ.RANGE_WRAP)
-rbt = Pin(34, Pin.IN)
+              range_mode=RotaryIRQ.RANGE_WRAP,
+              accel=ACCEL)
+# encoder button, debounced in the background. Clicks are reported on release
+# since double clicks aren't used, a long press goes back
+rbt = ButtonIRQ(34, double_ms=0, timer=Timer(1))
 
 # initialize wlan connection
 wlan = network.WLAN(network.STA_IF); wlan.active(True)
+# http client, keeps the connection to each api host open between requests
+http = HttpPool()
+# failed requests are tried again a few times with growing delays and a host
+# that keeps failing is left alone for a while. Turning the knob cuts the
+# delays short, r.wait() leaves the turn queued so the screen leaves on it
+retry = RetryPolicy(wait=r.wait, fatal=(Deferred,))
+# requests are spaced out to stay within each host's rate limit, low priority
+# ones are put off while the budget is short. A knob turn cuts the spacing
+# short too, and stays queued for the screen
+limiter = RateLimiter(wait=r.wait)
+# request weight the api allows per minute and ip
+limiter.limit("api.binance.com", 6000)
+# when each symbol is polled next, from how fast its price has been moving
+refresh = RefreshScheduler(refreshMin, refreshMax)
+# every price received, shared by the tracking screens
+cache = PriceCache(cacheTtl)
+# symbols traded on Binance, downloaded once into a sorted index on flash
+catalog = SymbolCatalog("catalog.idx")
+
+# show a message, scrolling a single line that doesn't fit in a row
+def showMessage(tmessage, tseconds):
+    print("showMessage()")
+    # messages of several lines wrap across the rows
+    if len(tmessage) <= lcd.num_columns or "\n" in tmessage:
+        lcd.clear()
+        lcd.putstr(tmessage)
+        sleep(tseconds)
+        return
+    # the whole text is scrolled past once, with the display shift on 2 line
+    # displays. On bigger ones a DDRAM line is shown by two rows, so the
+    # second row is rewritten instead
+    if lcd.num_lines > 2:
+        marquee = RowMarquee(lcd, tmessage, 1)
+    else:
+        marquee = Marquee(lcd, tmessage)
+    marquee.start(True)
+    marquee.run(max(int(tseconds*1000), marquee.scroll_ms()))
+    marquee.stop()
+    del marquee
+    return
 
 # slice a list in chunks of specific size
 def genChunks(tlist, titems):
@@ -67,27 +164,36 @@ def genChunks(tlist, titems):
 # create a menu string to display on the LCD
 def menuString(toptions, tpage=0, tcursor=0, ttitle=""):
     print("menuString()")
+    # draw the menu off-screen, the render queue sends what changed
+    glyphs.begin_frame()
     lcd.clear()
+    # the title and the selected option scroll when they don't fit in a row
+    scroll = []
     if len(ttitle):
         trow = 1
-        lcd.putstr(ttitle)
+        lcd.putstr(ttitle[:20])
+        if len(ttitle) > 20: scroll.append(RowMarquee(lcd, ttitle, 0))
     else: trow = 0
     tmenu = ""
     for i in toptions[tpage]:
         lcd.move_to(0, trow)
         if i is toptions[tpage][tcursor]:
             if type(i) is list:
-                top = f"{chr(0)}{i[0].upper()}/{i[1].upper()}\n"
+                top = f"{glyphs.char('right')}{i[0].upper()}/{i[1].upper()}\n"
             else:
-                top = f"{chr(0)}{i}\n"
+                top = f"{glyphs.char('right')}{i}\n"
         else:
             if type(i) is list:
                 top = f" {i[0].upper()}/{i[1].upper()}\n"
             else:
                 top = f" {i}\n"
         lcd.putstr(top[:20])
+        if len(top) > 21 and i is toptions[tpage][tcursor]:
+            scroll.append(RowMarquee(lcd, top[:-1], trow))
         trow += 1
-    return
+    render.submit(glyphs)
+    for m in scroll: m.start()
+    return scroll
 
 # select a menu option using rotary encoder
 def menuSel(topts, ttitle=""):
@@ -97,28 +203,54 @@ def menuSel(topts, ttitle=""):
         trows = 3
     else: trows = 4
     tchunks = list(genChunks(topts, trows))
-    menuString(tchunks, ttitle=ttitle)
+    scroll = menuString(tchunks, ttitle=ttitle)
     r.set(min_val=0, max_val=len(topts)-1, value=0)
+    rbt.clear_events()
     val_old = r.value()
     while True:
+        # wait up to 20ms for the knob to turn, then check the button. The
+        # value is read below, the step events aren't needed
+        if r.wait(20): r.clear_events()
+        for m in scroll: m.poll()
         val_new = r.value()
-        btn = rbt.value()
+        btn = rbt.get_event()
         if val_old != val_new:
             val_old = val_new
             print('result =', val_new)
             page = int(val_new/trows)
             item = val_new-page*trows
-            menuString(tchunks, page, item, ttitle)
-        if btn:
+            scroll = menuString(tchunks, page, item, ttitle)
+        if btn == rbt.CLICK:
             print("Button = Pressed")
             selection = topts[val_new]
-            while rbt.value(): pass
             break
-        sleep_ms(50)
+        if btn == rbt.LONG and "(RETURN)" in topts:
+            print("Button = Long press")
+            selection = "(RETURN)"
+            break
     print("Selected: ", selection)
     return selection
 
-def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, numbers=True, symbols=True, delete=True, enter=True):
+def inputChars(characters, tinput, complete):
+    # the characters of the input screen that can follow tinput, from
+    # complete(tinput) -> (next characters, True if tinput is complete).
+    # (ENTER) is left out until the input is complete or empty
+    allowed, done = complete(tinput)
+    return [c for c in characters if c in allowed or
+            (c == "(SPACE)" and " " in allowed) or
+            (c == "(DELETE)" and len(tinput)) or
+            (c == "(ENTER)" and (done or not len(tinput)))]
+
+def inputRows(tinput, options, complete):
+    # draw the input row, and with complete the characters that can come
+    # next, scrolling the ones that don't fit in their row
+    scroll = [RowMarquee(lcd, glyphs.char("right")+tinput, 1)]
+    if complete:
+        scroll.append(RowMarquee(lcd, "".join(c for c in options if len(c) == 1), 2))
+    for m in scroll: m.start()
+    return scroll
+
+def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, numbers=True, symbols=True, delete=True, enter=True, complete=None):
     print("userIn()")
     characters = []
     # add (SPACE) option to characters
@@ -152,30 +284,41 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
     # add (ENTER) option to characters
     if enter:
         characters += ["(ENTER)"]
+    # with complete only the characters that can come next are offered, and
+    # listed in the third row
+    tinput = ""
+    options = inputChars(characters, tinput, complete) if complete else characters
     # print input menu
     lcd.clear()
     lcd.putstr(tmessage)
-    tinput = ""
-    lcd.move_to(0,1)
-    lcd.putstr(str(chr(0)+tinput))
+    scroll = inputRows(tinput, options, complete)
     lcd.move_to(0,3)
     lcd.putstr("> ")
-    r.set(min_val=0, max_val=len(characters)-1, value=0)
+    r.set(min_val=0, max_val=len(options)-1, value=0)
+    rbt.clear_events()
     val_old = r.value()
-    lcd.putstr(characters[val_old])
+    lcd.putstr(options[val_old])
     while True:
+        # wait up to 20ms for the knob to turn, then check the button. The
+        # value is read below, the step events aren't needed
+        if r.wait(20): r.clear_events()
+        for m in scroll: m.poll()
         val_new = r.value()
-        btn = rbt.value()
+        btn = rbt.get_event()
         if val_old != val_new:
             val_old = val_new
             lcd.move_to(2,3)
             lcd.putstr(" "*18)
             lcd.move_to(2,3)
-            print('result =', characters[val_new])
-            lcd.putstr(characters[val_new])
-        if btn:
+            print('result =', options[val_new])
+            lcd.putstr(options[val_new])
+        if btn == rbt.LONG:
+            print("Button long press, input cancelled")
+            tinput = ""
+            break
+        if btn == rbt.CLICK:
             print("Button pressed!")
-            selection = characters[val_new]
+            selection = options[val_new]
             if not selection == "(ENTER)":
                 lcd.clear()
                 lcd.putstr(tmessage)
@@ -186,15 +329,19 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
                         tinput += " "
                     else:
                         tinput += selection
-                lcd.move_to(0,1)
-                lcd.putstr(str(chr(0)+tinput))
+                if complete:
+                    # narrow the characters to what can follow the input
+                    options = inputChars(characters, tinput, complete)
+                    # (ENTER) comes first once the input is complete
+                    r.set(max_val=len(options)-1, value=options.index("(ENTER)") if "(ENTER)" in options and len(tinput) else 0)
+                    val_old = r.value()
+                    selection = options[val_old]
+                scroll = inputRows(tinput, options, complete)
                 lcd.move_to(0,3)
                 print("Input = "+selection)
                 lcd.putstr("> "+selection)
             else:
                 break
-            while rbt.value(): pass
-        sleep_ms(50)
     return tinput
 
 def connect():
@@ -239,9 +386,7 @@ def connect():
                 sleep(2.5)
                 while not wlan.isconnected(): pass
                 print(f"Connected to {i} network!")
-                lcd.clear()
-                lcd.putstr(f"Connected to {i} network!")
-                sleep(1)
+                showMessage(f"Connected to {i} network!", 1)
                 return True
         else:
             print("Networks not recognized!\n")
@@ -250,6 +395,8 @@ def connect():
                 Id = menuSel(ap, "Select network:")
                 print("Password!")
                 pwd = userIn("Insert password:")
+                # a long press (or no password) goes back to the networks
+                if not len(pwd): continue
                 lcd.clear()
                 lcd.putstr("Connecting...")
                 wlan.connect(Id, pwd)
@@ -260,9 +407,7 @@ def connect():
                     sleep(1)
                 if wlan.isconnected():
                     print(f"Connected to {Id} network!")
-                    lcd.clear()
-                    lcd.putstr(f"Connected to {Id} network!")
-                    sleep(1)
+                    showMessage(f"Connected to {Id} network!", 1)
                     net[Id] = pwd
                     with open("networks.json", "w") as f:
                         f.write(json.dumps(net))
@@ -273,9 +418,7 @@ def connect():
                 else:
                     wlan.active(False)
                     print("Something happened. Try again!")
-                    lcd.clear()
-                    lcd.putstr("Something happened. Try again!")
-                    sleep(1)
+                    showMessage("Something happened. Try again!", 1)
                     wlan.active(True)
     else:
         print("Connected!")
@@ -348,19 +491,21 @@ def addSymbol():
     print("addSymbol()")
     # look for saved symbols
     symbols = symbolsList()
+    # the first time, offer to download the symbol list for the input screens
+    # to complete the assets
+    if not catalog.count() and wlan.isconnected():
+        if menuSel(["Yes","No"], "Get symbol list?") == "Yes": updateCatalog()
+    listed = catalog.count() > 0
     # add new symbol to the system
     while wlan.isconnected():
-        baseAsset = userIn("Select base coin:", space=False, lowerCase=False, symbols="-_.")
+        baseAsset = userIn("Select base coin:", space=False, lowerCase=False, symbols="-_.", complete=catalog.base_chars if listed else None)
         if not len(baseAsset) == 0:
-            quoteAsset = userIn("Select quote coin:", space=False, lowerCase=False, symbols="-_.")
+            quoteAsset = userIn("Select quote coin:", space=False, lowerCase=False, symbols="-_.", complete=(lambda prefix: catalog.quote_chars(baseAsset, prefix)) if listed else None)
+            # a long press goes back to the base coin
+            if not len(quoteAsset): continue
             symbol = baseAsset+quoteAsset
-            print(f"Requesting: {symbol}")
-            lcd.clear()
-            lcd.putstr("Requesting symbol...")
-            symbolInfo = rq.get(apiBase + f"/exchangeInfo?symbol={symbol}")
-            if symbolInfo.status_code == 200 and len(symbolInfo.json()):
-                symbolInfo = symbolInfo.json()
-                symbolInfo = {"baseAsset":symbolInfo["symbols"][0]["baseAsset"],"quoteAsset":symbolInfo["symbols"][0]["quoteAsset"]}
+            status, symbolInfo = lookupSymbol(symbol)
+            if status == 200:
                 if not symbol in list(symbols.keys()):
                     symbols[symbol] = symbolInfo
                     with open("symbols.json", "w") as f:
@@ -373,12 +518,14 @@ def addSymbol():
                     print("Symbol exists!")
                     lcd.clear()
                     lcd.putstr("Symbol exists!")
-                del symbol,symbolInfo,baseAsset,quoteAsset
+                del symbol,symbolInfo,baseAsset,quoteAsset,status
                 break
             else:
-                print("Symbol not found!")
+                message = "Symbol not found!" if status else "Request failed!"
+                print(message)
                 lcd.clear()
-                lcd.putstr("Symbol not found!")
+                lcd.putstr(message)
+                del message
                 sleep(1)
                 if menuSel(["Yes","No"], "Try again?") == "No": break
                 else: continue
@@ -389,7 +536,76 @@ def addSymbol():
         print("Not connected!")
         lcd.clear()
         lcd.putstr("Not connected!")
-    del symbols
+    del symbols,listed
+    sleep(1)
+    return
+
+def lookupSymbol(symbol):
+    # return (status code, {"baseAsset", "quoteAsset"} or None) of symbol,
+    # looked up in the local symbol list if there is one, requested otherwise
+    if catalog.count():
+        assets = catalog.find(symbol)
+        print(f"Symbol list: {symbol} {assets}")
+        if assets is None:
+            return 400, None
+        return 200, {"baseAsset":assets[0],"quoteAsset":assets[1]}
+    print(f"Requesting: {symbol}")
+    lcd.clear()
+    lcd.putstr("Requesting symbol...")
+    # only the assets are read from the response
+    url = apiBase + f"/exchangeInfo?symbol={symbol}"
+    try:
+        # exchangeInfo weighs 20 and can wait for the budget
+        status, symbolInfo = retry.call(host_of(url), fetchJson, (url, ["symbols[0].baseAsset", "symbols[0].quoteAsset"], 20, True))
+    except Exception as e:
+        print(f"An error happened while requesting symbol! ({e})")
+        status, symbolInfo = 0, None
+    del url
+    if status == 200 and len(symbolInfo) == 2:
+        return 200, {"baseAsset":symbolInfo["symbols[0].baseAsset"],"quoteAsset":symbolInfo["symbols[0].quoteAsset"]}
+    return status, None
+
+def catalogEntries(scanner):
+    # yield (symbol, base asset) of every symbol trading in an exchangeInfo
+    # response, as it's read
+    fields = {}
+    for path, value in scanner.scan(catalogFields):
+        fields[path] = value
+        if len(fields) == len(catalogFields):
+            if fields[catalogFields[1]] == "TRADING":
+                yield fields[catalogFields[0]], fields[catalogFields[2]]
+            fields = {}
+
+def updateCatalog():
+    print("updateCatalog()")
+    lcd.clear()
+    lcd.putstr("Getting symbol list...")
+    # the exchangeInfo of every symbol is a few MB, it's sorted into the
+    # index on flash as it arrives
+    url = apiBase + "/exchangeInfo?permissions=SPOT&showPermissionSets=false"
+    host = host_of(url)
+    try:
+        limiter.acquire(host, 20)
+        gc.collect()
+        response = http.get(url)
+        try:
+            limiter.update(host, response.status_code, response.headers)
+            if response.status_code != 200:
+                raise OSError(f"HTTP {response.status_code}")
+            scanner = JsonScanner(response.raw, 512)
+            count = catalog.build(catalogEntries(scanner))
+            print(f"{count} symbols saved, {scanner.nbytes} bytes")
+            del scanner
+        finally:
+            response.close()
+        lcd.clear()
+        lcd.putstr(f"{count} symbols saved!")
+        del response,count
+    except Exception as e:
+        print(f"An error happened while getting the symbol list! ({e})")
+        lcd.clear()
+        lcd.putstr("Request failed!")
+    del url,host
     sleep(1)
     return
 
@@ -412,6 +628,9 @@ def removeSymbol():
                         f.write(json.dumps(symbols))
                         print("Updated symbols list: "+str(symbols))
                     del f
+                    # its price isn't needed anymore
+                    cache.forget(sel_symbol)
+                    refresh.forget(sel_symbol)
                     lcd.clear()
                     lcd.putstr("Succesfully removed!")
                     del sel_symbol
@@ -424,48 +643,204 @@ def removeSymbol():
     del symbols,symbols_opts
     return
 
-def showPrice(data, symbolInfo):
+def showPrice(data, symbolInfo, stale=False):
     print("showPrice()")
-    print(f"{symbolInfo['baseAsset']}: {float(data['lastPrice'])} {symbolInfo['quoteAsset']}, 24hr: {float(data['priceChangePercent'])}%, High: {float(data['highPrice'])}, Low: {float(data['lowPrice'])}")
+    print(f"{symbolInfo['baseAsset']}: {float(data['lastPrice'])} {symbolInfo['quoteAsset']}", end="")
+    if "highPrice" in data:
+        print(f", 24hr: {float(data['priceChangePercent'])}%, High: {float(data['highPrice'])}, Low: {float(data['lowPrice'])}", end="")
+    print()
+    # draw the price screen off-screen, the render queue sends what changed
+    glyphs.begin_frame()
     lcd.clear()
-    lcd.putstr(f"{symbolInfo['baseAsset']}/{symbolInfo['quoteAsset']}".center(20))
+    # an asterisk marks a last known price that should have been refreshed
+    lcd.putstr(f"{symbolInfo['baseAsset']}/{symbolInfo['quoteAsset']}{'*' if stale else ''}".center(20))
     lcd.move_to(0,1)
-    lcd.putstr(f"{chr(0)} {float(data['lastPrice'])} {chr(1)}".center(20))
-    lcd.move_to(0,2)
-    lcd.putstr(f"{chr(2)}{float(data['highPrice'])}")
-    lcd.move_to(9,2)
-    lcd.putstr(chr(4)+chr(5))
-    lcd.move_to(11,2)
-    lcd.putstr(f"24hr".center(9))
-    lcd.move_to(0,3)
-    lcd.putstr(f"{chr(3)}{float(data['lowPrice'])}")
-    lcd.move_to(9,3)
-    lcd.putstr(chr(4)+chr(5))
-    lcd.move_to(11,3)
-    lcd.putstr(f"{float(data['priceChangePercent'])}%".center(9))
+    lcd.putstr(f"{glyphs.char('right')} {float(data['lastPrice'])} {glyphs.char('left')}".center(20))
+    # the 24hr figures aren't in the PRICE payload
+    if "highPrice" in data:
+        lcd.move_to(0,2)
+        lcd.putstr(f"{glyphs.char('up')}{float(data['highPrice'])}")
+        lcd.move_to(9,2)
+        lcd.putstr(glyphs.char("sepL")+glyphs.char("sepR"))
+        lcd.move_to(11,2)
+        lcd.putstr(f"24hr".center(9))
+        lcd.move_to(0,3)
+        lcd.putstr(f"{glyphs.char('down')}{float(data['lowPrice'])}")
+        lcd.move_to(9,3)
+        lcd.putstr(glyphs.char("sepL")+glyphs.char("sepR"))
+        lcd.move_to(11,3)
+        lcd.putstr(f"{float(data['priceChangePercent'])}%".center(9))
+    render.submit(glyphs)
     del data,symbolInfo
     return
 
-def requestPrice(symbol, option):
-    print("requestPrice()")
-    data = False
-    # request symbol price to api
-    while True:
-        try:
-            print("Requesting: "+symbol, end=" ")
-            data = rq.get(apiBase + f"/ticker/24hr?symbol={symbol}")
-            # if status code is 200 return data
-            if data.status_code == 200:
-                print("(200)")
-                data = data.json()
-                break
+def getJson(url, paths, weight=1, low=False):
+    # request url and return (status code, {path: value} or None) with the
+    # values at paths (see json_scan.py), read from the response as it arrives.
+    # Paths with [*] get the list of every match. Prints the bytes received
+    # and the heap allocated by the request. The request counts `weight`
+    # against the host's rate limit and raises Deferred if it has to wait
+    host = host_of(url)
+    limiter.acquire(host, weight, low)
+    gc.collect()
+    heap = gc.mem_alloc()
+    response = http.get(url)
+    try:
+        status = response.status_code
+        limiter.update(host, status, response.headers)
+        data = None
+        size = 0
+        if status == 200:
+            scanner = JsonScanner(response.raw)
+            if any("[*]" in path for path in paths):
+                data = {}
+                for path, value in scanner.scan(paths):
+                    data.setdefault(path, []).append(value)
             else:
-                print(f"({data.status_code})")
-        except:
-            print(f"An error happened while requesting price! (requestPrice: {option})")
-            #raise Exception("Error requesting single price!")
+                data = scanner.extract(paths)
+            size = scanner.nbytes
+            del scanner
+        print(f"({status}) {size} bytes, {gc.mem_alloc()-heap} bytes of heap")
+    finally:
+        response.close()
+    del host,heap,size,response
+    return status, data
+
+def fetchJson(url, paths, weight=1, low=False):
+    # getJson() for the retry policy: rate limits and server errors raise so
+    # they're tried again, other status codes are returned
+    status, data = getJson(url, paths, weight, low)
+    if status == 418 or status == 429 or status >= 500:
+        raise OSError(f"HTTP {status}")
+    return status, data
+
+def tickerUrl(profile):
+    # return the ticker endpoint of a payload profile, ready for its query.
+    # Each screen asks for the smallest profile with what it shows: "FULL" is
+    # the whole 24hr ticker (~600 bytes per symbol), "MINI" the 24hr ticker
+    # with only the prices and volumes (enough for the 24hr rows of
+    # showPrice, the change is worked out from openPrice) and "PRICE" just
+    # the last price
+    if profile == "PRICE":
+        return apiBase + "/ticker/price?"
+    if profile == "MINI":
+        return apiBase + "/ticker/24hr?type=MINI&"
+    return apiBase + "/ticker/24hr?"
+
+def tickerData(data):
+    # fill in the fields showPrice uses that the smaller payloads leave out
+    # and drop the others
+    if "price" in data:
+        data["lastPrice"] = data["price"]
+    if not "priceChangePercent" in data and "openPrice" in data:
+        openPrice = float(data["openPrice"])
+        change = (float(data["lastPrice"])-openPrice)*100/openPrice if openPrice else 0
+        data["priceChangePercent"] = "%.3f" % change
+        del openPrice,change
+    return {key: data[key] for key in tickerFields[:5] if key in data}
+
+def tickerWeight(count, profile):
+    # request weight of a ticker request for count symbols
+    if profile == "PRICE":
+        return 2 if count == 1 else 4
+    return 2 if count <= 20 else 40 if count <= 100 else 80
+
+def fetchTicker(url, weight):
+    print("Requesting: "+url, end=" ")
+    status, data = fetchJson(url, tickerFields[1:], weight)
+    return tickerData(data) if status == 200 else False
+
+def fetchTickers(url, weight):
+    print("Requesting: "+url, end=" ")
+    status, data = fetchJson(url, ["[*]"], weight)
+    if status != 200:
+        # an invalid symbol fails the whole request, retrying won't help
+        return False
+    return {d["symbol"]: tickerData(d) for d in data.get("[*]", [])}
+
+def isStale(symbol):
+    # True if the cached price of symbol is older than any refresh should
+    # have left it
+    age = cache.age_ms(symbol)
+    return age is not None and age > refreshMax
+
+def hasProfile(data, profile):
+    # True if data has the fields of a ticker profile, a PRICE payload in the
+    # cache doesn't have the 24hr figures
+    return profile == "PRICE" or "highPrice" in data
+
+def requestPrice(symbol, option, profile):
+    print("requestPrice()")
+    # a price received less than cacheTtl ago is used again, when the request
+    # fails the last price received is returned, False if there is none
+    data = cache.get(symbol)
+    if data is not None and hasProfile(data, profile):
+        return data
+    url = tickerUrl(profile) + f"symbol={symbol}"
+    try:
+        data = retry.call(host_of(url), fetchTicker, (url, tickerWeight(1, profile)))
+        if data: cache.put(symbol, data)
+    except Exception as e:
+        print(f"An error happened while requesting price! (requestPrice: {option}) ({e})")
+        data = cache.last(symbol) or False
+    del url
+    return data
+
+def requestPrices(symbols, option, profile):
+    print("requestPrices()")
+    # request the price of every symbol to api in one call, symbols is sent
+    # as a url encoded json list: ["BTCUSDT","ETHUSDT"]. The ones received
+    # less than cacheTtl ago are taken from the cache
+    data = {}
+    missing = []
+    for symbol in symbols:
+        cached = cache.get(symbol)
+        if cached is None or not hasProfile(cached, profile): missing.append(symbol)
+        else: data[symbol] = cached
+    if not missing:
+        return data
+    url = tickerUrl(profile) + "symbols=%5B%22" + "%22,%22".join(missing) + "%22%5D"
+    try:
+        prices = retry.call(host_of(url), fetchTickers, (url, tickerWeight(len(missing), profile)))
+        if prices:
+            for symbol in prices:
+                cache.put(symbol, prices[symbol])
+            data.update(prices)
+        elif not data:
+            data = False
+    except Exception as e:
+        print(f"An error happened while requesting prices! (requestPrices: {option}) ({e})")
+        # keep showing the last known prices, like requestPrice
+        for symbol in missing:
+            last = cache.last(symbol)
+            if last: data[symbol] = last
+        data = data or False
+    del url,missing
     return data
 
+def refreshPrices(symbols, option, profile):
+    # request the symbols whose refresh is due, all in one call, into the
+    # cache. Returns True if any price was received
+    due = [symbol for symbol in symbols if refresh.due(symbol)]
+    last = [cache.last(symbol) for symbol in due]
+    if len(due) == 1:
+        data = requestPrice(due[0], option, profile)
+        data = {due[0]: data} if data else False
+    elif due:
+        data = requestPrices(due, option, profile)
+    else:
+        data = False
+    for symbol, old in zip(due, last):
+        # a price taken from the cache (or the last one, when the request
+        # failed) isn't a new tick
+        if data and symbol in data and data[symbol] is not old:
+            refresh.observe(symbol, float(data[symbol]["lastPrice"]))
+        else:
+            # try again after the current interval
+            refresh.observe(symbol)
+    del due,last
+    return bool(data)
+
 def trackSingle(symbol=False):
     print("trackSingle()")
     # save state
@@ -488,32 +863,46 @@ def trackSingle(symbol=False):
     if not symbol == "(RETURN)":
         # save state
         saveState(option="Track single", symbol=symbol)
-        # track symbol price
-        timer = 0
-        lcd.clear()
-        lcd.putstr("Loading symbol...")
+        # track symbol price, starting with the last known one
+        data = cache.last(symbol)
+        if data:
+            showPrice(data, symbolsInfo[symbol], isStale(symbol))
+        else:
+            lcd.clear()
+            lcd.putstr("Loading symbol...")
+        stream = TickerStream([symbol]) if priceSource == "STREAM" else None
         r.set(min_val=0, max_val=50, value=0)
         val_old = r.value()
         while wlan.isconnected():
+            # wait up to 50ms for the knob to turn
+            moved = r.wait(50)
             val_new = r.value()
             # if rotary encoder is moved call the maiMenu
-            if val_old != val_new:
+            if moved or val_old != val_new:
                 # save default state to return to mainMenu
                 saveState()
                 break
-            if timer >= 5000:
-                timer = 0
-                # show selected symbol current price
-                data = requestPrice(symbol, "trackSingle")
+            # show every price the stream pushes as it arrives
+            if stream and stream.poll():
+                data = stream.get(symbol)
+                cache.put(symbol, data)
+                refresh.observe(symbol, float(data["lastPrice"]))
                 showPrice(data, symbolsInfo[symbol])
-            sleep_ms(50)
-            timer += 50
+            # poll while there is no stream, when the refresh is due
+            if refresh.due(symbol) and not (stream and stream.connected() and stream.get(symbol)):
+                # show selected symbol current price, with the 24hr figures
+                # of the MINI payload
+                last = cache.last(symbol)
+                data = requestPrice(symbol, "trackSingle", "MINI")
+                refresh.observe(symbol, float(data["lastPrice"]) if data and data is not last else None)
+                if data: showPrice(data, symbolsInfo[symbol], isStale(symbol))
         else:
             print("Not connected!")
             lcd.clear()
             lcd.putstr("Not connected!")
-            del timer,val_old
             sleep(1)
+        if stream: stream.close()
+        del val_old,stream,data
     del symbolsInfo
     return
 
@@ -537,33 +926,57 @@ def trackMultiple():
         # save default state to return to mainMenu
         saveState()
         return
-    # track symbols price
-    timer = 0
+    # track symbols price, one symbol is shown at a time for 5 seconds. The
+    # prices are streamed, or the symbols due for a refresh are requested
+    # together when the one on screen is due. The first symbol is shown with
+    # its last known price before anything is requested
+    timer = 5000
     index = 0
+    if cache.last(symbols[0]):
+        showPrice(cache.last(symbols[0]), symbolsInfo[symbols[0]], isStale(symbols[0]))
+    stream = TickerStream(symbols) if priceSource == "STREAM" else None
+    shown = False
+    redraw = False
     r.set(min_val=0, max_val=50, value=0)
     val_old = r.value()
     while wlan.isconnected():
+        # wait up to 50ms for the knob to turn
+        moved = r.wait(50)
         val_new = r.value()
         # if rotary encoder is moved call mainMenu
-        if val_old != val_new:
+        if moved or val_old != val_new:
             # save default state to return to mainMenu
             saveState()
             break
+        # take the prices the stream pushes, redrawing the symbol on screen
+        if stream and stream.poll():
+            for symbol in symbols:
+                data = stream.get(symbol)
+                if data and data is not cache.last(symbol):
+                    cache.put(symbol, data)
+                    refresh.observe(symbol, float(data["lastPrice"]))
+                    redraw = redraw or symbol == shown
+        # show each saved symbol in turn
         if timer >= 5000:
             timer = 0
-            # show each saved symbol current data
-            data = requestPrice(symbols[index], "trackMultiple")
-            showPrice(data, symbolsInfo[symbols[index]])
+            shown = symbols[index]
+            redraw = True
             if index == len(symbols)-1: index = 0
             else: index += 1
-        sleep_ms(50)
+        # poll while there is no stream, when the refresh is due
+        if refresh.due(shown) and not (stream and stream.connected() and stream.get(shown)):
+            redraw = refreshPrices(symbols, "trackMultiple", "MINI") or redraw
+        if redraw and cache.last(shown):
+            showPrice(cache.last(shown), symbolsInfo[shown], isStale(shown))
+        redraw = False
         timer += 50
     else:
         print("Not connected!")
         lcd.clear()
         lcd.putstr("Not connected!")
         sleep(1)
-    del symbolsInfo,symbols,timer,index,val_old
+    if stream: stream.close()
+    del symbolsInfo,symbols,timer,index,val_old,stream,shown,redraw
     return
 
 def mainMenu():
@@ -576,7 +989,7 @@ def mainMenu():
             del selection
             while True:
                 print("Symbols options")
-                selection = menuSel(["Add symbol", "Remove symbol", "(RETURN)"], "Symbols options:")
+                selection = menuSel(["Add symbol", "Remove symbol", "Update symbol list", "(RETURN)"], "Symbols options:")
                 if selection == "Add symbol":
                     del selection
                     print("Selected Add symbol")
@@ -585,6 +998,10 @@ def mainMenu():
                     del selection
                     print("Selected Remove symbol")
                     removeSymbol()
+                elif selection == "Update symbol list":
+                    del selection
+                    print("Selected Update symbol list")
+                    updateCatalog()
                 else: break
         elif selection == "Track":
             del selection
@@ -618,13 +1035,11 @@ def mainMenu():
                 else: break
         elif selection == "Reverse knob":
             print("Reverse knob")
-            global clkPin,dtPin,r
-            tclk = clkPin
-            tdt = dtPin
-            clkPin = tdt
-            dtPin = tclk
-            del tclk,tdt
-            r = RotaryIRQ(pin_num_clk=clkPin, pin_num_dt=dtPin, min_val=0, max_val=0, reverse=False, range_mode=RotaryIRQ.RANGE_WRAP)
+            # swap the pins of the running encoder and remember it
+            r.swap_pins()
+            knobConfig["clk"], knobConfig["dt"] = r.pins()
+            with open("knob.json", "w") as f:
+                f.write(json.dumps(knobConfig))
         else:
             break
     return
@@ -647,8 +1062,7 @@ while True:
                 mainMenu()
         else:
             print("Couldn't connect to the internet!")
-            lcd.clear()
-            lcd.putstr("Couldn't connect to the internet!")
+            showMessage("Couldn't connect to the internet!", 1)
             connect()
     except Exception as e:
         print(f"Unknown error! ({e.errno}) Please reset the system.")
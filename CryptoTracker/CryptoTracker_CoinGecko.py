@@ -1,25 +1,58 @@
-import errno, json, network, urequests as rq
-from machine import Pin, SoftI2C
+import errno, gc, json, network
+from machine import Timer
 from time import sleep, sleep_ms
 from rotary_irq_esp import RotaryIRQ
+from button_irq_esp import ButtonIRQ
 from lcd_api import LcdApi
 from i2c_lcd import I2cLcd
+from lcd_setup import open_lcd
+from lcd_glyphs import GlyphManager
+from lcd_render import RenderQueue
+from lcd_marquee import Marquee, RowMarquee
+from json_scan import JsonScanner
+from http_pool import HttpPool
+from retry_policy import RetryPolicy, host_of
+from rate_limit import RateLimiter, Deferred
+from refresh_scheduler import RefreshScheduler
+from price_cache import PriceCache
+
+# bounds of the refresh interval in ms, each pair is refreshed more often the
+# faster its price moves (the free api allows a call every 6 seconds)
+refreshMin = 6000
+refreshMax = 30000
+# prices younger than this (ms) are used again instead of requested. Keep it
+# below refreshMin, so a due refresh always requests the price
+cacheTtl = 5000
 
 # I2C Lcd parameters
 I2C_ADDR     = 0x27
 I2C_NUM_ROWS = 4
 I2C_NUM_COLS = 20
+# I2C Lcd bus configuration, "backend" is "soft" (SoftI2C) or "hard" (hardware
+# I2C peripheral) and "freq" can be "auto" to use the fastest reliable speed
+lcdConfig = {"backend":"soft", "bus":0, "sda":21, "scl":22, "freq":400000}
+try:
+    with open("lcd.json", "r") as f:
+        lcdConfig.update(json.loads(f.read()))
+        print("Lcd config: "+str(lcdConfig))
+except OSError:
+    with open("lcd.json", "w") as f:
+        f.write(json.dumps(lcdConfig))
+        print("lcd.json created")
 # I2C Lcd initialization
-i2c = SoftI2C(sda=Pin(21), scl=Pin(22), freq=400000)
-lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
-del I2C_ADDR,I2C_NUM_ROWS,I2C_NUM_COLS
+lcd, lcdFreq = open_lcd(lcdConfig, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+print(f"Lcd on {lcdConfig['backend']} I2C at {lcdFreq} Hz")
+del I2C_ADDR,I2C_NUM_ROWS,I2C_NUM_COLS,lcdConfig
 
 lcd.display_on()
 
-# create custom arrow char
-arrowChar = [0x00, 0x04, 0x06, 0x1F, 0x1F, 0x06, 0x04, 0x00]
-lcd.custom_char(0, bytearray(arrowChar))
-del(arrowChar)
+# create custom arrow char, uploaded to the lcd when first used
+glyphs = GlyphManager(lcd)
+glyphs.define("right", bytearray([0x00, 0x04, 0x06, 0x1F, 0x1F, 0x06, 0x04, 0x00]))
+
+# draw screens in the background so the main loop isn't held up by the lcd
+render = RenderQueue(lcd)
+render.start_timer(Timer(0))
 
 # display welcome message
 lcd.putstr("""\
@@ -33,17 +66,60 @@ sleep(0.5)
 lcd.backlight_on()
 sleep(1)
 
-# initialize rotary encoder instance
+# initialize rotary encoder instance, fast turns move up to ACCEL items per
+# detent in long lists
+ACCEL = 8
 r = RotaryIRQ(pin_num_clk=15,
               pin_num_dt=4,
               min_val=0,
               max_val=0,
               reverse=False,
-              range_mode=RotaryIRQ.RANGE_WRAP)
-rbt = Pin(34, Pin.IN)
+              range_mode=RotaryIRQ.RANGE_WRAP,
+              accel=ACCEL)
+# encoder button, debounced in the background. Clicks are reported on release
+# since double clicks aren't used, a long press goes back
+rbt = ButtonIRQ(34, double_ms=0, timer=Timer(1))
 
 # initialize wlan connection
 wlan = network.WLAN(network.STA_IF); wlan.active(True)
+# http client, keeps the connection to each api host open between requests
+http = HttpPool()
+# failed requests are tried again a few times with growing delays and a host
+# that keeps failing is left alone for a while. Turning the knob cuts the
+# delays short, r.wait() leaves the turn queued so the screen leaves on it
+retry = RetryPolicy(wait=r.wait, fatal=(Deferred,))
+# requests are spaced out to stay within each host's rate limit, low priority
+# ones are put off while the budget is short. A knob turn cuts the spacing
+# short too, and stays queued for the screen
+limiter = RateLimiter(wait=r.wait)
+# calls the free api allows per minute
+limiter.limit("api.coingecko.com", 10)
+# when each pair is requested next, from how fast its price has been moving
+refresh = RefreshScheduler(refreshMin, refreshMax)
+# every price received, shared by the tracking screens
+cache = PriceCache(cacheTtl)
+
+# show a message, scrolling a single line that doesn't fit in a row
+def showMessage(tmessage, tseconds):
+    print("showMessage()")
+    # messages of several lines wrap across the rows
+    if len(tmessage) <= lcd.num_columns or "\n" in tmessage:
+        lcd.clear()
+        lcd.putstr(tmessage)
+        sleep(tseconds)
+        return
+    # the whole text is scrolled past once, with the display shift on 2 line
+    # displays. On bigger ones a DDRAM line is shown by two rows, so the
+    # second row is rewritten instead
+    if lcd.num_lines > 2:
+        marquee = RowMarquee(lcd, tmessage, 1)
+    else:
+        marquee = Marquee(lcd, tmessage)
+    marquee.start(True)
+    marquee.run(max(int(tseconds*1000), marquee.scroll_ms()))
+    marquee.stop()
+    del marquee
+    return
 
 # slice a list in chunks of specific size
 def genChunks(tlist, titems):
@@ -58,27 +134,36 @@ def genChunks(tlist, titems):
 # create a menu string to display on the LCD
 def menuString(toptions, tpage=0, tcursor=0, ttitle=""):
     print("menuString()")
+    # draw the menu off-screen, the render queue sends what changed
+    glyphs.begin_frame()
     lcd.clear()
+    # the title and the selected option scroll when they don't fit in a row
+    scroll = []
     if len(ttitle):
         trow = 1
-        lcd.putstr(ttitle)
+        lcd.putstr(ttitle[:20])
+        if len(ttitle) > 20: scroll.append(RowMarquee(lcd, ttitle, 0))
     else: trow = 0
     tmenu = ""
     for i in toptions[tpage]:
         lcd.move_to(0, trow)
         if i is toptions[tpage][tcursor]:
             if type(i) is list:
-                top = f"{chr(0)}{i[0].upper()}/{i[1].upper()}\n"
+                top = f"{glyphs.char('right')}{i[0].upper()}/{i[1].upper()}\n"
             else:
-                top = f"{chr(0)}{i}\n"
+                top = f"{glyphs.char('right')}{i}\n"
         else:
             if type(i) is list:
                 top = f" {i[0].upper()}/{i[1].upper()}\n"
             else:
                 top = f" {i}\n"
         lcd.putstr(top[:20])
+        if len(top) > 21 and i is toptions[tpage][tcursor]:
+            scroll.append(RowMarquee(lcd, top[:-1], trow))
         trow += 1
-    return
+    render.submit(glyphs)
+    for m in scroll: m.start()
+    return scroll
 
 # select a menu option using rotary encoder
 def menuSel(topts, ttitle=""):
@@ -88,24 +173,31 @@ def menuSel(topts, ttitle=""):
         trows = 3
     else: trows = 4
     tchunks = list(genChunks(topts, trows))
-    menuString(tchunks, ttitle=ttitle)
+    scroll = menuString(tchunks, ttitle=ttitle)
     r.set(min_val=0, max_val=len(topts)-1, value=0)
+    rbt.clear_events()
     val_old = r.value()
     while True:
+        # wait up to 20ms for the knob to turn, then check the button. The
+        # value is read below, the step events aren't needed
+        if r.wait(20): r.clear_events()
+        for m in scroll: m.poll()
         val_new = r.value()
-        btn = rbt.value()
+        btn = rbt.get_event()
         if val_old != val_new:
             val_old = val_new
             print('result =', val_new)
             page = int(val_new/trows)
             item = val_new-page*trows
-            menuString(tchunks, page, item, ttitle)
-        if btn:
+            scroll = menuString(tchunks, page, item, ttitle)
+        if btn == rbt.CLICK:
             print("Button = Pressed")
             selection = topts[val_new]
-            while rbt.value(): pass
             break
-        sleep_ms(50)
+        if btn == rbt.LONG and "(RETURN)" in topts:
+            print("Button = Long press")
+            selection = "(RETURN)"
+            break
     print("Selected: ", selection)
     return selection
 
@@ -147,16 +239,22 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
     lcd.clear()
     lcd.putstr(tmessage)
     tinput = ""
-    lcd.move_to(0,1)
-    lcd.putstr(str(chr(0)+tinput))
+    # the input row scrolls when it doesn't fit
+    scroll = [RowMarquee(lcd, glyphs.char("right")+tinput, 1)]
+    scroll[0].start()
     lcd.move_to(0,3)
     lcd.putstr("> ")
     r.set(min_val=0, max_val=len(characters)-1, value=0)
+    rbt.clear_events()
     val_old = r.value()
     lcd.putstr(characters[val_old])
     while True:
+        # wait up to 20ms for the knob to turn, then check the button. The
+        # value is read below, the step events aren't needed
+        if r.wait(20): r.clear_events()
+        for m in scroll: m.poll()
         val_new = r.value()
-        btn = rbt.value()
+        btn = rbt.get_event()
         if val_old != val_new:
             val_old = val_new
             lcd.move_to(2,3)
@@ -164,7 +262,11 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
             lcd.move_to(2,3)
             print('result =', characters[val_new])
             lcd.putstr(characters[val_new])
-        if btn:
+        if btn == rbt.LONG:
+            print("Button long press, input cancelled")
+            tinput = ""
+            break
+        if btn == rbt.CLICK:
             print("Button pressed!")
             selection = characters[val_new]
             if not selection == "(ENTER)":
@@ -177,15 +279,13 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
                         tinput += " "
                     else:
                         tinput += selection
-                lcd.move_to(0,1)
-                lcd.putstr(str(chr(0)+tinput))
+                scroll = [RowMarquee(lcd, glyphs.char("right")+tinput, 1)]
+                scroll[0].start()
                 lcd.move_to(0,3)
                 print("Input = "+selection)
                 lcd.putstr("> "+selection)
             else:
                 break
-            while rbt.value(): pass
-        sleep_ms(50)
     return tinput
 
 def connect():
@@ -230,9 +330,7 @@ def connect():
                 sleep(2.5)
                 while not wlan.isconnected(): pass
                 print(f"Connected to {i} network!")
-                lcd.clear()
-                lcd.putstr(f"Connected to {i} network!")
-                sleep(1)
+                showMessage(f"Connected to {i} network!", 1)
                 return True
         else:
             print("Networks not recognized!\n")
@@ -241,6 +339,8 @@ def connect():
                 Id = menuSel(ap, "Select network:")
                 print("Password!")
                 pwd = userIn("Insert password:")
+                # a long press (or no password) goes back to the networks
+                if not len(pwd): continue
                 lcd.clear()
                 lcd.putstr("Connecting...")
                 wlan.connect(Id, pwd)
@@ -251,9 +351,7 @@ def connect():
                     sleep(1)
                 if wlan.isconnected():
                     print(f"Connected to {Id} network!")
-                    lcd.clear()
-                    lcd.putstr(f"Connected to {Id} network!")
-                    sleep(1)
+                    showMessage(f"Connected to {Id} network!", 1)
                     net[Id] = pwd
                     with open("networks.json", "w") as f:
                         f.write(json.dumps(net))
@@ -264,9 +362,7 @@ def connect():
                 else:
                     wlan.active(False)
                     print("Something happened. Try again!")
-                    lcd.clear()
-                    lcd.putstr("Something happened. Try again!")
-                    sleep(1)
+                    showMessage("Something happened. Try again!", 1)
                     wlan.active(True)
     else:
         print("Connected!")
@@ -275,19 +371,97 @@ def connect():
         return True
     return
 
+def getJson(url, paths, weight=1, low=False):
+    # request url and return (status code, {path: value} or None) with the
+    # values at paths (see json_scan.py), read from the response as it arrives.
+    # Paths with [*] get the list of every match. Prints the bytes received
+    # and the heap allocated by the request. The request counts `weight`
+    # against the host's rate limit and raises Deferred if it has to wait
+    host = host_of(url)
+    limiter.acquire(host, weight, low)
+    gc.collect()
+    heap = gc.mem_alloc()
+    response = http.get(url)
+    try:
+        status = response.status_code
+        limiter.update(host, status, response.headers)
+        data = None
+        size = 0
+        if status == 200:
+            scanner = JsonScanner(response.raw)
+            if any("[*]" in path for path in paths):
+                data = {}
+                for path, value in scanner.scan(paths):
+                    data.setdefault(path, []).append(value)
+            else:
+                data = scanner.extract(paths)
+            size = scanner.nbytes
+            del scanner
+        print(f"({status}) {size} bytes, {gc.mem_alloc()-heap} bytes of heap")
+    finally:
+        response.close()
+    del host,heap,size,response
+    return status, data
+
+def fetchJson(url, paths, weight=1, low=False):
+    # getJson() for the retry policy: rate limits and server errors raise so
+    # they're tried again, other status codes are returned
+    status, data = getJson(url, paths, weight, low)
+    if status == 418 or status == 429 or status >= 500:
+        raise OSError(f"HTTP {status}")
+    return status, data
+
+def fetchPrice(url, path):
+    status, data = fetchJson(url, [path])
+    return data.get(path) if status == 200 else None
+
+def requestPrice(pair, option):
+    # request the price of a coin pair, a price received less than cacheTtl
+    # ago is used again. When the request fails the last price received is
+    # returned, None if there is none
+    key = f"{pair[0]}.{pair[1]}"
+    price = cache.get(key)
+    if price is not None:
+        return price
+    url = f"https://api.coingecko.com/api/v3/simple/price?ids={pair[0]}&vs_currencies={pair[1]}"
+    try:
+        price = retry.call(host_of(url), fetchPrice, (url, key))
+        if price is not None: cache.put(key, price)
+    except Exception as e:
+        print(f"An error happened while requesting price! ({option}) ({e})")
+        price = cache.last(key)
+    del url,key
+    return price
+
+def priceString(key, vs):
+    # the price line of a pair, an asterisk marks a last known price older
+    # than any refresh should have left it
+    price = cache.last(key)
+    if price is None:
+        return "--"
+    age = cache.age_ms(key)
+    return f"{price} {vs.upper()}{'*' if age > refreshMax else ''}"
+
 def getVsCoins():
     print("getVsCoins()")
     lcd.clear()
     lcd.putstr("Getting coin list...")
     # get vs coin list from api
     try:
-        vs_coin_list = rq.get("https://api.coingecko.com/api/v3/simple/supported_vs_currencies").json()
+        url = "https://api.coingecko.com/api/v3/simple/supported_vs_currencies"
+        # the coin list can wait while prices are using the rate limit
+        vs_coin_list = retry.call(host_of(url), fetchJson, (url, ["[*]"], 1, True))[1]["[*]"]
         with open("coins.json", "w") as f:
             f.write(json.dumps(vs_coin_list))
             print("Saved vs coins list!")
         lcd.clear()
         lcd.putstr("Coin list saved!")
-        del vs_coin_list,f
+        del vs_coin_list,f,url
+        sleep(1)
+    except Deferred:
+        print("Api busy, vs coins list not updated!")
+        lcd.clear()
+        lcd.putstr("Api busy, try later!")
         sleep(1)
     except:
         print("Something happened while getting vs coins list!")
@@ -390,8 +564,14 @@ def addPair():
             vs_coin = menuSel(vs_coin_list, "Select vs coin:")
             lcd.clear()
             lcd.putstr("Looking for pair...")
-            price = rq.get(f"https://api.coingecko.com/api/v3/simple/price?ids={sel_coin}&vs_currencies={vs_coin}")
-            if price.status_code == 200 and len(price.json()):
+            url = f"https://api.coingecko.com/api/v3/simple/price?ids={sel_coin}&vs_currencies={vs_coin}"
+            try:
+                status, price = retry.call(host_of(url), fetchJson, (url, [f"{sel_coin}.{vs_coin}"]))
+            except Exception as e:
+                print(f"An error happened while looking for pair! ({e})")
+                status, price = 0, None
+            del url
+            if status == 200 and len(price):
                 pair = [sel_coin,vs_coin]
                 if not pair in pairs:
                     pairs.append(pair)
@@ -405,12 +585,14 @@ def addPair():
                     print("Pair exists!")
                     lcd.clear()
                     lcd.putstr("Pair exists!")
-                del sel_coin,vs_coin,price,pair
+                del sel_coin,vs_coin,price,pair,status
                 break
             else:
-                print("Pair not found!")
+                message = "Pair not found!" if status else "Request failed!"
+                print(message)
                 lcd.clear()
-                lcd.putstr("Pair not found!")
+                lcd.putstr(message)
+                del message
                 sleep(1)
                 if menuSel(["Yes","No"], "Try again?") == "No": break
                 else: continue
@@ -447,6 +629,9 @@ def removePair():
                         f.write(json.dumps(pairs))
                         print("Updated: "+str(pairs))
                     del f
+                    # its price isn't needed anymore
+                    cache.forget(f"{sel_pair[0]}.{sel_pair[1]}")
+                    refresh.forget(f"{sel_pair[0]}.{sel_pair[1]}")
                     lcd.clear()
                     lcd.putstr("Succesfully removed!")
                     del sel_pair,pair_index
@@ -483,36 +668,30 @@ def trackSingle(pair=False):
         # save state
         saveState(option="Track single", pair=pair)
         # track coins price
-        timer = 0
+        key = f"{pair[0]}.{pair[1]}"
         lcd.clear()
         lcd.putstr(f"{pair[0].upper()}:".center(20))
         lcd.move_to(0,2)
-        lcd.putstr("Tracking...".center(20))
+        # start with the last known price
+        lcd.putstr((priceString(key, pair[1]) if cache.last(key) is not None else "Tracking...").center(20))
         r.set(min_val=0, max_val=50, value=0)
         val_old = r.value()
         #while True:
         while wlan.isconnected():
+            # wait up to 50ms for the knob to turn
+            moved = r.wait(50)
             val_new = r.value()
             # if rotary encoder is moved call the main menu
-            if val_old != val_new:
+            if moved or val_old != val_new:
                 mainMenu()
                 trackSingle(pair)
                 return
-            if timer >= 5000:
-                timer = 0
-                # show each saved coin pair current price
-                while True:
-                    try:
-                        price = rq.get(f"https://api.coingecko.com/api/v3/simple/price?ids={pair[0]}&vs_currencies={pair[1]}").json()
-                        break
-                    except:
-                        print("An error happende while requesting price! (Single)")
-                        raise Exception("Error requesting single price!")
-                print(f"{pair[0].upper()}: {price[pair[0]][pair[1]]} {pair[1].upper()}")
+            # show the pair current price when its refresh is due
+            if refresh.due(key):
+                refresh.observe(key, requestPrice(pair, "Single"))
+                print(f"{pair[0].upper()}: {priceString(key, pair[1])}")
                 lcd.move_to(0,2)
-                lcd.putstr(f"{price[pair[0]][pair[1]]} {pair[1].upper()}".center(20))
-            sleep_ms(50)
-            timer += 50
+                lcd.putstr(priceString(key, pair[1]).center(20))
         else:
             print("Not connected!")
             lcd.clear()
@@ -537,38 +716,42 @@ def trackMultiple():
         trackMultiple()
     # save state
     saveState(option="Track multiple")
-    # track coins price
-    timer = 0
+    # track coins price, one pair is shown at a time for 5 seconds and its
+    # price requested when its refresh is due
+    timer = 5000
     index = 0
+    redraw = False
     r.set(min_val=0, max_val=50, value=0)
     val_old = r.value()
     #while True:
     while wlan.isconnected():
+        # wait up to 50ms for the knob to turn
+        moved = r.wait(50)
         val_new = r.value()
         # if rotary encoder is moved call the main menu
-        if val_old != val_new:
+        if moved or val_old != val_new:
             mainMenu()
             trackMultiple()
             return
+        # show each saved coin pair in turn
         if timer >= 5000:
             timer = 0
-            # show each saved coin pair current price
             p = pairs[index]
-            while True:
-                try:
-                    price = rq.get(f"https://api.coingecko.com/api/v3/simple/price?ids={p[0]}&vs_currencies={p[1]}").json()
-                    break
-                except:
-                    print("An error happened while requesting price! (Multiple)")
-                    raise Exception("Error requesting multiple price!")
-            print(f"{p[0].upper()}: {price[p[0]][p[1]]} {p[1].upper()}")
+            key = f"{p[0]}.{p[1]}"
             lcd.clear()
             lcd.putstr(f"{p[0].upper()}:".center(20))
-            lcd.move_to(0,2)
-            lcd.putstr(f"{price[p[0]][p[1]]} {p[1].upper()}".center(20))
+            redraw = True
             if index == len(pairs)-1: index = 0
             else: index += 1
-        sleep_ms(50)
+        if refresh.due(key):
+            refresh.observe(key, requestPrice(p, "Multiple"))
+            redraw = True
+        # show the pair current (or last known) price
+        if redraw:
+            print(f"{p[0].upper()}: {priceString(key, p[1])}")
+            lcd.move_to(0,2)
+            lcd.putstr(priceString(key, p[1]).center(20))
+            redraw = False
         timer += 50
     else:
         print("Not connected!")
@@ -651,8 +834,7 @@ while True:
                 mainMenu()
         else:
             print("Couldn't connect to the internet!")
-            lcd.clear()
-            lcd.putstr("Couldn't connect to the internet!")
+            showMessage("Couldn't connect to the internet!", 1)
             connect()
     except Exception as e:
         print(f"Unknown error! ({e.errno}) Please reset the system.")
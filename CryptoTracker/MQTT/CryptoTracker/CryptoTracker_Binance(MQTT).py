@@ -1,10 +1,16 @@
 import errno,ubinascii,json,network,urequests as rq
-from machine import unique_id,Pin,SoftI2C
+from machine import unique_id,Timer
 from mqtt_modded import MQTTClient
 from time import sleep,sleep_ms
 from rotary_irq_esp import RotaryIRQ
+from button_irq_esp import ButtonIRQ
 from lcd_api import LcdApi
 from i2c_lcd import I2cLcd
+from lcd_setup import open_lcd
+from lcd_glyphs import GlyphManager
+from lcd_render import RenderQueue
+from lcd_marquee import Marquee, RowMarquee
+from price_cache import PriceCache
 
 # create file for broker url if not exists
 try:
@@ -25,6 +31,8 @@ clientId = ubinascii.hexlify(unique_id())
 requestTopic = "/cryptotracker/binance/price/request"
 dataTopic = "/cryptotracker/binance/price/data/"+clientId.decode()
 validationKey = "symbol"
+# prices younger than this (ms) are used again instead of requested
+cacheTtl = 5000
 
 # api base url
 apiBase = "https://api.binance.com/api/v3"
@@ -33,21 +41,37 @@ apiBase = "https://api.binance.com/api/v3"
 I2C_ADDR     = 0x27
 I2C_NUM_ROWS = 4
 I2C_NUM_COLS = 20
+# I2C Lcd bus configuration, "backend" is "soft" (SoftI2C) or "hard" (hardware
+# I2C peripheral) and "freq" can be "auto" to use the fastest reliable speed
+lcdConfig = {"backend":"soft", "bus":0, "sda":21, "scl":22, "freq":400000}
+try:
+    with open("lcd.json", "r") as f:
+        lcdConfig.update(json.loads(f.read()))
+        print("Lcd config: "+str(lcdConfig))
+except OSError:
+    with open("lcd.json", "w") as f:
+        f.write(json.dumps(lcdConfig))
+        print("lcd.json created")
 # I2C Lcd initialization
-i2c = SoftI2C(sda=Pin(21), scl=Pin(22), freq=400000)
-lcd = I2cLcd(i2c, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
-del I2C_ADDR,I2C_NUM_ROWS,I2C_NUM_COLS
+lcd, lcdFreq = open_lcd(lcdConfig, I2C_ADDR, I2C_NUM_ROWS, I2C_NUM_COLS)
+print(f"Lcd on {lcdConfig['backend']} I2C at {lcdFreq} Hz")
+del I2C_ADDR,I2C_NUM_ROWS,I2C_NUM_COLS,lcdConfig
 
 lcd.display_on()
 
-# create custom characters
+# create custom characters, uploaded to the lcd when first used
+glyphs = GlyphManager(lcd)
 # right arrow character
-lcd.custom_char(0, bytearray([0x10,0x18,0x1C,0x1E,0x1E,0x1C,0x18,0x10]))
-lcd.custom_char(1, bytearray([0x01,0x03,0x07,0x0F,0x0F,0x07,0x03,0x01]))
-lcd.custom_char(2, bytearray([0x04,0x0E,0x1F,0x04,0x04,0x04,0x04,0x04]))
-lcd.custom_char(3, bytearray([0x04,0x04,0x04,0x04,0x04,0x1F,0x0E,0x04]))
-lcd.custom_char(4, bytearray([0x00,0x01,0x01,0x01,0x01,0x01,0x01,0x00]))
-lcd.custom_char(5, bytearray([0x00,0x10,0x10,0x10,0x10,0x10,0x10,0x00]))
+glyphs.define("right", bytearray([0x10,0x18,0x1C,0x1E,0x1E,0x1C,0x18,0x10]))
+glyphs.define("left", bytearray([0x01,0x03,0x07,0x0F,0x0F,0x07,0x03,0x01]))
+glyphs.define("up", bytearray([0x04,0x0E,0x1F,0x04,0x04,0x04,0x04,0x04]))
+glyphs.define("down", bytearray([0x04,0x04,0x04,0x04,0x04,0x1F,0x0E,0x04]))
+glyphs.define("sepL", bytearray([0x00,0x01,0x01,0x01,0x01,0x01,0x01,0x00]))
+glyphs.define("sepR", bytearray([0x00,0x10,0x10,0x10,0x10,0x10,0x10,0x00]))
+
+# draw screens in the background so the main loop isn't held up by the lcd
+render = RenderQueue(lcd)
+render.start_timer(Timer(0))
 
 # display welcome message
 lcd.putstr("""\
@@ -61,19 +85,56 @@ sleep(0.5)
 lcd.backlight_on()
 sleep(1)
 
-# initialize rotary encoder instance
-clkPin = 15
-dtPin = 4
-r = RotaryIRQ(pin_num_clk=clkPin,
-              pin_num_dt=dtPin,
+# initialize rotary encoder instance, fast turns move up to ACCEL items per
+# detent in long lists
+ACCEL = 8
+# encoder pins, swapped by the "Reverse knob" option
+knobConfig = {"clk":15, "dt":4}
+try:
+    with open("knob.json", "r") as f:
+        knobConfig.update(json.loads(f.read()))
+        print("Knob config: "+str(knobConfig))
+except OSError:
+    with open("knob.json", "w") as f:
+        f.write(json.dumps(knobConfig))
+        print("knob.json created")
+r = RotaryIRQ(pin_num_clk=knobConfig["clk"],
+              pin_num_dt=knobConfig["dt"],
               min_val=0,
               max_val=0,
               reverse=False,
-              range_mode=RotaryIRQ.RANGE_WRAP)
-rbt = Pin(34, Pin.IN)
+              range_mode=RotaryIRQ.RANGE_WRAP,
+              accel=ACCEL)
+# encoder button, debounced in the background. Clicks are reported on release
+# since double clicks aren't used, a long press goes back
+rbt = ButtonIRQ(34, double_ms=0, timer=Timer(1))
 
 # initialize wlan connection
 wlan = network.WLAN(network.STA_IF); wlan.active(True)
+# every price received, shared by the tracking screens
+cache = PriceCache(cacheTtl)
+
+# show a message, scrolling a single line that doesn't fit in a row
+def showMessage(tmessage, tseconds):
+    print("showMessage()")
+    # messages of several lines wrap across the rows
+    if len(tmessage) <= lcd.num_columns or "\n" in tmessage:
+        lcd.clear()
+        lcd.putstr(tmessage)
+        sleep(tseconds)
+        return
+    # the whole text is scrolled past once, with the display shift on 2 line
+    # displays. On bigger ones a DDRAM line is shown by two rows, so the
+    # second row is rewritten instead
+    if lcd.num_lines > 2:
+        marquee = RowMarquee(lcd, tmessage, 1)
+    else:
+        marquee = Marquee(lcd, tmessage)
+    marquee.start(True)
+    marquee.run(max(int(tseconds*1000), marquee.scroll_ms()))
+    marquee.stop()
+    del marquee
+    return
 
 # slice a list in chunks of specific size
 def genChunks(tlist, titems):
@@ -88,27 +149,36 @@ def genChunks(tlist, titems):
 # create a menu string to display on the LCD
 def menuString(toptions, tpage=0, tcursor=0, ttitle=""):
     print("menuString()")
+    # draw the menu off-screen, the render queue sends what changed
+    glyphs.begin_frame()
     lcd.clear()
+    # the title and the selected option scroll when they don't fit in a row
+    scroll = []
     if len(ttitle):
         trow = 1
-        lcd.putstr(ttitle)
+        lcd.putstr(ttitle[:20])
+        if len(ttitle) > 20: scroll.append(RowMarquee(lcd, ttitle, 0))
     else: trow = 0
     tmenu = ""
     for i in toptions[tpage]:
         lcd.move_to(0, trow)
         if i is toptions[tpage][tcursor]:
             if type(i) is list:
-                top = f"{chr(0)}{i[0].upper()}/{i[1].upper()}\n"
+                top = f"{glyphs.char('right')}{i[0].upper()}/{i[1].upper()}\n"
             else:
-                top = f"{chr(0)}{i}\n"
+                top = f"{glyphs.char('right')}{i}\n"
         else:
             if type(i) is list:
                 top = f" {i[0].upper()}/{i[1].upper()}\n"
             else:
                 top = f" {i}\n"
         lcd.putstr(top[:20])
+        if len(top) > 21 and i is toptions[tpage][tcursor]:
+            scroll.append(RowMarquee(lcd, top[:-1], trow))
         trow += 1
-    return
+    render.submit(glyphs)
+    for m in scroll: m.start()
+    return scroll
 
 # select a menu option using rotary encoder
 def menuSel(topts, ttitle=""):
@@ -118,24 +188,31 @@ def menuSel(topts, ttitle=""):
         trows = 3
     else: trows = 4
     tchunks = list(genChunks(topts, trows))
-    menuString(tchunks, ttitle=ttitle)
+    scroll = menuString(tchunks, ttitle=ttitle)
     r.set(min_val=0, max_val=len(topts)-1, value=0)
+    rbt.clear_events()
     val_old = r.value()
     while True:
+        # wait up to 20ms for the knob to turn, then check the button. The
+        # value is read below, the step events aren't needed
+        if r.wait(20): r.clear_events()
+        for m in scroll: m.poll()
         val_new = r.value()
-        btn = rbt.value()
+        btn = rbt.get_event()
         if val_old != val_new:
             val_old = val_new
             print('result =', val_new)
             page = int(val_new/trows)
             item = val_new-page*trows
-            menuString(tchunks, page, item, ttitle)
-        if btn:
+            scroll = menuString(tchunks, page, item, ttitle)
+        if btn == rbt.CLICK:
             print("Button = Pressed")
             selection = topts[val_new]
-            while rbt.value(): pass
             break
-        sleep_ms(50)
+        if btn == rbt.LONG and "(RETURN)" in topts:
+            print("Button = Long press")
+            selection = "(RETURN)"
+            break
     print("Selected: ", selection)
     return selection
 
@@ -177,16 +254,22 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
     lcd.clear()
     lcd.putstr(tmessage)
     tinput = ""
-    lcd.move_to(0,1)
-    lcd.putstr(str(chr(0)+tinput))
+    # the input row scrolls when it doesn't fit
+    scroll = [RowMarquee(lcd, glyphs.char("right")+tinput, 1)]
+    scroll[0].start()
     lcd.move_to(0,3)
     lcd.putstr("> ")
     r.set(min_val=0, max_val=len(characters)-1, value=0)
+    rbt.clear_events()
     val_old = r.value()
     lcd.putstr(characters[val_old])
     while True:
+        # wait up to 20ms for the knob to turn, then check the button. The
+        # value is read below, the step events aren't needed
+        if r.wait(20): r.clear_events()
+        for m in scroll: m.poll()
         val_new = r.value()
-        btn = rbt.value()
+        btn = rbt.get_event()
         if val_old != val_new:
             val_old = val_new
             lcd.move_to(2,3)
@@ -194,7 +277,11 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
             lcd.move_to(2,3)
             print('result =', characters[val_new])
             lcd.putstr(characters[val_new])
-        if btn:
+        if btn == rbt.LONG:
+            print("Button long press, input cancelled")
+            tinput = ""
+            break
+        if btn == rbt.CLICK:
             print("Button pressed!")
             selection = characters[val_new]
             if not selection == "(ENTER)":
@@ -207,15 +294,13 @@ def userIn(tmessage="Input:", space=True, upperCase=True, lowerCase=True, number
                         tinput += " "
                     else:
                         tinput += selection
-                lcd.move_to(0,1)
-                lcd.putstr(str(chr(0)+tinput))
+                scroll = [RowMarquee(lcd, glyphs.char("right")+tinput, 1)]
+                scroll[0].start()
                 lcd.move_to(0,3)
                 print("Input = "+selection)
                 lcd.putstr("> "+selection)
             else:
                 break
-            while rbt.value(): pass
-        sleep_ms(50)
     return tinput
 
 def connectMQTT(clientId, mqttServer, subTopic, callback=None):
@@ -283,9 +368,7 @@ def connect():
                 sleep(2.5)
                 while not wlan.isconnected(): pass
                 print(f"Connected to {i} network!")
-                lcd.clear()
-                lcd.putstr(f"Connected to {i} network!")
-                sleep(1)
+                showMessage(f"Connected to {i} network!", 1)
                 break
         else:
             print("Networks not recognized!\n")
@@ -294,6 +377,8 @@ def connect():
                 Id = menuSel(ap, "Select network:")
                 print("Password!")
                 pwd = userIn("Insert password:")
+                # a long press (or no password) goes back to the networks
+                if not len(pwd): continue
                 lcd.clear()
                 lcd.putstr("Connecting...")
                 wlan.connect(Id, pwd)
@@ -304,9 +389,7 @@ def connect():
                     sleep(1)
                 if wlan.isconnected():
                     print(f"Connected to {Id} network!")
-                    lcd.clear()
-                    lcd.putstr(f"Connected to {Id} network!")
-                    sleep(1)
+                    showMessage(f"Connected to {Id} network!", 1)
                     net[Id] = pwd
                     with open("networks.json", "w") as f:
                         f.write(json.dumps(net))
@@ -317,9 +400,7 @@ def connect():
                 else:
                     wlan.active(False)
                     print("Something happened. Try again!")
-                    lcd.clear()
-                    lcd.putstr("Something happened. Try again!")
-                    sleep(1)
+                    showMessage("Something happened. Try again!", 1)
                     wlan.active(True)
     else:
         print("Connected!")
@@ -396,6 +477,8 @@ def addSymbol():
         baseAsset = userIn("Select base coin:", space=False, lowerCase=False, symbols="-_.")
         if not len(baseAsset) == 0:
             quoteAsset = userIn("Select quote coin:", space=False, lowerCase=False, symbols="-_.")
+            # a long press goes back to the base coin
+            if not len(quoteAsset): continue
             symbol = baseAsset+quoteAsset
             print(f"Requesting: {symbol}")
             lcd.clear()
@@ -472,27 +555,34 @@ def removeSymbol():
 def showPrice(data, symbolInfo):
     print("showPrice()")
     print(f"{symbolInfo['baseAsset']}: {float(data['lastPrice'])} {symbolInfo['quoteAsset']}, 24hr: {float(data['priceChangePercent'])}%, High: {float(data['highPrice'])}, Low: {float(data['lowPrice'])}")
+    # draw the price screen off-screen, the render queue sends what changed
+    glyphs.begin_frame()
     lcd.clear()
     lcd.putstr(f"{symbolInfo['baseAsset']}/{symbolInfo['quoteAsset']}".center(20))
     lcd.move_to(0,1)
-    lcd.putstr(f"{chr(0)} {float(data['lastPrice'])} {chr(1)}".center(20))
+    lcd.putstr(f"{glyphs.char('right')} {float(data['lastPrice'])} {glyphs.char('left')}".center(20))
     lcd.move_to(0,2)
-    lcd.putstr(f"{chr(2)}{float(data['highPrice'])}")
+    lcd.putstr(f"{glyphs.char('up')}{float(data['highPrice'])}")
     lcd.move_to(9,2)
-    lcd.putstr(chr(4)+chr(5))
+    lcd.putstr(glyphs.char("sepL")+glyphs.char("sepR"))
     lcd.move_to(11,2)
     lcd.putstr(f"24hr".center(9))
     lcd.move_to(0,3)
-    lcd.putstr(f"{chr(3)}{float(data['lowPrice'])}")
+    lcd.putstr(f"{glyphs.char('down')}{float(data['lowPrice'])}")
     lcd.move_to(9,3)
-    lcd.putstr(chr(4)+chr(5))
+    lcd.putstr(glyphs.char("sepL")+glyphs.char("sepR"))
     lcd.move_to(11,3)
     lcd.putstr(f"{round(float(data['priceChangePercent']),2)}%".center(9))
+    render.submit(glyphs)
     del data,symbolInfo
     return
 
 def requestPrice(client, symbol, option):
     print("requestPrice()")
+    # a price received less than cacheTtl ago is used again
+    data = cache.get(symbol)
+    if data is not None:
+        return data
     data = False
     # request symbol price to api by mqtt
     counter = 0
@@ -507,7 +597,8 @@ def requestPrice(client, symbol, option):
                 if validationKey in data.keys():
                     if data[validationKey] == symbol:
                         print("(SUCCESS)")
-                        break
+                        cache.put(symbol, data)
+                        return data
                     else:
                         print(f"(FAILED)(KEY CONTENT)")
                 else:
@@ -521,7 +612,8 @@ def requestPrice(client, symbol, option):
         print("Failed to request: "+symbol)
         sleep(2.5)
         counter += 1
-    return data
+    # fall back to the last price received
+    return cache.last(symbol) or False
 
 def trackSingle(symbol=False):
     print("trackSingle()")
@@ -547,15 +639,22 @@ def trackSingle(symbol=False):
         saveState(option="Track single", symbol=symbol)
         # track symbol price
         client = connectMQTT(clientId, brokerUrl, dataTopic)
-        timer = 0
-        lcd.clear()
-        lcd.putstr("Loading symbol...")
+        # the first request goes out at once, the last known price is shown
+        # until it comes back
+        timer = 5000
+        if cache.last(symbol):
+            showPrice(cache.last(symbol), symbolsInfo[symbol])
+        else:
+            lcd.clear()
+            lcd.putstr("Loading symbol...")
         r.set(min_val=0, max_val=50, value=0)
         val_old = r.value()
         while wlan.isconnected():
+            # wait up to 50ms for the knob to turn
+            moved = r.wait(50)
             val_new = r.value()
             # if rotary encoder is moved call the maiMenu
-            if val_old != val_new:
+            if moved or val_old != val_new:
                 # save default state to return to mainMenu
                 saveState()
                 break
@@ -564,7 +663,6 @@ def trackSingle(symbol=False):
                 # show selected symbol current price
                 data = requestPrice(client, symbol, "trackSingle")
                 if data: showPrice(data, symbolsInfo[symbol])
-            sleep_ms(50)
             timer += 50
         else:
             print("Not connected!")
@@ -598,25 +696,30 @@ def trackMultiple():
         return
     # track symbols price
     client = connectMQTT(clientId, brokerUrl, dataTopic)
-    timer = 0
+    timer = 5000
     index = 0
     r.set(min_val=0, max_val=50, value=0)
     val_old = r.value()
     while wlan.isconnected():
+        # wait up to 50ms for the knob to turn
+        moved = r.wait(50)
         val_new = r.value()
         # if rotary encoder is moved call mainMenu
-        if val_old != val_new:
+        if moved or val_old != val_new:
             # save default state to return to mainMenu
             saveState()
             break
         if timer >= 5000:
             timer = 0
-            # show each saved symbol current data
+            # show each saved symbol current data, the last known one until
+            # the request comes back
+            old = cache.last(symbols[index])
+            if old: showPrice(old, symbolsInfo[symbols[index]])
             data = requestPrice(client, symbols[index], "trackMultiple")
-            if data: showPrice(data, symbolsInfo[symbols[index]])
+            if data and data is not old: showPrice(data, symbolsInfo[symbols[index]])
+            del old
             if index == len(symbols)-1: index = 0
             else: index += 1
-        sleep_ms(50)
         timer += 50
     else:
         print("Not connected!")
@@ -679,13 +782,11 @@ def mainMenu():
                 else: break
         elif selection == "Reverse knob":
             print("Reverse knob")
-            global clkPin,dtPin,r
-            tclk = clkPin
-            tdt = dtPin
-            clkPin = tdt
-            dtPin = tclk
-            del tclk,tdt
-            r = RotaryIRQ(pin_num_clk=clkPin, pin_num_dt=dtPin, min_val=0, max_val=0, reverse=False, range_mode=RotaryIRQ.RANGE_WRAP)
+            # swap the pins of the running encoder and remember it
+            r.swap_pins()
+            knobConfig["clk"], knobConfig["dt"] = r.pins()
+            with open("knob.json", "w") as f:
+                f.write(json.dumps(knobConfig))
         else:
             break
     return
@@ -708,8 +809,7 @@ while True:
                 mainMenu()
         else:
             print("Couldn't connect to the internet!")
-            lcd.clear()
-            lcd.putstr("Couldn't connect to the internet!")
+            showMessage("Couldn't connect to the internet!", 1)
             connect()
     #try: pass
     except Exception as e:
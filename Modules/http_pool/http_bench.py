@@ -0,0 +1,117 @@
+# Host side latency benchmark of HttpPool against a local stand-in server.
+#
+# The stand-in serves Binance-like ticker JSON over plain HTTP/1.1 on
+# localhost, with Content-Length (/ticker) or chunked (/chunked) bodies. Every
+# new connection waits handshake_ms before it is served, standing in for the
+# TLS handshake an ESP32 does with the real API, and connections idle for more
+# than idle_s are dropped without notice, like the real servers do.
+#
+# Runs the same requests with a new connection each time (what urequests
+# does), with the keep-alive pool, and with the pool while the server drops
+# idle connections, and prints the latency per request.
+#
+# Run it with CPython from this directory:
+#
+#   python3 http_bench.py [requests] [handshake_ms]
+
+import json
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+from http_pool import HttpPool
+
+TICKER = {"symbol": "BTCUSDT", "openPrice": "26800.00", "highPrice": "27250.00",
+          "lowPrice": "26500.00", "lastPrice": "27000.10", "volume": "12345.678",
+          "quoteVolume": "333333333.33", "openTime": 1690000000000,
+          "closeTime": 1690086400000, "firstId": 1, "lastId": 99999, "count": 99999}
+
+
+class StandIn(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, don't let Nagle hold the body
+    disable_nagle_algorithm = True
+    handshake_ms = 0
+
+    def setup(self):
+        # Set by serve(), dropping connections idle for longer
+        self.timeout = self.server.idle_s
+        BaseHTTPRequestHandler.setup(self)
+        time.sleep(self.handshake_ms / 1000)
+
+    def do_GET(self):
+        body = json.dumps(TICKER).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if self.path.startswith("/chunked"):
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(body), 64):
+                chunk = body[start:start + 64]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(handshake_ms, idle_s=None):
+    # Starts the stand-in on a free port, returns the server
+    StandIn.handshake_ms = handshake_ms
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StandIn)
+    server.daemon_threads = True
+    server.idle_s = idle_s
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(url, requests, keep_alive, pause_s=0.0):
+    # Sends the requests, returns (ms per request, pool)
+    pool = HttpPool(keep_alive=keep_alive)
+    total = 0
+    for i in range(requests):
+        if pause_s:
+            time.sleep(pause_s)
+        start = time.perf_counter()
+        response = pool.get(url)
+        if response.json() != TICKER:
+            raise AssertionError("unexpected response")
+        response.close()
+        total += time.perf_counter() - start
+    pool.close()
+    return total * 1000 / requests, pool
+
+
+def run(requests=20, handshake_ms=200):
+    # Measures every mode and prints a table. Returns {mode: ms per request}
+    results = {}
+    print("{} requests, {} ms per new connection".format(requests, handshake_ms))
+    print("{:<28}{:>8}{:>10}{:>8}{:>9}".format(
+        "mode", "ms/req", "connects", "reuses", "retries"))
+    modes = (
+        ("new connection per request", False, "/ticker", None, 0.0),
+        ("keep-alive", True, "/ticker", None, 0.0),
+        ("keep-alive, chunked", True, "/chunked", None, 0.0),
+        ("keep-alive, server idles out", True, "/ticker", 0.05, 0.1),
+    )
+    for name, keep_alive, path, idle_s, pause_s in modes:
+        server = serve(handshake_ms, idle_s)
+        url = "http://127.0.0.1:{}{}".format(server.server_address[1], path)
+        ms, pool = measure(url, requests, keep_alive, pause_s)
+        server.shutdown()
+        server.server_close()
+        results[name] = ms
+        print("{:<28}{:>8.1f}{:>10}{:>8}{:>9}".format(
+            name, ms, pool.connects, pool.reuses, pool.retries))
+    return results
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
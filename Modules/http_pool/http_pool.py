@@ -0,0 +1,270 @@
+# Minimal HTTP/1.1 client that keeps one keep-alive connection per host.
+#
+# urequests opens a socket and does a TLS handshake for every request, which
+# is most of the time a refresh takes on the ESP32. HttpPool keeps the
+# connection to each (scheme, host, port) open between requests and reuses
+# it. When a reused connection turns out to be stale (the server closed it
+# while idle) the request is sent again on a new one, so callers don't see
+# it.
+#
+# Responses look like urequests ones (status_code, headers, raw, content,
+# text, json(), close()) so the trackers can swap one for the other. The body
+# has to be read or closed before the next request to the same host:
+# close() reads what's left of it so the connection can be reused.
+#
+# Typical use:
+#
+#   http = HttpPool()
+#   response = http.get("https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT")
+#   data = response.json()
+#   response.close()
+
+import socket
+try:
+    import ssl
+except ImportError:
+    import ussl as ssl
+
+
+def _split_url(url):
+    # Returns (scheme, host, port, path)
+    scheme, rest = url.split("://", 1)
+    if "/" in rest:
+        host, path = rest.split("/", 1)
+        path = "/" + path
+    else:
+        host, path = rest, "/"
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    else:
+        port = 443 if scheme == "https" else 80
+    return scheme, host, port, path
+
+
+class _Connection:
+
+    def __init__(self, scheme, host, port, timeout):
+        self.host = host
+        self.sock = None
+        addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(addr)
+            if scheme == "https":
+                if hasattr(ssl, "create_default_context"):
+                    sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+                else:
+                    sock = ssl.wrap_socket(sock, server_hostname=host)
+        except:
+            sock.close()
+            raise
+        self.sock = sock
+        # CPython sockets need a file object for readline(), MicroPython ones
+        # are streams already
+        self.stream = sock.makefile("rwb") if hasattr(sock, "makefile") else sock
+        # Number of requests sent on this connection
+        self.requests = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        if hasattr(self.stream, "flush"):
+            self.stream.flush()
+
+    def close(self):
+        if self.sock is None:
+            return
+        if self.stream is not self.sock:
+            self.stream.close()
+        self.sock.close()
+        self.sock = None
+
+
+class _Body:
+
+    # Reader of a response body, limited by Content-Length, decoding chunked
+    # transfer encoding, or up to the end of the connection
+
+    def __init__(self, stream, length=None, chunked=False):
+        self.stream = stream
+        self.left = length
+        self.chunked = chunked
+        self.done = length == 0
+        if chunked:
+            self.left = 0
+
+    def read(self, size=-1):
+        if self.done:
+            return b""
+        if self.chunked and self.left == 0:
+            self._next_chunk()
+            if self.done:
+                return b""
+        if self.left is None:
+            data = self.stream.read(size if size >= 0 else 4096)
+            if not data:
+                self.done = True
+            return data
+        if size < 0 or size > self.left:
+            size = self.left
+        data = self.stream.read(size)
+        if not data:
+            raise OSError("connection closed in the middle of a response")
+        self.left -= len(data)
+        if self.left == 0:
+            if self.chunked:
+                self.stream.readline()
+            else:
+                self.done = True
+        return data
+
+    def _next_chunk(self):
+        line = self.stream.readline()
+        self.left = int(line.split(b";", 1)[0].strip() or b"0", 16)
+        if self.left == 0:
+            # Trailer headers up to the blank line
+            while self.stream.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            self.done = True
+
+    def drain(self):
+        while self.read(512):
+            pass
+
+
+class Response:
+
+    def __init__(self, pool, conn, status_code, reason, headers, body):
+        self.pool = pool
+        self.conn = conn
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.raw = body
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            parts = []
+            while True:
+                data = self.raw.read(512)
+                if not data:
+                    break
+                parts.append(data)
+            self._content = b"".join(parts)
+            self.close()
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        import json
+        return json.loads(self.content)
+
+    def close(self):
+        # Reads what's left of the body and gives the connection back to the
+        # pool, or closes it if it can't be reused
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        reuse = (self.raw.left is not None and
+                 self.headers.get("connection", "").lower() != "close")
+        if reuse:
+            try:
+                self.raw.drain()
+            except (OSError, ValueError):
+                reuse = False
+        self.pool._release(conn, reuse)
+
+
+class HttpPool:
+
+    def __init__(self, timeout=10, keep_alive=True, headers=None):
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.headers = headers or {}
+        # Idle connections by (scheme, host, port)
+        self.idle = {}
+        # Connections opened, requests sent on a reused connection, and
+        # requests sent again because the reused connection was stale
+        self.connects = 0
+        self.reuses = 0
+        self.retries = 0
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers)
+
+    def request(self, method, url, headers=None):
+        scheme, host, port, path = _split_url(url)
+        key = (scheme, host, port)
+        lines = ["{} {} HTTP/1.1".format(method, path), "Host: " + host,
+                 "Connection: " + ("keep-alive" if self.keep_alive else "close")]
+        for name, value in self.headers.items():
+            lines.append("{}: {}".format(name, value))
+        if headers:
+            for name, value in headers.items():
+                lines.append("{}: {}".format(name, value))
+        data = ("\r\n".join(lines) + "\r\n\r\n").encode()
+        conn = self.idle.pop(key, None)
+        if conn is not None:
+            try:
+                response = self._send(conn, key, data)
+                self.reuses += 1
+                return response
+            except OSError:
+                # The server dropped the idle connection, try a new one
+                conn.close()
+                self.retries += 1
+        conn = _Connection(scheme, host, port, self.timeout)
+        self.connects += 1
+        try:
+            return self._send(conn, key, data)
+        except:
+            conn.close()
+            raise
+
+    def _send(self, conn, key, data):
+        conn.write(data)
+        conn.requests += 1
+        line = conn.stream.readline()
+        if not line:
+            raise OSError("connection closed")
+        parts = line.split(None, 2)
+        status = int(parts[1])
+        reason = parts[2].strip().decode() if len(parts) > 2 else ""
+        headers = {}
+        while True:
+            line = conn.stream.readline()
+            if not line or line == b"\r\n" or line == b"\n":
+                break
+            name, value = (line.decode().split(":", 1) + [""])[:2]
+            headers[name.strip().lower()] = value.strip()
+        conn.key = key
+        if status == 204 or status == 304:
+            body = _Body(conn.stream, 0)
+        elif "chunked" in headers.get("transfer-encoding", ""):
+            body = _Body(conn.stream, chunked=True)
+        elif "content-length" in headers:
+            body = _Body(conn.stream, int(headers["content-length"]))
+        else:
+            body = _Body(conn.stream)
+        return Response(self, conn, status, reason, headers, body)
+
+    def _release(self, conn, reuse):
+        if reuse and self.keep_alive:
+            old = self.idle.get(conn.key)
+            if old is not None and old is not conn:
+                old.close()
+            self.idle[conn.key] = conn
+        else:
+            conn.close()
+
+    def close(self):
+        # Closes every idle connection
+        for conn in self.idle.values():
+            conn.close()
+        self.idle = {}
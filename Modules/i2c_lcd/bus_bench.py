@@ -0,0 +1,68 @@
+# Host side throughput benchmark of the I2C backends used for the LCD.
+#
+# For each backend ("soft" SoftI2C and "hard" I2C peripheral, modeled as
+# described in lcd_emulator.py) it probes the fastest reliable SCL frequency
+# with lcd_setup.probe_freq(), then measures raw write throughput and the
+# modeled time of showPrice() frames on an emulated LCD.
+#
+# Run it with CPython from this directory:
+#
+#   python3 bus_bench.py [frames] [pcf8574_max_freq]
+
+import sys
+
+import lcd_emulator
+from lcd_emulator import EmulatedLcd, HD44780, clock
+from lcd_setup import make_i2c, probe_freq
+from render_bench import draw_price
+from i2c_lcd import GC_APP
+
+I2C_ADDR = 0x27
+BACKENDS = ("soft", "hard")
+
+
+def throughput(i2c, nbytes=160, count=64):
+    # Returns the modeled write throughput in kbyte/s using nbytes writes
+    buf = bytearray(nbytes)
+    start = clock.us
+    for i in range(count):
+        i2c.writeto(I2C_ADDR, buf)
+    return nbytes * count * 1000 / (clock.us - start)
+
+
+def frame_ms(i2c, frames, framed, max_freq):
+    # Returns the modeled time per showPrice() frame
+    lcd = EmulatedLcd(i2c=i2c, i2c_addr=I2C_ADDR, max_freq=max_freq,
+                      gc_policy=GC_APP)
+    start = clock.us
+    for tick in range(frames):
+        draw_price(lcd, tick, framed)
+    if not lcd.in_sync():
+        raise AssertionError("emulated display out of sync")
+    return (clock.us - start) / frames / 1000
+
+
+def run(frames=50, max_freq=1000000):
+    # Measures every backend and prints a table. Returns
+    # {backend: (freq, kbyte/s, full redraw ms, framed ms)}
+    results = {}
+    print("PCF8574 acknowledges up to {} kHz".format(max_freq // 1000))
+    print("{:<8}{:>10}{:>10}{:>14}{:>12}".format(
+        "backend", "SCL kHz", "kbyte/s", "redraw ms", "framed ms"))
+    for backend in BACKENDS:
+        lcd_emulator.devices.clear()
+        lcd_emulator.devices[I2C_ADDR] = HD44780(max_freq=max_freq)
+        i2c, freq = probe_freq(lambda f: make_i2c(backend, freq=f), I2C_ADDR)
+        if i2c is None:
+            print("{:<8}{:>10}".format(backend, "no ack"))
+            continue
+        result = (freq, throughput(i2c), frame_ms(i2c, frames, False, max_freq),
+                  frame_ms(i2c, frames, True, max_freq))
+        results[backend] = result
+        print("{:<8}{:>10}{:>10.1f}{:>14.2f}{:>12.2f}".format(
+            backend, freq // 1000, *result[1:]))
+    return results
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
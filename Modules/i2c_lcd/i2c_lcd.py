@@ -2,7 +2,6 @@ import utime
 import gc
 
 from lcd_api import LcdApi
-from machine import I2C
 
 # PCF8574 pin definitions
 MASK_RS = 0x01       # P0
@@ -12,14 +11,43 @@ MASK_E  = 0x04       # P2
 SHIFT_BACKLIGHT = 3  # P3
 SHIFT_DATA      = 4  # P4-P7
 
+# Garbage collection policies
+GC_APP   = 0  # Never collect, the application takes care of it
+GC_FRAME = 1  # Collect once per committed frame
+GC_WRITE = 2  # Collect after every write (original driver behaviour)
+
+# Longest time the LCD can be busy executing a command, in usec. Also guards
+# against ticks_us() wrapping around while nothing is sent for a long time.
+MAX_BUSY_US = 20000
+
 class I2cLcd(LcdApi):
     
     #Implements a HD44780 character LCD connected via PCF8574 on I2C
 
-    def __init__(self, i2c, i2c_addr, num_lines, num_columns):
+    def __init__(self, i2c, i2c_addr, num_lines, num_columns, batched=True,
+                 gc_policy=GC_FRAME):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
+        self.gc_policy = gc_policy
+        # Number of I2C transactions and bytes sent, see reset_stats()
+        self.i2c_writes = 0
+        self.i2c_bytes = 0
+        # Buffer used to pack the nibbles of several bytes into a single I2C
+        # transaction. When batched is False every nibble strobe is sent on
+        # its own, like the original driver did.
+        self.batched = batched
+        self.batch_buf = bytearray(8 * min(num_columns, 40))
+        self.batch_view = memoryview(self.batch_buf)
+        self.batch_len = 0
+        self.batch_depth = 0
+        # Buffer for single byte writes, so no bytes objects are allocated
+        self.byte_buf = bytearray(1)
+        # Deadline until which the LCD is executing a slow command. Bus
+        # operations only wait for it if they come before it has passed.
+        self.busy = False
+        self.busy_until = 0
+        self.wait_us = 0
+        self.i2c_write_byte(0)
         utime.sleep_ms(20)   # Allow LCD time to powerup
         # Send reset 3 times
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
@@ -38,49 +66,144 @@ class I2cLcd(LcdApi):
         self.hal_write_command(cmd)
         gc.collect()
 
+    def i2c_write(self, buf):
+        # Sends buf to the PCF8574 in a single I2C transaction
+        self.hal_wait_ready()
+        self.i2c.writeto(self.i2c_addr, buf)
+        self.i2c_writes += 1
+        self.i2c_bytes += len(buf)
+
+    def i2c_write_byte(self, byte):
+        # Sends a single byte to the PCF8574 without allocating
+        self.byte_buf[0] = byte
+        self.i2c_write(self.byte_buf)
+
+    def reset_stats(self):
+        # Resets the I2C transaction, byte and waited time counters
+        self.i2c_writes = 0
+        self.i2c_bytes = 0
+        self.wait_us = 0
+
+    def hal_busy_for(self, usecs):
+        # Records that the LCD won't accept anything for the next usecs
+        deadline = utime.ticks_add(utime.ticks_us(), usecs)
+        if not self.busy or utime.ticks_diff(deadline, self.busy_until) > 0:
+            self.busy_until = deadline
+        self.busy = True
+
+    def hal_wait_ready(self):
+        # Waits for whatever is left of the busy time, if anything
+        if not self.busy:
+            return
+        remaining = utime.ticks_diff(self.busy_until, utime.ticks_us())
+        if 0 < remaining <= MAX_BUSY_US:
+            self.wait_us += remaining
+            utime.sleep_us(remaining)
+        self.busy = False
+
+    def ready(self):
+        # Returns True if the LCD can be written to without waiting
+        if not self.busy:
+            return True
+        remaining = utime.ticks_diff(self.busy_until, utime.ticks_us())
+        return not 0 < remaining <= MAX_BUSY_US
+
+    def hal_sleep_us(self, usecs):
+        # Execution delays of the LCD don't block, they only hold back the
+        # next bus operation
+        self.hal_busy_for(usecs)
+
+    def hal_batch_begin(self):
+        # Starts packing writes into the batch buffer instead of sending them.
+        # At 100-400 kHz each PCF8574 byte takes longer on the bus than the
+        # 37 usec the LCD needs to execute a write, so no delays are needed
+        # between the packed bytes.
+        if self.batched:
+            self.batch_depth += 1
+
+    def hal_batch_end(self):
+        # Sends whatever has been packed once the outermost batch ends
+        if self.batch_depth:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self.hal_batch_flush()
+
+    def hal_batch_flush(self):
+        # Sends the packed bytes with a single I2C transaction
+        if self.batch_len:
+            self.i2c_write(self.batch_view[:self.batch_len])
+            self.batch_len = 0
+
     def hal_write_init_nibble(self, nibble):
         # Writes an initialization nibble to the LCD.
         # This particular function is only used during initialization.
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        self.i2c_write_byte(byte | MASK_E)
+        self.i2c_write_byte(byte)
         
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on
-        self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
-        gc.collect()
+        self.drawing += 1
+        self.hal_batch_flush()
+        self.i2c_write_byte(1 << SHIFT_BACKLIGHT)
+        self.drawing -= 1
+        self.hal_gc(GC_WRITE)
         
     def hal_backlight_off(self):
         #Allows the hal layer to turn the backlight off
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
-        gc.collect()
+        self.drawing += 1
+        self.hal_batch_flush()
+        self.i2c_write_byte(0)
+        self.drawing -= 1
+        self.hal_gc(GC_WRITE)
         
     def hal_write_command(self, cmd):
         # Write a command to the LCD. Data is latched on the falling edge of E.
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        # drawing is raised for every write, so a RenderQueue step scheduled
+        # from a timer can't send its cells between the two nibbles.
+        self.drawing += 1
+        self.hal_write_byte(self.backlight << SHIFT_BACKLIGHT, cmd)
         if cmd <= 3:
-            # The home and clear commands require a worst case delay of 4.1 msec
-            utime.sleep_ms(5)
-        gc.collect()
+            # The home and clear commands require a worst case delay of 4.1 msec,
+            # which the next bus operation waits for if it comes too early
+            self.hal_batch_flush()
+            self.hal_busy_for(5000)
+        self.drawing -= 1
+        self.hal_gc(GC_WRITE)
 
     def hal_write_data(self, data):
         # Write data to the LCD. Data is latched on the falling edge of E.
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                ((data & 0x0f) << SHIFT_DATA))      
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        self.drawing += 1
+        self.hal_write_byte(MASK_RS | (self.backlight << SHIFT_BACKLIGHT), data)
+        self.drawing -= 1
+        self.hal_gc(GC_WRITE)
+
+    def hal_frame_end(self):
+        # Called by commit() once a frame has been sent
+        self.hal_gc(GC_FRAME)
+
+    def hal_gc(self, policy):
+        # Runs a collection if the GC policy asks for one at this point
+        if self.gc_policy == policy:
+            gc.collect()
+
+    def hal_write_byte(self, flags, value):
+        # Writes the high and then the low nibble of value, strobing E for
+        # each one. Inside a batch the four PCF8574 bytes are only packed.
+        high = flags | (((value >> 4) & 0x0f) << SHIFT_DATA)
+        low = flags | ((value & 0x0f) << SHIFT_DATA)
+        if self.batch_depth:
+            buf = self.batch_buf
+            if self.batch_len + 4 > len(buf):
+                self.hal_batch_flush()
+            n = self.batch_len
+            buf[n] = high | MASK_E
+            buf[n + 1] = high
+            buf[n + 2] = low | MASK_E
+            buf[n + 3] = low
+            self.batch_len = n + 4
+        else:
+            self.i2c_write_byte(high | MASK_E)
+            self.i2c_write_byte(high)
+            self.i2c_write_byte(low | MASK_E)
+            self.i2c_write_byte(low)
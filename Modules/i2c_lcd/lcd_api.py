@@ -54,6 +54,24 @@ class LcdApi:
         self.cursor_y = 0
         self.implied_newline = False
         self.backlight = True
+        # Shadow copy of the characters currently shown on the display and the
+        # frame being drawn between begin_frame() and commit().
+        self.shadow = bytearray(b' ' * (self.num_lines * self.num_columns))
+        self.frame = bytearray(len(self.shadow))
+        self.in_frame = False
+        # True while a committed frame hasn't been completely sent yet
+        self.pending = False
+        # Nesting depth of putstr()/commit() calls and HAL writes, see
+        # RenderQueue
+        self.drawing = 0
+        # Rows sorted by DDRAM address, so runs that continue from the end of
+        # one row onto the next don't need a new address command.
+        self.row_order = sorted(range(self.num_lines),
+                                key=lambda y: self.ddram_addr(0, y))
+        # Current value of the LCD address counter (None when unknown)
+        self.addr = None
+        # Columns the display is shifted left by, see shift_display()
+        self.shift = 0
         self.display_off()
         self.backlight_on()
         self.clear()
@@ -63,10 +81,26 @@ class LcdApi:
 
     def clear(self):
         # Clears the LCD display and moves the cursor to the top left corner
-        self.hal_write_command(self.LCD_CLR)
-        self.hal_write_command(self.LCD_HOME)
         self.cursor_x = 0
         self.cursor_y = 0
+        if self.in_frame:
+            # Only clear the frame, commit() will send what changed
+            frame = self.frame
+            for i in range(len(frame)):
+                frame[i] = 0x20
+            return
+        # Whatever was still pending is wiped out too
+        self.pending = False
+        # The address counter is unknown until the command is sent, so a
+        # commit() coming in between always sends its own address
+        self.addr = None
+        # LCD_CLR also returns home, so no LCD_HOME (and its delay) is needed
+        self.hal_write_command(self.LCD_CLR)
+        shadow = self.shadow
+        for i in range(len(shadow)):
+            shadow[i] = 0x20
+        self.addr = 0
+        self.shift = 0
 
     def show_cursor(self):
         # Causes the cursor to be made visible
@@ -111,21 +145,58 @@ class LcdApi:
         self.backlight = False
         self.hal_backlight_off()
 
-    def move_to(self, cursor_x, cursor_y):
-        # Moves the cursor position to the indicated position. The cursor
-        # position is zero based (i.e. cursor_x == 0 indicates first column).
-        self.cursor_x = cursor_x
-        self.cursor_y = cursor_y
+    def shift_display(self, count=1):
+        # Shifts what the display shows left by count columns (right if count
+        # is negative) without rewriting DDRAM. Each line of DDRAM is 40
+        # characters long and wraps around, and all lines shift together.
+        count %= 40
+        cmd = self.LCD_MOVE | self.LCD_MOVE_DISP
+        steps = count
+        if count > 20:
+            # Shorter to go the other way around
+            cmd |= self.LCD_MOVE_RIGHT
+            steps = 40 - count
+        for i in range(steps):
+            self.hal_write_command(cmd)
+        self.shift = (self.shift + count) % 40
+
+    def reset_shift(self):
+        # Undoes any display shift
+        if self.shift:
+            self.addr = None
+            self.hal_write_command(self.LCD_HOME)
+            self.addr = 0
+            self.shift = 0
+
+    def ddram_addr(self, cursor_x, cursor_y):
+        # Returns the DDRAM address of the indicated position.
         addr = cursor_x & 0x3f
         if cursor_y & 1:
             addr += 0x40    # Lines 1 & 3 add 0x40
         if cursor_y & 2:    # Lines 2 & 3 add number of columns
             addr += self.num_columns
-        self.hal_write_command(self.LCD_DDRAM | addr)
+        return addr
+
+    def move_to(self, cursor_x, cursor_y):
+        # Moves the cursor position to the indicated position. The cursor
+        # position is zero based (i.e. cursor_x == 0 indicates first column).
+        self.cursor_x = cursor_x
+        self.cursor_y = cursor_y
+        if self.in_frame:
+            return
+        addr = self.ddram_addr(cursor_x, cursor_y)
+        if self.addr != addr:
+            # Skip the command if the address counter is already there. The
+            # counter only counts as moved once the command is sent.
+            self.addr = None
+            self.hal_write_command(self.LCD_DDRAM | addr)
+            self.addr = addr
 
     def putchar(self, char):
         # Writes the indicated character to the LCD at the current cursor
-        # position, and advances the cursor by one position.
+        # position, and advances the cursor by one position. The LCD address
+        # counter is incremented by the LCD itself (LCD_ENTRY_INC), so an
+        # address command is only sent when the cursor wraps to another line.
         if char == '\n':
             if self.implied_newline:
                 # self.implied_newline means we advanced due to a wraparound,
@@ -134,7 +205,23 @@ class LcdApi:
             else:
                 self.cursor_x = self.num_columns
         else:
-            self.hal_write_data(ord(char))
+            data = ord(char) & 0xff
+            index = self.cursor_y * self.num_columns + self.cursor_x
+            if self.in_frame:
+                self.frame[index] = data
+            else:
+                # The write and the address counter it moves go together,
+                # a RenderQueue step in between would write to the wrong cell
+                self.drawing += 1
+                if self.pending:
+                    # Keep the pending frame from overwriting this later
+                    self.frame[index] = data
+                self.sync_cursor()
+                self.hal_write_data(data)
+                self.shadow[index] = data
+                if self.addr is not None:
+                    self.addr += 1
+                self.drawing -= 1
             self.cursor_x += 1
         if self.cursor_x >= self.num_columns:
             self.cursor_x = 0
@@ -142,24 +229,119 @@ class LcdApi:
             self.implied_newline = (char != '\n')
         if self.cursor_y >= self.num_lines:
             self.cursor_y = 0
-        self.move_to(self.cursor_x, self.cursor_y)
+        if not self.in_frame:
+            self.sync_cursor()
 
     def putstr(self, string):
         # Write the indicated string to the LCD at the current cursor
         # position and advances the cursor position appropriately.
+        self.drawing += 1
+        self.hal_batch_begin()
         for char in string:
             self.putchar(char)
+        self.hal_batch_end()
+        self.drawing -= 1
 
     def custom_char(self, location, charmap):
         # Write a character to one of the 8 CGRAM locations, available
         # as chr(0) through chr(7).
         location &= 0x7
+        self.drawing += 1
+        self.addr = None
         self.hal_write_command(self.LCD_CGRAM | (location << 3))
         self.hal_sleep_us(40)
         for i in range(8):
             self.hal_write_data(charmap[i])
             self.hal_sleep_us(40)
         self.move_to(self.cursor_x, self.cursor_y)
+        self.drawing -= 1
+
+    def begin_frame(self):
+        # Starts drawing a new frame. Until commit() is called, clear(),
+        # move_to() and putstr() only update an in-RAM copy of the display
+        # which starts out as what the display currently shows, or as the
+        # frame still pending if the last one wasn't completely sent.
+        if not self.pending:
+            self.frame[:] = self.shadow
+        self.in_frame = True
+
+    def commit(self, max_cells=None):
+        # Ends the frame and sends only the cells that differ from what the
+        # display shows. Changed cells close to each other are sent as one
+        # run, since rewriting a single unchanged cell costs the same as the
+        # DDRAM address command needed to skip it.
+        # If max_cells is given, at most that many cells are sent and the
+        # rest of the frame stays pending for the next call. Returns True
+        # once the whole frame is on the display.
+        if self.in_frame:
+            self.in_frame = False
+            self.pending = True
+        if not self.pending:
+            return True
+        self.drawing += 1
+        frame = self.frame
+        shadow = self.shadow
+        cols = self.num_columns
+        budget = max_cells
+        done = True
+        self.hal_batch_begin()
+        for y in self.row_order:
+            base = y * cols
+            x = 0
+            while x < cols:
+                if frame[base + x] == shadow[base + x]:
+                    x += 1
+                    continue
+                last = x
+                end = x + 1
+                while end < cols and end - last <= 2:
+                    if frame[base + end] != shadow[base + end]:
+                        last = end
+                    end += 1
+                if budget is not None:
+                    if budget <= 0:
+                        done = False
+                        break
+                    last = min(last, x + budget - 1)
+                    budget -= last + 1 - x
+                self.write_run(x, y, last + 1)
+                x = last + 1
+            if not done:
+                break
+        if done:
+            self.pending = False
+            self.sync_cursor()
+        self.hal_batch_end()
+        self.drawing -= 1
+        if done:
+            self.hal_frame_end()
+        return done
+
+    def write_run(self, start_x, cursor_y, end_x):
+        # Writes the frame cells start_x <= x < end_x of a row to the display,
+        # only sending an address command if the address counter isn't
+        # already there.
+        addr = self.ddram_addr(start_x, cursor_y)
+        if self.addr != addr:
+            self.hal_write_command(self.LCD_DDRAM | addr)
+        base = cursor_y * self.num_columns
+        frame = self.frame
+        shadow = self.shadow
+        for i in range(base + start_x, base + end_x):
+            self.hal_write_data(frame[i])
+            shadow[i] = frame[i]
+        self.addr = addr + end_x - start_x
+
+    def sync_cursor(self):
+        # Moves the LCD address counter back to the cursor position if it's
+        # somewhere else.
+        if self.addr != self.ddram_addr(self.cursor_x, self.cursor_y):
+            self.move_to(self.cursor_x, self.cursor_y)
+
+    def ready(self):
+        # Returns True if the LCD can be written to without waiting.
+        # If needed, a derived HAL class will implement this function.
+        return True
 
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on.
@@ -171,6 +353,22 @@ class LcdApi:
         # If desired, a derived HAL class will implement this function.
         pass
 
+    def hal_batch_begin(self):
+        # Marks the start of a group of writes which the hal layer may send
+        # together. Groups can be nested.
+        # If desired, a derived HAL class will implement this function.
+        pass
+
+    def hal_batch_end(self):
+        # Marks the end of a group of writes started with hal_batch_begin().
+        # If desired, a derived HAL class will implement this function.
+        pass
+
+    def hal_frame_end(self):
+        # Called once commit() has sent a frame.
+        # If desired, a derived HAL class will implement this function.
+        pass
+
     def hal_write_command(self, cmd):
         # Write a command to the LCD.
         # It is expected that a derived HAL class will implement this function.
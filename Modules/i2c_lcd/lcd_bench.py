@@ -0,0 +1,79 @@
+import utime
+import gc
+
+from i2c_lcd import I2cLcd, GC_APP, GC_FRAME, GC_WRITE
+
+# Rendering benchmark for the I2C LCD driver.
+# Run it on the board with the LCD attached:
+#
+#   from machine import Pin, SoftI2C
+#   import lcd_bench
+#   lcd_bench.run(SoftI2C(sda=Pin(21), scl=Pin(22), freq=400000))
+
+# (name, batched, gc_policy, framed) of each driver configuration that is
+# measured. The first one is the original driver behaviour: every character
+# is written as it's drawn (clear() and all, no frame diff), one I2C
+# transaction per nibble strobe and a collection after every write.
+CONFIGS = (
+    ("original (full redraw)", False, GC_WRITE, False),
+    ("per-nibble, gc per write", False, GC_WRITE, True),
+    ("per-nibble, gc per frame", False, GC_FRAME, True),
+    ("batched, gc per write", True, GC_WRITE, True),
+    ("batched, gc per frame", True, GC_FRAME, True),
+    ("batched, gc by app", True, GC_APP, True),
+)
+
+def draw_price(lcd, tick, framed=True):
+    # Draws a price screen laid out like showPrice() in the tracker scripts,
+    # with values that change on every tick. Without framed every character
+    # goes straight to the display, like the original scripts drew.
+    price = 27000 + (tick * 7.31) % 1000
+    if framed:
+        lcd.begin_frame()
+    lcd.clear()
+    lcd.putstr("BTC/USDT".center(20))
+    lcd.move_to(0, 1)
+    lcd.putstr(f"{chr(0)} {price:.2f} {chr(1)}".center(20))
+    lcd.move_to(0, 2)
+    lcd.putstr(f"{chr(2)}{price + 120:.2f}")
+    lcd.move_to(9, 2)
+    lcd.putstr(chr(4) + chr(5))
+    lcd.move_to(11, 2)
+    lcd.putstr("24hr".center(9))
+    lcd.move_to(0, 3)
+    lcd.putstr(f"{chr(3)}{price - 80:.2f}")
+    lcd.move_to(9, 3)
+    lcd.putstr(chr(4) + chr(5))
+    lcd.move_to(11, 3)
+    lcd.putstr(f"{(tick % 200) / 10 - 10:.2f}%".center(9))
+    if framed:
+        lcd.commit()
+
+def bench(lcd, frames=50, draw=draw_price, framed=True):
+    # Draws the given number of frames and returns
+    # (frames per second, I2C transactions per frame, I2C bytes per frame)
+    lcd.reset_stats()
+    start = utime.ticks_ms()
+    for tick in range(frames):
+        draw(lcd, tick, framed)
+    elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+    fps = frames * 1000 / elapsed if elapsed else 0
+    return fps, lcd.i2c_writes / frames, lcd.i2c_bytes / frames
+
+def run(i2c, i2c_addr=0x27, num_lines=4, num_columns=20, frames=50):
+    # Measures every configuration in CONFIGS and prints the results
+    print("{:<28}{:>8}{:>10}{:>10}".format("config", "fps", "writes", "bytes"))
+    results = []
+    for name, batched, gc_policy, framed in CONFIGS:
+        lcd = I2cLcd(i2c, i2c_addr, num_lines, num_columns,
+                     batched=batched, gc_policy=gc_policy)
+        gc.collect()
+        fps, writes, nbytes = bench(lcd, frames, framed=framed)
+        results.append((name, fps))
+        print("{:<28}{:>8.1f}{:>10.1f}{:>10.1f}".format(name, fps, writes, nbytes))
+        del lcd
+    base = results[0][1]
+    if base:
+        for name, fps in results[1:]:
+            print("{}: {:.1f}x".format(name, fps / base))
+    return results
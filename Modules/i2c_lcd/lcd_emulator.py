@@ -0,0 +1,322 @@
+# Host side (CPython) emulation of a HD44780 LCD behind a PCF8574 I2C
+# expander, used to measure and check the LCD driver without hardware.
+#
+# FakeI2C stands in for machine.I2C/SoftI2C: it counts transactions and bytes
+# and models how long they take on the bus at the given SCL frequency.
+# HD44780 decodes the PCF8574 port writes (E strobes, RS, backlight and the
+# 4-bit data nibbles) back into the controller state: DDRAM, CGRAM, address
+# counter, display shift, cursor and backlight.
+#
+# Time is virtual: bus transfers and utime.sleep_ms()/sleep_us() calls made by
+# the driver advance `clock` instead of waiting.
+#
+# When machine isn't available, a stand-in providing Pin, I2C and SoftI2C is
+# installed, so lcd_setup.py can be run against devices attached to
+# `devices`. The two backends are modeled with the constants below.
+
+import errno
+import sys
+
+# PCF8574 pin definitions, see i2c_lcd.py
+MASK_RS = 0x01
+MASK_E = 0x04
+MASK_BACKLIGHT = 0x08
+
+# Assumed cost of the I2C backends: fixed software time per transaction
+# (usec) and the fastest SCL each one actually reaches. SoftI2C bit-bangs the
+# bus from the CPU and falls short of the requested frequency, the hardware
+# peripheral runs at it.
+SOFT_OVERHEAD_US = 15
+SOFT_MAX_FREQ = 300000
+HARD_OVERHEAD_US = 40
+HARD_MAX_FREQ = 1000000
+
+# Devices reachable through the machine.I2C/SoftI2C stand-ins, by address
+devices = {}
+
+
+class Clock:
+
+    # Virtual microsecond clock shared by the bus and the utime stand-in
+
+    def __init__(self):
+        self.us = 0
+
+    def advance(self, usecs):
+        self.us += usecs
+
+
+clock = Clock()
+
+
+def _install_utime():
+    # Provides the utime functions used by the driver when running on
+    # CPython, driven by the virtual clock.
+    try:
+        import utime
+        return
+    except ImportError:
+        pass
+    utime = type(sys)("utime")
+    utime.sleep = lambda s: clock.advance(int(s * 1000000))
+    utime.sleep_ms = lambda ms: clock.advance(ms * 1000)
+    utime.sleep_us = lambda us: clock.advance(us)
+    utime.ticks_ms = lambda: int(clock.us // 1000)
+    utime.ticks_us = lambda: int(clock.us)
+    utime.ticks_add = lambda ticks, delta: ticks + delta
+    utime.ticks_diff = lambda new, old: new - old
+    sys.modules["utime"] = utime
+
+
+def _install_machine():
+    # Provides the machine classes used by lcd_setup.py when running on
+    # CPython, backed by FakeI2C buses.
+    try:
+        import machine
+        return
+    except ImportError:
+        pass
+    machine = type(sys)("machine")
+
+    class Pin:
+        IN = 1
+        OUT = 3
+        PULL_UP = 1
+
+        def __init__(self, id, mode=-1, pull=-1):
+            self.id = id
+
+    def I2C(id=0, scl=None, sda=None, freq=400000):
+        return FakeI2C(freq, devices, HARD_OVERHEAD_US, HARD_MAX_FREQ)
+
+    def SoftI2C(scl=None, sda=None, freq=400000, timeout=50000):
+        return FakeI2C(freq, devices, SOFT_OVERHEAD_US, SOFT_MAX_FREQ)
+
+    machine.Pin = Pin
+    machine.I2C = I2C
+    machine.SoftI2C = SoftI2C
+    sys.modules["machine"] = machine
+
+
+_install_utime()
+_install_machine()
+
+from i2c_lcd import I2cLcd
+
+
+class HD44780:
+
+    # Decodes PCF8574 port writes into HD44780 controller state
+
+    def __init__(self, num_lines=4, num_columns=20, max_freq=400000):
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        # Fastest SCL at which the PCF8574 still acknowledges
+        self.max_freq = max_freq
+        self.port = 0
+        self.four_bit = False
+        self.high_nibble = None
+        self.two_lines = False
+        self.ddram = bytearray(b' ' * 0x80)
+        self.cgram = bytearray(64)
+        self.addr = 0
+        self.in_cgram = False
+        self.increment = True
+        self.entry_shift = False
+        self.shift = 0
+        self.display_on = False
+        self.cursor_on = False
+        self.blink_on = False
+        self.backlight = False
+        self.commands = 0
+        self.data_writes = 0
+
+    def write_port(self, value):
+        # Called for every byte written to the PCF8574. The LCD latches the
+        # data lines on the falling edge of E.
+        if self.port & MASK_E and not value & MASK_E:
+            self.strobe(value & MASK_RS, (value >> 4) & 0x0f)
+        self.port = value
+        self.backlight = bool(value & MASK_BACKLIGHT)
+
+    def strobe(self, rs, nibble):
+        if not self.four_bit:
+            # 8-bit mode, only D7-D4 are wired so this is a full instruction
+            self.execute(rs, nibble << 4)
+            return
+        if self.high_nibble is None:
+            self.high_nibble = nibble
+        else:
+            self.execute(rs, (self.high_nibble << 4) | nibble)
+            self.high_nibble = None
+
+    def execute(self, rs, value):
+        if rs:
+            self.data_writes += 1
+            self.write_data(value)
+            return
+        self.commands += 1
+        if value & 0x80:
+            self.addr = value & 0x7f
+            self.in_cgram = False
+        elif value & 0x40:
+            self.addr = value & 0x3f
+            self.in_cgram = True
+        elif value & 0x20:
+            if not self.four_bit and not value & 0x10:
+                self.four_bit = True
+            self.two_lines = bool(value & 0x08)
+        elif value & 0x10:
+            right = bool(value & 0x04)
+            if value & 0x08:
+                self.shift += -1 if right else 1
+            else:
+                self.addr = self.next_addr(self.addr, right)
+        elif value & 0x08:
+            self.display_on = bool(value & 0x04)
+            self.cursor_on = bool(value & 0x02)
+            self.blink_on = bool(value & 0x01)
+        elif value & 0x04:
+            self.increment = bool(value & 0x02)
+            self.entry_shift = bool(value & 0x01)
+        elif value & 0x02:
+            self.addr = 0
+            self.in_cgram = False
+            self.shift = 0
+        elif value & 0x01:
+            for i in range(len(self.ddram)):
+                self.ddram[i] = 0x20
+            self.addr = 0
+            self.in_cgram = False
+            self.shift = 0
+            self.increment = True
+
+    def write_data(self, value):
+        if self.in_cgram:
+            self.cgram[self.addr] = value
+            self.addr = (self.addr + (1 if self.increment else -1)) & 0x3f
+            return
+        self.ddram[self.addr] = value
+        self.addr = self.next_addr(self.addr, self.increment)
+        if self.entry_shift:
+            self.shift += 1 if self.increment else -1
+
+    def next_addr(self, addr, forward):
+        # Moves the DDRAM address counter, wrapping like the controller does
+        if self.in_cgram:
+            return (addr + (1 if forward else -1)) & 0x3f
+        if not self.two_lines:
+            return (addr + (1 if forward else -1)) % 80
+        line, pos = addr & 0x40, addr & 0x3f
+        if forward:
+            pos += 1
+            if pos >= 40:
+                pos = 0
+                line ^= 0x40
+        else:
+            pos -= 1
+            if pos < 0:
+                pos = 39
+                line ^= 0x40
+        return line | pos
+
+    def char_at(self, x, y):
+        # Returns the character code shown at column x of row y
+        if not self.two_lines:
+            return self.ddram[(y * self.num_columns + x + self.shift) % 80]
+        offset = x + (self.num_columns if y & 2 else 0)
+        return self.ddram[(0x40 if y & 1 else 0) + (offset + self.shift) % 40]
+
+    def rows(self):
+        # Returns what the display shows, one string per row
+        return ["".join(chr(self.char_at(x, y)) for x in range(self.num_columns))
+                for y in range(self.num_lines)]
+
+    def glyph(self, code):
+        # Returns the 8 rows of the CGRAM glyph shown for character code 0-7
+        start = (code & 0x7) * 8
+        return bytes(self.cgram[start:start + 8])
+
+
+class FakeI2C:
+
+    # Stand-in for machine.I2C that forwards writes to emulated devices and
+    # models the time of every transaction: overhead_us of software time plus
+    # the bits on the wire at freq, capped to max_freq.
+
+    def __init__(self, freq=400000, devices=None, overhead_us=0, max_freq=None):
+        self.freq = freq
+        self.devices = {} if devices is None else devices
+        self.overhead_us = overhead_us
+        self.max_freq = max_freq
+        self.reset_stats()
+
+    def attach(self, addr, device):
+        self.devices[addr] = device
+
+    def reset_stats(self):
+        self.writes = 0
+        self.bytes = 0
+        self.bus_us = 0
+
+    def transaction_us(self, nbytes):
+        # START, address byte, data bytes (8 bits + ACK each) and STOP
+        freq = self.freq
+        if self.max_freq and freq > self.max_freq:
+            freq = self.max_freq
+        return self.overhead_us + ((1 + nbytes) * 9 + 2) * 1000000 / freq
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def address(self, addr, nbytes):
+        # Runs the bus time of a transaction and returns the device that
+        # acknowledged it, raising OSError like machine.I2C when none did
+        device = self.devices.get(addr)
+        if device is None or self.freq > device.max_freq:
+            nbytes = 0
+        elapsed = self.transaction_us(nbytes)
+        self.bus_us += elapsed
+        clock.advance(elapsed)
+        if device is None:
+            raise OSError(errno.ENODEV)
+        if self.freq > device.max_freq:
+            raise OSError(errno.EIO)
+        return device
+
+    def readfrom(self, addr, nbytes, stop=True):
+        device = self.address(addr, nbytes)
+        self.writes += 1
+        self.bytes += nbytes
+        return bytes([device.port]) * nbytes
+
+    def writeto(self, addr, buf, stop=True):
+        nbytes = len(buf)
+        device = self.address(addr, nbytes)
+        self.writes += 1
+        self.bytes += nbytes
+        for value in bytes(buf):
+            device.write_port(value)
+        return nbytes
+
+
+class EmulatedLcd(I2cLcd):
+
+    # I2cLcd driving an emulated display on a FakeI2C bus. The emulated
+    # controller is available as .device and the bus as .i2c
+
+    def __init__(self, num_lines=4, num_columns=20, freq=400000,
+                 i2c_addr=0x27, i2c=None, max_freq=1000000, **kwargs):
+        self.device = HD44780(num_lines, num_columns, max_freq)
+        bus = FakeI2C(freq) if i2c is None else i2c
+        bus.attach(i2c_addr, self.device)
+        I2cLcd.__init__(self, bus, i2c_addr, num_lines, num_columns, **kwargs)
+
+    def in_sync(self):
+        # Returns True if the display shows what the driver thinks it shows
+        cols = self.num_columns
+        for y in range(self.num_lines):
+            for x in range(cols):
+                if self.device.char_at(x, y) != self.shadow[y * cols + x]:
+                    return False
+        return True
@@ -0,0 +1,125 @@
+class GlyphManager:
+
+    # Maps named 5x8 bitmaps onto the 8 CGRAM slots of a HD44780 LCD.
+    #
+    # Glyphs are uploaded on first use and stay resident until their slot is
+    # needed for another glyph, in which case the least recently used one is
+    # evicted. Glyphs used in the frame being drawn are never evicted, so a
+    # single frame can show up to 8 different custom glyphs while a screen can
+    # use any number of them over time.
+    #
+    # Typical use:
+    #
+    #   glyphs = GlyphManager(lcd)
+    #   glyphs.define("up", bytearray([0x04,0x0E,0x1F,0x04,0x04,0x04,0x04,0x04]))
+    #   glyphs.begin_frame()
+    #   lcd.putstr(glyphs.char("up") + " 27000.0")
+    #   glyphs.commit()
+
+    def __init__(self, lcd, slots=range(8)):
+        self.lcd = lcd
+        # CGRAM slots managed by this instance, others can still be written
+        # with lcd.custom_char()
+        self.slots = [slot & 0x7 for slot in slots]
+        self.bitmaps = {}
+        self.slot_of = {}
+        self.resident = [None] * 8
+        self.last_use = [0] * 8
+        self.frame_use = [0] * 8
+        self.clock = 0
+        self.frame_id = 0
+        # Bitmask of slots whose bitmap still has to be uploaded
+        self.pending = 0
+        # Number of glyphs uploaded and of uploads skipped because the glyph
+        # was already resident
+        self.uploads = 0
+        self.hits = 0
+
+    def define(self, name, bitmap):
+        # Registers (or replaces) the 8 row bitmap of a glyph
+        bitmap = bytes(bitmap[:8])
+        if self.bitmaps.get(name) == bitmap:
+            return
+        self.bitmaps[name] = bitmap
+        slot = self.slot_of.get(name)
+        if slot is not None:
+            # The glyph is on the display, refresh it with the new bitmap
+            self.pending |= 1 << slot
+            if not self.lcd.in_frame:
+                self.flush()
+
+    def char(self, name):
+        # Returns the character that shows the glyph, assigning it a CGRAM
+        # slot if it isn't resident. Outside a frame the glyph is uploaded
+        # right away, inside a frame uploads are sent together by commit().
+        self.clock += 1
+        slot = self.slot_of.get(name)
+        if slot is None:
+            if name not in self.bitmaps:
+                raise ValueError('{} is not a defined glyph'.format(name))
+            slot = self.evict()
+            self.resident[slot] = name
+            self.slot_of[name] = slot
+            self.pending |= 1 << slot
+        else:
+            self.hits += 1
+        self.last_use[slot] = self.clock
+        if self.lcd.in_frame:
+            self.frame_use[slot] = self.frame_id
+        elif self.pending:
+            self.flush()
+        return chr(slot)
+
+    def evict(self):
+        # Returns a free slot, or the least recently used one not shown in
+        # the current frame.
+        victim = None
+        for slot in self.slots:
+            if self.resident[slot] is None:
+                return slot
+            if self.lcd.in_frame and self.frame_use[slot] == self.frame_id:
+                continue
+            if victim is None or self.last_use[slot] < self.last_use[victim]:
+                victim = slot
+        if victim is None:
+            raise RuntimeError('more than {} glyphs in one frame'.format(len(self.slots)))
+        del self.slot_of[self.resident[victim]]
+        self.resident[victim] = None
+        return victim
+
+    def begin_frame(self):
+        # Starts a frame on the LCD, see LcdApi.begin_frame()
+        self.frame_id += 1
+        self.lcd.begin_frame()
+
+    def commit(self, max_cells=None):
+        # Uploads the glyphs the frame needs and commits it to the LCD, see
+        # LcdApi.commit()
+        self.flush()
+        return self.lcd.commit(max_cells)
+
+    def flush(self):
+        # Uploads the pending glyphs in one batch. The CGRAM address counter
+        # increments from the last row of a slot to the first row of the
+        # next one, so consecutive slots only need one address command.
+        if not self.pending:
+            return
+        lcd = self.lcd
+        lcd.drawing += 1
+        lcd.hal_batch_begin()
+        lcd.addr = None
+        next_slot = None
+        for slot in range(8):
+            if not self.pending & (1 << slot):
+                continue
+            if slot != next_slot:
+                lcd.hal_write_command(lcd.LCD_CGRAM | (slot << 3))
+            for row in self.bitmaps[self.resident[slot]]:
+                lcd.hal_write_data(row)
+            next_slot = slot + 1
+            self.uploads += 1
+        self.pending = 0
+        if not lcd.in_frame:
+            lcd.sync_cursor()
+        lcd.hal_batch_end()
+        lcd.drawing -= 1
@@ -0,0 +1,161 @@
+import utime
+
+class Marquee:
+
+    # Scrolls a text longer than the display is wide using the display shift
+    # of the HD44780 (LCD_MOVE | LCD_MOVE_DISP).
+    #
+    # The text is written once into one 40 character DDRAM line and every
+    # step() then costs a single command, no characters are rewritten.
+    # Since the controller shifts all lines together, a marquee owns the whole
+    # display while it runs. On 4 line displays the DDRAM line is shown by two
+    # rows: line 0 by rows 0 and 2, line 1 by rows 1 and 3, the second one
+    # showing the 20 characters that follow the first one.
+    #
+    #   m = Marquee(lcd, "Couldn't connect to the internet!")
+    #   m.start()
+    #   while waiting:
+    #       m.poll()
+    #   m.stop()
+
+    LINE_LENGTH = 40
+
+    def __init__(self, lcd, text, line=0, step_ms=350, gap=3):
+        self.lcd = lcd
+        self.line = line & 1
+        self.step_ms = step_ms
+        text = text[:self.LINE_LENGTH]
+        # Leave a gap between the end of the text and its start coming round
+        # again, when there is room for it in the DDRAM line
+        if len(text) + gap <= self.LINE_LENGTH:
+            text += " " * gap
+        self.text = text + " " * (self.LINE_LENGTH - len(text))
+        self.scrolls = len(text.rstrip()) > lcd.num_columns
+        self.last_step = 0
+        self.steps = 0
+
+    def start(self, clear=True):
+        # Writes the text into its DDRAM line, clearing the display first
+        lcd = self.lcd
+        if clear:
+            lcd.clear()
+        else:
+            lcd.reset_shift()
+        cols = lcd.num_columns
+        lcd.move_to(0, self.line)
+        lcd.putstr(self.text[:cols])
+        visible = cols
+        if lcd.num_lines > 2:
+            # The DDRAM line continues on the row two below
+            lcd.move_to(0, self.line + 2)
+            lcd.putstr(self.text[cols:cols * 2])
+            visible = cols * 2
+        if visible < self.LINE_LENGTH:
+            # The rest of the line is off-screen until it is shifted in
+            lcd.drawing += 1
+            lcd.hal_batch_begin()
+            lcd.hal_write_command(lcd.LCD_DDRAM | (lcd.ddram_addr(0, self.line) + visible))
+            for char in self.text[visible:]:
+                lcd.hal_write_data(ord(char))
+            lcd.addr = None
+            lcd.sync_cursor()
+            lcd.hal_batch_end()
+            lcd.drawing -= 1
+        self.last_step = utime.ticks_ms()
+        self.steps = 0
+
+    def step(self):
+        # Scrolls the text one column to the left
+        if self.scrolls:
+            self.lcd.shift_display(1)
+            self.steps += 1
+
+    def poll(self):
+        # Steps if step_ms have passed since the last step
+        now = utime.ticks_ms()
+        if utime.ticks_diff(now, self.last_step) >= self.step_ms:
+            self.last_step = now
+            self.step()
+
+    def scroll_ms(self):
+        # Time it takes to scroll the end of the text into view
+        if not self.scrolls:
+            return 0
+        return (len(self.text.rstrip()) - self.lcd.num_columns) * self.step_ms
+
+    def run(self, duration_ms):
+        # Scrolls for duration_ms, blocking
+        start = utime.ticks_ms()
+        while utime.ticks_diff(utime.ticks_ms(), start) < duration_ms:
+            utime.sleep_ms(self.step_ms)
+            self.step()
+
+    def stop(self):
+        # Puts the display back to where it was before scrolling
+        self.lcd.reset_shift()
+
+
+class RowMarquee(Marquee):
+
+    # Scrolls one row whose text is longer than the display is wide, leaving
+    # the other rows where they are, for menu and input rows.
+    #
+    # The display shift moves every line together (and on 4 line displays a
+    # DDRAM line is shown by two rows), so here every step rewrites the row
+    # instead. Through the shadow framebuffer only the cells that changed are
+    # sent. The text can be of any length. The cursor is left where it was.
+    #
+    #   m = RowMarquee(lcd, ssid, row=1, col=1)
+    #   m.start()
+    #   while waiting:
+    #       m.poll()
+
+    def __init__(self, lcd, text, row, col=0, step_ms=350, gap=3):
+        self.lcd = lcd
+        self.row = row
+        self.col = col
+        self.width = lcd.num_columns - col
+        self.step_ms = step_ms
+        self.scrolls = len(text) > self.width
+        self.text = text + " " * gap if self.scrolls else text
+        self.offset = 0
+        self.last_step = 0
+        self.steps = 0
+
+    def draw(self):
+        # Writes the part of the text starting at offset into the row
+        lcd = self.lcd
+        text = self.text
+        x, y = lcd.cursor_x, lcd.cursor_y
+        lcd.move_to(self.col, self.row)
+        window = text[self.offset:self.offset + self.width]
+        if len(window) < self.width and self.scrolls:
+            # The start of the text comes round again after the gap
+            window += text[:self.width - len(window)]
+        lcd.putstr(window + " " * (self.width - len(window)))
+        lcd.move_to(x, y)
+
+    def start(self, clear=False):
+        if clear:
+            self.lcd.clear()
+        self.offset = 0
+        self.draw()
+        self.last_step = utime.ticks_ms()
+        self.steps = 0
+
+    def step(self):
+        if self.scrolls:
+            self.offset = (self.offset + 1) % len(self.text)
+            self.steps += 1
+            self.draw()
+
+    def scroll_ms(self):
+        if not self.scrolls:
+            return 0
+        return (len(self.text.rstrip()) - self.width) * self.step_ms
+
+    def stop(self):
+        # Puts the start of the text back in the row
+        if self.offset:
+            self.offset = 0
+            self.draw()
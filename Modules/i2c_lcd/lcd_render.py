@@ -0,0 +1,76 @@
+import micropython
+
+class RenderQueue:
+
+    # Sends frames to the LCD in small slices in the background, so drawing a
+    # screen never holds up the main loop for longer than one slice.
+    #
+    # A frame is drawn with lcd.begin_frame() (or GlyphManager.begin_frame())
+    # as usual and handed over with submit() instead of commit(). The queue
+    # then sends at most slice_cells changed cells per step(), called from a
+    # uasyncio task (run()) or a periodic machine.Timer (start_timer()).
+    # A frame submitted before the previous one is completely on the display
+    # replaces it, so only the cells of the newest frame are ever sent.
+
+    def __init__(self, lcd, slice_cells=8):
+        self.lcd = lcd
+        self.slice_cells = slice_cells
+        # Number of frames submitted and of frames replaced before they were
+        # completely drawn
+        self.frames = 0
+        self.dropped = 0
+        self.timer = None
+        # Bound once, so the timer callback doesn't allocate
+        self.step_cb = self.scheduled_step
+
+    def submit(self, glyphs=None):
+        # Queues the frame drawn since begin_frame(). The glyphs it uses are
+        # uploaded right away if a GlyphManager is given.
+        lcd = self.lcd
+        if glyphs is not None:
+            glyphs.flush()
+        if lcd.pending:
+            self.dropped += 1
+        self.frames += 1
+        lcd.commit(0)
+
+    def idle(self):
+        # Returns True if there is nothing left to send
+        return not self.lcd.pending and not self.lcd.in_frame
+
+    def step(self):
+        # Sends the next slice of the pending frame. Does nothing while a
+        # frame is being drawn, while something else is writing to the LCD
+        # or while the LCD is still busy with a slow command.
+        lcd = self.lcd
+        if not lcd.pending or lcd.in_frame or lcd.drawing or not lcd.ready():
+            return not lcd.pending
+        return lcd.commit(self.slice_cells)
+
+    async def run(self, period_ms=10):
+        # uasyncio task draining the queue every period_ms
+        import uasyncio as asyncio
+        while True:
+            self.step()
+            await asyncio.sleep_ms(period_ms)
+
+    def start_timer(self, timer, period_ms=10):
+        # Drains the queue from a periodic machine.Timer. The I2C writes are
+        # made from a scheduled callback, not from the interrupt itself.
+        self.timer = timer
+        timer.init(period=period_ms, mode=timer.PERIODIC, callback=self.timer_irq)
+
+    def stop_timer(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def timer_irq(self, timer):
+        try:
+            micropython.schedule(self.step_cb, None)
+        except RuntimeError:
+            # The schedule queue is full, try again on the next tick
+            pass
+
+    def scheduled_step(self, arg):
+        self.step()
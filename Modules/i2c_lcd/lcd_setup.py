@@ -0,0 +1,68 @@
+from machine import Pin, I2C, SoftI2C
+from i2c_lcd import I2cLcd
+
+# Builds the I2C bus and the LCD from a configuration dict, as loaded from
+# lcd.json by the tracker scripts:
+#
+#   backend  "soft" for a bit-banged SoftI2C, "hard" for the I2C peripheral
+#   bus      hardware I2C peripheral id (0 or 1 on the ESP32)
+#   sda/scl  pin numbers
+#   freq     SCL frequency in Hz, or "auto" to use the fastest one at which
+#            the PCF8574 answers reliably (see probe_freq)
+
+DEFAULT_CONFIG = {"backend": "soft", "bus": 0, "sda": 21, "scl": 22, "freq": 400000}
+
+# SCL frequencies tried by probe_freq(), fastest first
+PROBE_FREQS = (1000000, 800000, 400000, 100000)
+# Port values written and read back while probing. E (P2) stays low so the
+# LCD ignores them, P3 is skipped when comparing since the backlight
+# transistor can pull it low.
+PROBE_PATTERNS = (0x00, 0xF0, 0x52, 0xA1)
+PROBE_MASK = 0xF7
+
+def make_i2c(backend="soft", sda=21, scl=22, freq=400000, bus=0):
+    # Returns a SoftI2C or hardware I2C bus
+    if backend == "hard":
+        return I2C(bus, sda=Pin(sda), scl=Pin(scl), freq=freq)
+    return SoftI2C(sda=Pin(sda), scl=Pin(scl), freq=freq)
+
+def probe_ok(i2c, i2c_addr, tries=32):
+    # Returns True if the PCF8574 acknowledges and reads back every write
+    buf = bytearray(1)
+    try:
+        for i in range(tries):
+            buf[0] = PROBE_PATTERNS[i % len(PROBE_PATTERNS)]
+            i2c.writeto(i2c_addr, buf)
+            if (i2c.readfrom(i2c_addr, 1)[0] ^ buf[0]) & PROBE_MASK:
+                return False
+    except OSError:
+        return False
+    return True
+
+def probe_freq(factory, i2c_addr, freqs=PROBE_FREQS, tries=32):
+    # Tries the frequencies from fastest to slowest and returns (i2c, freq)
+    # for the first one that works, or (None, None). factory(freq) must
+    # return a bus running at freq.
+    for freq in freqs:
+        i2c = factory(freq)
+        if probe_ok(i2c, i2c_addr, tries):
+            return i2c, freq
+    return None, None
+
+def open_lcd(config, i2c_addr, num_lines, num_columns, **kwargs):
+    # Returns (lcd, freq) for the configured backend. Extra keyword arguments
+    # are passed on to I2cLcd.
+    cfg = dict(DEFAULT_CONFIG)
+    cfg.update(config)
+    def factory(freq):
+        return make_i2c(cfg["backend"], cfg["sda"], cfg["scl"], freq, cfg["bus"])
+    freq = cfg["freq"]
+    if freq == "auto":
+        i2c, freq = probe_freq(factory, i2c_addr)
+        if i2c is None:
+            # Nothing answered, keep going at the slowest speed anyway
+            freq = PROBE_FREQS[-1]
+            i2c = factory(freq)
+    else:
+        i2c = factory(freq)
+    return I2cLcd(i2c, i2c_addr, num_lines, num_columns, **kwargs), freq
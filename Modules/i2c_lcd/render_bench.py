@@ -0,0 +1,142 @@
+# Host side rendering benchmark for the LCD driver.
+#
+# Draws the screens of the tracker scripts (menuString, userIn and showPrice)
+# on an emulated 20x4 LCD and reports the cost of each frame: I2C
+# transactions, bytes, modeled bus time and total modeled time (bus time plus
+# the delays the driver waits for). It also checks that the emulated display
+# ends up showing what the driver thinks it shows.
+#
+# Run it with CPython from this directory:
+#
+#   python3 render_bench.py [frames] [scl_freq]
+
+import sys
+
+from lcd_emulator import EmulatedLcd, clock
+from i2c_lcd import GC_APP
+
+MENU = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "ADAUSDT", "XRPUSDT", "SOLUSDT",
+        "DOTUSDT", "DOGEUSDT", "LTCUSDT", "(RETURN)"]
+CHARACTERS = ["(SPACE)"] + [chr(c) for c in range(65, 91)] + \
+             [chr(c) for c in range(48, 58)] + ["(DELETE)", "(ENTER)"]
+
+
+def begin(lcd, framed):
+    if framed:
+        lcd.begin_frame()
+
+
+def end(lcd, framed):
+    if framed:
+        lcd.commit()
+
+
+def draw_menu(lcd, tick, framed=True):
+    # menuString() scrolling through a titled menu one detent per frame
+    item = tick % len(MENU)
+    page = item // 3
+    begin(lcd, framed)
+    lcd.clear()
+    lcd.putstr("Select symbol:")
+    row = 1
+    for option in MENU[page * 3:page * 3 + 3]:
+        lcd.move_to(0, row)
+        mark = chr(0) if option is MENU[item] else " "
+        lcd.putstr((mark + option + "\n")[:20])
+        row += 1
+    end(lcd, framed)
+
+
+def draw_user_in(lcd, tick, framed=True):
+    # userIn() updating the selected character as the knob turns
+    if tick == 0:
+        lcd.clear()
+        lcd.putstr("Select base coin:")
+        lcd.move_to(0, 1)
+        lcd.putstr(chr(0) + "BT")
+        lcd.move_to(0, 3)
+        lcd.putstr("> ")
+    lcd.move_to(2, 3)
+    lcd.putstr(" " * 18)
+    lcd.move_to(2, 3)
+    lcd.putstr(CHARACTERS[tick % len(CHARACTERS)])
+
+
+def draw_price(lcd, tick, framed=True):
+    # showPrice() with a price that changes on every refresh
+    price = 27000 + (tick * 7.31) % 1000
+    begin(lcd, framed)
+    lcd.clear()
+    lcd.putstr("BTC/USDT".center(20))
+    lcd.move_to(0, 1)
+    lcd.putstr(f"{chr(0)} {price:.2f} {chr(1)}".center(20))
+    lcd.move_to(0, 2)
+    lcd.putstr(f"{chr(2)}{price + 120:.2f}")
+    lcd.move_to(9, 2)
+    lcd.putstr(chr(4) + chr(5))
+    lcd.move_to(11, 2)
+    lcd.putstr("24hr".center(9))
+    lcd.move_to(0, 3)
+    lcd.putstr(f"{chr(3)}{price - 80:.2f}")
+    lcd.move_to(9, 3)
+    lcd.putstr(chr(4) + chr(5))
+    lcd.move_to(11, 3)
+    lcd.putstr(f"{(tick % 200) / 10 - 10:.2f}%".center(9))
+    end(lcd, framed)
+
+
+SCREENS = (
+    ("menuString", draw_menu),
+    ("userIn", draw_user_in),
+    ("showPrice", draw_price),
+)
+
+# (name, I2cLcd keyword arguments, draw through begin_frame()/commit())
+CONFIGS = (
+    ("per-nibble, full redraw", {"batched": False}, False),
+    ("batched, full redraw", {"batched": True}, False),
+    ("batched, framed", {"batched": True}, True),
+)
+
+
+def measure(draw, frames, freq, framed, **kwargs):
+    # Draws the frames on a fresh emulated LCD and returns a dict with the
+    # cost per frame
+    lcd = EmulatedLcd(freq=freq, gc_policy=GC_APP, **kwargs)
+    bus = lcd.i2c
+    bus.reset_stats()
+    start = clock.us
+    for tick in range(frames):
+        draw(lcd, tick, framed)
+    return {
+        "writes": bus.writes / frames,
+        "bytes": bus.bytes / frames,
+        "bus_ms": bus.bus_us / frames / 1000,
+        "total_ms": (clock.us - start) / frames / 1000,
+        "in_sync": lcd.in_sync(),
+    }
+
+
+def run(frames=100, freq=400000):
+    # Measures every screen with every configuration and prints a table.
+    # Returns the results as {(screen, config): measure() dict}
+    results = {}
+    print("SCL {} kHz, {} frames per run".format(freq // 1000, frames))
+    print("{:<12}{:<26}{:>8}{:>8}{:>9}{:>10}  {}".format(
+        "screen", "config", "writes", "bytes", "bus ms", "total ms", "check"))
+    for screen, draw in SCREENS:
+        for name, kwargs, framed in CONFIGS:
+            result = measure(draw, frames, freq, framed, **kwargs)
+            results[(screen, name)] = result
+            print("{:<12}{:<26}{:>8.1f}{:>8.1f}{:>9.2f}{:>10.2f}  {}".format(
+                screen, name, result["writes"], result["bytes"],
+                result["bus_ms"], result["total_ms"],
+                "ok" if result["in_sync"] else "MISMATCH"))
+    return results
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    results = run(*args)
+    if not all(result["in_sync"] for result in results.values()):
+        sys.exit(1)
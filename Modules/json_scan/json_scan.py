@@ -0,0 +1,297 @@
+# Incremental JSON scanner that pulls selected fields out of a stream without
+# loading the whole document.
+#
+# The stream is read chunk_size bytes at a time (anything with read(n), like
+# the .raw socket of a urequests response). Only the values at the requested
+# paths are built, everything else is skipped as it goes by, so the memory
+# used doesn't depend on the size of the document.
+#
+# Paths are written like in Python, with keys separated by dots and list
+# indexes in brackets. [*] matches every item of a list:
+#
+#   lastPrice              {"lastPrice": "27000.1", ...}
+#   symbols[0].baseAsset   {"symbols": [{"baseAsset": "BTC", ...}], ...}
+#   [*].symbol             [{"symbol": "BTCUSDT", ...}, ...]
+#   [*]                    every item of a top level list, one at a time
+#
+# When one path is inside another, only the outer value is returned.
+#
+# Typical use:
+#
+#   response = rq.get(url)
+#   fields = JsonScanner(response.raw).extract(["lastPrice", "highPrice"])
+#   response.close()
+
+_QUOTE = 0x22
+_BACKSLASH = 0x5c
+_COLON = 0x3a
+_COMMA = 0x2c
+_LBRACE = 0x7b
+_RBRACE = 0x7d
+_LBRACKET = 0x5b
+_RBRACKET = 0x5d
+_WHITESPACE = b" \t\r\n"
+_ESCAPES = {0x22: b'"', 0x5c: b'\\', 0x2f: b'/', 0x62: b'\b', 0x66: b'\f',
+            0x6e: b'\n', 0x72: b'\r', 0x74: b'\t'}
+_SCALAR_END = b" \t\r\n,]}"
+
+# Path component matching any list index
+ANY = -1
+
+
+def parse_path(path):
+    # Returns the components of a path: keys as str, indexes as int
+    parts = []
+    for part in path.replace("[", ".[").split("."):
+        if not part:
+            continue
+        if part[0] == "[":
+            index = part[1:-1]
+            parts.append(ANY if index == "*" else int(index))
+        else:
+            parts.append(part)
+    return tuple(parts)
+
+
+class JsonScanner:
+
+    def __init__(self, stream, chunk_size=256):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = b""
+        self.pos = 0
+        # Bytes read from the stream so far
+        self.nbytes = 0
+
+    def scan(self, paths):
+        # Yields (path, value) for every value found at one of the paths, in
+        # document order
+        patterns = [(path, parse_path(path)) for path in paths]
+        return self._walk([], patterns)
+
+    def extract(self, paths):
+        # Returns {path: value} with the first value found at each path.
+        # Reading stops as soon as every path without [*] has been found.
+        found = {}
+        wanted = len([path for path in paths if "[*]" not in path])
+        for path, value in self.scan(paths):
+            if path in found:
+                continue
+            found[path] = value
+            if len(found) == wanted == len(paths):
+                break
+        return found
+
+    def _fill(self):
+        self.buf = self.stream.read(self.chunk_size)
+        self.pos = 0
+        if not self.buf:
+            raise ValueError("unexpected end of JSON")
+        self.nbytes += len(self.buf)
+
+    def _peek(self):
+        # Returns the next byte that isn't whitespace, without consuming it
+        while True:
+            if self.pos >= len(self.buf):
+                self._fill()
+            c = self.buf[self.pos]
+            if c not in _WHITESPACE:
+                return c
+            self.pos += 1
+
+    def _take(self):
+        c = self._peek()
+        self.pos += 1
+        return c
+
+    def _raw(self):
+        # Returns the next byte, whitespace included
+        if self.pos >= len(self.buf):
+            self._fill()
+        c = self.buf[self.pos]
+        self.pos += 1
+        return c
+
+    def _expect(self, expected):
+        if self._take() != expected:
+            raise ValueError("invalid JSON at byte {}".format(self.nbytes - len(self.buf) + self.pos))
+
+    def _string(self, keep=True):
+        # Reads a string whose opening quote was consumed. Returns it as str,
+        # or None when keep is False.
+        parts = []
+        while True:
+            if self.pos >= len(self.buf):
+                self._fill()
+            buf = self.buf
+            end = buf.find(b'"', self.pos)
+            escape = buf.find(b'\\', self.pos, len(buf) if end < 0 else end)
+            if escape >= 0:
+                if keep:
+                    parts.append(buf[self.pos:escape])
+                self.pos = escape + 1
+                c = self._raw()
+                if c == 0x75:
+                    code = self._hex4()
+                    if 0xd800 <= code < 0xdc00 and self._raw() == _BACKSLASH and self._raw() == 0x75:
+                        code = 0x10000 + ((code - 0xd800) << 10) + (self._hex4() - 0xdc00)
+                    if keep:
+                        parts.append(chr(code).encode())
+                elif keep:
+                    parts.append(_ESCAPES.get(c, b""))
+                continue
+            if end < 0:
+                if keep:
+                    parts.append(buf[self.pos:])
+                self.pos = len(buf)
+                continue
+            if keep:
+                parts.append(buf[self.pos:end])
+            self.pos = end + 1
+            return b"".join(parts).decode() if keep else None
+
+    def _hex4(self):
+        return int(bytes([self._raw() for i in range(4)]), 16)
+
+    def _scalar(self, first, keep=True):
+        # Reads a number, true, false or null starting with byte `first`
+        chars = bytearray([first])
+        while True:
+            if self.pos >= len(self.buf):
+                self._fill()
+            c = self.buf[self.pos]
+            if c in _SCALAR_END:
+                break
+            chars.append(c)
+            self.pos += 1
+        if not keep:
+            return None
+        text = chars.decode()
+        if text == "true":
+            return True
+        if text == "false":
+            return False
+        if text == "null":
+            return None
+        if "." in text or "e" in text or "E" in text:
+            return float(text)
+        return int(text)
+
+    def _value(self):
+        # Reads and builds the next value
+        c = self._take()
+        if c == _QUOTE:
+            return self._string()
+        if c == _LBRACE:
+            obj = {}
+            if self._peek() == _RBRACE:
+                self.pos += 1
+                return obj
+            while True:
+                self._expect(_QUOTE)
+                key = self._string()
+                self._expect(_COLON)
+                obj[key] = self._value()
+                c = self._take()
+                if c == _RBRACE:
+                    return obj
+                if c != _COMMA:
+                    raise ValueError("invalid JSON object")
+        if c == _LBRACKET:
+            items = []
+            if self._peek() == _RBRACKET:
+                self.pos += 1
+                return items
+            while True:
+                items.append(self._value())
+                c = self._take()
+                if c == _RBRACKET:
+                    return items
+                if c != _COMMA:
+                    raise ValueError("invalid JSON list")
+        return self._scalar(c)
+
+    def _skip(self):
+        # Reads the next value without building it
+        c = self._take()
+        if c == _QUOTE:
+            self._string(False)
+            return
+        if c != _LBRACE and c != _LBRACKET:
+            self._scalar(c, False)
+            return
+        depth = 1
+        while depth:
+            if self.pos >= len(self.buf):
+                self._fill()
+            c = self.buf[self.pos]
+            self.pos += 1
+            if c == _QUOTE:
+                self._string(False)
+            elif c == _LBRACE or c == _LBRACKET:
+                depth += 1
+            elif c == _RBRACE or c == _RBRACKET:
+                depth -= 1
+
+    def _walk(self, path, patterns):
+        # Yields the matches inside the value at `path`, descending only into
+        # containers that can hold one
+        depth = len(path)
+        inside = False
+        for name, pattern in patterns:
+            if len(pattern) < depth or not _matches(pattern, path):
+                continue
+            if len(pattern) == depth:
+                yield name, self._value()
+                return
+            inside = True
+        if not inside:
+            self._skip()
+            return
+        c = self._peek()
+        if c == _LBRACE:
+            self.pos += 1
+            if self._peek() == _RBRACE:
+                self.pos += 1
+                return
+            while True:
+                self._expect(_QUOTE)
+                path.append(self._string())
+                self._expect(_COLON)
+                yield from self._walk(path, patterns)
+                path.pop()
+                c = self._take()
+                if c == _RBRACE:
+                    return
+                if c != _COMMA:
+                    raise ValueError("invalid JSON object")
+        elif c == _LBRACKET:
+            self.pos += 1
+            if self._peek() == _RBRACKET:
+                self.pos += 1
+                return
+            index = 0
+            while True:
+                path.append(index)
+                yield from self._walk(path, patterns)
+                path.pop()
+                index += 1
+                c = self._take()
+                if c == _RBRACKET:
+                    return
+                if c != _COMMA:
+                    raise ValueError("invalid JSON list")
+        else:
+            self._skip()
+
+
+def _matches(pattern, path):
+    # True if path matches the start of pattern
+    for i in range(len(path)):
+        part = pattern[i]
+        if part == ANY:
+            if type(path[i]) is not int:
+                return False
+        elif part != path[i]:
+            return False
+    return True
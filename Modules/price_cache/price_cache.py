@@ -0,0 +1,57 @@
+# In memory price cache shared by the tracking screens.
+#
+# Every price received (requested or streamed) is put in the cache with the
+# time it arrived. get() returns it while it's younger than ttl_ms, so a
+# screen asking for a symbol another screen has just fetched doesn't request
+# it again. last() returns it whatever its age, for screens to draw the last
+# known price at once when they open, and to fall back on when a request
+# fails.
+#
+# Typical use:
+#
+#   cache = PriceCache(ttl_ms=2000)
+#   data = cache.get("BTCUSDT")
+#   if data is None:
+#       data = requestTicker("BTCUSDT")
+#       cache.put("BTCUSDT", data)
+
+import utime
+
+
+class PriceCache:
+
+    def __init__(self, ttl_ms=2000):
+        self.ttl_ms = ttl_ms
+        # symbol: (data, ticks_ms() it arrived)
+        self.entries = {}
+        # get() calls answered from the cache and not
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, symbol, data):
+        self.entries[symbol] = (data, utime.ticks_ms())
+
+    def get(self, symbol, max_age_ms=None):
+        # Returns the data of symbol if it's younger than max_age_ms (ttl_ms
+        # by default), None otherwise
+        entry = self.entries.get(symbol)
+        if max_age_ms is None:
+            max_age_ms = self.ttl_ms
+        if entry is None or utime.ticks_diff(utime.ticks_ms(), entry[1]) > max_age_ms:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def last(self, symbol):
+        # Returns the last data of symbol, however old, or None
+        entry = self.entries.get(symbol)
+        return None if entry is None else entry[0]
+
+    def age_ms(self, symbol):
+        # Milliseconds since symbol's data arrived, None if there is none
+        entry = self.entries.get(symbol)
+        return None if entry is None else utime.ticks_diff(utime.ticks_ms(), entry[1])
+
+    def forget(self, symbol):
+        self.entries.pop(symbol, None)
@@ -0,0 +1,127 @@
+# Request scheduler that keeps each api host under its rate limit.
+#
+# Every host gets a budget of request weight per window (6000 per minute for
+# Binance, a few calls per minute for the free CoinGecko api). acquire() is
+# called before each request with its weight and:
+#
+# - spaces requests out so the budget lasts the whole window, waiting up to
+#   max_wait_ms when a request comes too soon after the previous one
+# - defers low priority requests (coin lists, exchangeInfo) while less than
+#   `reserve` of the budget is left, so prices keep coming
+# - holds every request back while the host asked to wait (Retry-After, or a
+#   429/418 without it)
+#
+# A request that can't go out in time raises Deferred instead of blocking.
+# update() is called with each response: the weight the host reports as used
+# (X-MBX-USED-WEIGHT-1M) replaces the local count.
+#
+# Typical use:
+#
+#   limiter = RateLimiter()
+#   limiter.limit("api.binance.com", 6000)
+#   limiter.acquire("api.binance.com", weight=2)
+#   response = http.get(url)
+#   limiter.update("api.binance.com", response.status_code, response.headers)
+
+import utime
+
+
+class Deferred(OSError):
+    pass
+
+
+class RateLimiter:
+
+    def __init__(self, max_wait_ms=2000, reserve=0.5, block_ms=60000, wait=None):
+        self.max_wait_ms = max_wait_ms
+        self.reserve = reserve
+        # How long a host is left alone after a 429 without a Retry-After in
+        # seconds
+        self.block_ms = block_ms
+        self.wait = wait or utime.sleep_ms
+        # host: [budget, window_ms, used, window start, blocked until or
+        # None, earliest next request]
+        self.hosts = {}
+        # Requests let through, waits for spacing and requests deferred
+        self.sent = 0
+        self.waits = 0
+        self.deferred = 0
+
+    def limit(self, host, budget, window_ms=60000):
+        now = utime.ticks_ms()
+        self.hosts[host] = [budget, window_ms, 0, now, None, now]
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            # Hosts without a limit are only held back by Retry-After
+            self.limit(host, 1 << 30)
+            state = self.hosts[host]
+        now = utime.ticks_ms()
+        if utime.ticks_diff(now, state[3]) >= state[1]:
+            state[2] = 0
+            state[3] = now
+        if state[4] is not None and utime.ticks_diff(now, state[4]) >= 0:
+            state[4] = None
+        return state
+
+    def left(self, host):
+        # Weight left in the current window
+        state = self._state(host)
+        return state[0] - state[2]
+
+    def _delay(self, host, weight, low):
+        # Returns (ms to wait, True if that's only to space requests out)
+        state = self._state(host)
+        now = utime.ticks_ms()
+        if state[4] is not None:
+            return utime.ticks_diff(state[4], now), False
+        left = state[0] - state[2]
+        if left < weight or (low and left - weight < state[0] * self.reserve):
+            # Until the window starts again
+            return max(utime.ticks_diff(utime.ticks_add(state[3], state[1]), now), 1), False
+        return max(utime.ticks_diff(state[5], now), 0), True
+
+    def delay_ms(self, host, weight=1, low=False):
+        # How long a request has to wait before it can be sent
+        return self._delay(host, weight, low)[0]
+
+    def acquire(self, host, weight=1, low=False):
+        # Waits until the request can be sent, raises Deferred if that's
+        # longer than max_wait_ms or the budget holds it back
+        delay, paced = self._delay(host, weight, low)
+        if delay > 0:
+            if not paced or delay > self.max_wait_ms:
+                self.deferred += 1
+                raise Deferred("{} busy for {} ms".format(host, delay))
+            self.waits += 1
+            if self.wait(delay):
+                self.deferred += 1
+                raise Deferred("request to {} cancelled".format(host))
+        state = self._state(host)
+        now = utime.ticks_ms()
+        state[2] += weight
+        # The next request goes out once this one's share of the window passed
+        state[5] = utime.ticks_add(now, weight * state[1] // state[0])
+        self.sent += 1
+
+    def update(self, host, status, headers):
+        # Takes the used weight and Retry-After from a response
+        state = self._state(host)
+        used = headers.get("x-mbx-used-weight-1m")
+        if used is not None:
+            state[2] = int(used)
+        after = headers.get("retry-after")
+        if after is not None:
+            # Seconds, or an HTTP date that isn't worth parsing here: the
+            # host is then left alone for block_ms
+            try:
+                block_ms = int(after) * 1000
+            except ValueError:
+                block_ms = self.block_ms
+        elif status == 429 or status == 418:
+            block_ms = self.block_ms
+        else:
+            return
+        state[4] = utime.ticks_add(utime.ticks_ms(), block_ms)
+        print("Rate limited by {}, waiting {} s".format(host, block_ms // 1000))
@@ -0,0 +1,77 @@
+# Per symbol refresh scheduler that polls fast moving prices more often than
+# quiet ones.
+#
+# Every price received is passed to observe(). The scheduler keeps a moving
+# average of how fast each symbol's price changes (relative change per
+# second, the newest ticks weighing `alpha`) and schedules its next refresh
+# for when the price is expected to have moved by `change` (0.05% by
+# default), kept between min_ms and max_ms. A stablecoin pair that doesn't
+# move drifts to max_ms, a symbol in a fast market to min_ms, and the first
+# big move of a quiet symbol brings its interval down at once.
+#
+# Typical use:
+#
+#   refresh = RefreshScheduler(min_ms=2000, max_ms=30000)
+#   while True:
+#       if refresh.due("BTCUSDT"):
+#           refresh.observe("BTCUSDT", requestPrice("BTCUSDT"))
+
+import utime
+
+
+class RefreshScheduler:
+
+    def __init__(self, min_ms=2000, max_ms=30000, change=0.0005, alpha=0.3,
+                 start_ms=5000):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.change = change
+        self.alpha = alpha
+        # Interval until a symbol has a change rate
+        self.start_ms = start_ms
+        # symbol: [last price or None, ticks_ms() of it, change rate per ms
+        # or None, ticks_ms() of the next refresh]
+        self.symbols = {}
+
+    def due(self, symbol):
+        # True when symbol should be refreshed, always for new symbols
+        state = self.symbols.get(symbol)
+        return state is None or utime.ticks_diff(utime.ticks_ms(), state[3]) >= 0
+
+    def next_ms(self, symbol):
+        # Milliseconds until symbol's next refresh
+        state = self.symbols.get(symbol)
+        if state is None:
+            return 0
+        return max(utime.ticks_diff(state[3], utime.ticks_ms()), 0)
+
+    def interval_ms(self, symbol):
+        # Current refresh interval of symbol
+        state = self.symbols.get(symbol)
+        if state is None or state[2] is None:
+            return min(max(self.start_ms, self.min_ms), self.max_ms)
+        if state[2] <= 0:
+            return self.max_ms
+        return min(max(int(self.change / state[2]), self.min_ms), self.max_ms)
+
+    def observe(self, symbol, price=None):
+        # Records a price of symbol and schedules its next refresh. Without a
+        # price (the request failed) the refresh is only put off.
+        now = utime.ticks_ms()
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = [price, now, None, now]
+        elif price is not None:
+            elapsed = utime.ticks_diff(now, state[1])
+            if elapsed > 0 and state[0]:
+                rate = abs(price - state[0]) / state[0] / elapsed
+                if state[2] is None:
+                    state[2] = rate
+                else:
+                    state[2] += self.alpha * (rate - state[2])
+            state[0] = price
+            state[1] = now
+        state[3] = utime.ticks_add(now, self.interval_ms(symbol))
+
+    def forget(self, symbol):
+        self.symbols.pop(symbol, None)
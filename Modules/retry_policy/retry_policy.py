@@ -0,0 +1,111 @@
+# Retry policy shared by the api requests: a few attempts with exponential
+# backoff and jitter, and a circuit breaker per host.
+#
+# A request that fails is tried again after base_ms, then twice as long each
+# time up to max_ms, with up to jitter of every delay taken off at random so
+# devices don't retry in step. After `failures` requests in a row have failed
+# the host's circuit opens: requests to it fail at once with CircuitOpen for
+# open_ms, then a single attempt is let through and closes the circuit again
+# if it works.
+#
+# Errors of the types in `fatal` (like a request the rate limiter held back)
+# are raised at once, without retries and without counting against the host.
+#
+# The delays go through wait(ms), utime.sleep_ms by default. A wait that
+# returns something true (like the Rotary wait() when the knob turns) gives
+# up on the request early: the last error is raised, but a request the user
+# cancelled doesn't count against the host.
+#
+# Typical use:
+#
+#   retry = RetryPolicy()
+#   price = retry.call("api.binance.com", requestTicker, ("BTCUSDT",))
+
+import random
+import utime
+
+
+class CircuitOpen(OSError):
+    pass
+
+
+def host_of(url):
+    # "https://api.binance.com/api/v3/..." -> "api.binance.com"
+    rest = url.split("://", 1)[-1]
+    return rest.split("/", 1)[0]
+
+
+class RetryPolicy:
+
+    def __init__(self, attempts=3, base_ms=500, max_ms=8000, jitter=0.5,
+                 failures=3, open_ms=30000, wait=None, fatal=()):
+        self.attempts = attempts
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.jitter = jitter
+        self.failures = failures
+        self.open_ms = open_ms
+        self.wait = wait or utime.sleep_ms
+        self.fatal = fatal
+        # host: [requests failed in a row, ticks_ms() the circuit opened or None]
+        self.hosts = {}
+        # Attempts made, retries among them, and requests refused by an open
+        # circuit
+        self.calls = 0
+        self.retries = 0
+        self.refused = 0
+
+    def delay_ms(self, retry):
+        # Backoff before retry number `retry` (1 for the first one)
+        delay = min(self.base_ms << (retry - 1), self.max_ms)
+        return delay - int(delay * self.jitter * random.getrandbits(16) / 65536)
+
+    def is_open(self, host):
+        # True while requests to host are refused
+        state = self.hosts.get(host)
+        if state is None or state[1] is None:
+            return False
+        return utime.ticks_diff(utime.ticks_ms(), state[1]) < self.open_ms
+
+    def call(self, host, func, args=()):
+        # Returns func(*args), trying again when it raises. Raises CircuitOpen
+        # when the host's circuit is open and the last error when every
+        # attempt failed.
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = [0, None]
+        attempts = self.attempts
+        if state[1] is not None:
+            if self.is_open(host):
+                self.refused += 1
+                raise CircuitOpen("circuit open for " + host)
+            # Half open, one attempt decides
+            attempts = 1
+        retry = 0
+        while True:
+            self.calls += 1
+            try:
+                value = func(*args)
+                break
+            except Exception as e:
+                if isinstance(e, self.fatal):
+                    raise e
+                retry += 1
+                if retry >= attempts:
+                    state[0] += 1
+                    if state[1] is not None or state[0] >= self.failures:
+                        state[1] = utime.ticks_ms()
+                        print("Circuit open for", host)
+                    raise e
+                if self._wait(e, self.delay_ms(retry)):
+                    # Cancelled, the host didn't fail often enough to count
+                    raise e
+                self.retries += 1
+        state[0] = 0
+        state[1] = None
+        return value
+
+    def _wait(self, error, delay):
+        # Waits before the next attempt, True to give up
+        print("Request failed ({}), retrying in {} ms".format(error, delay))
+        return self.wait(delay)
@@ -0,0 +1,179 @@
+# Interrupt driven push button for the ESP32, used next to RotaryIRQ for the
+# encoder's switch.
+#
+# Every edge on the pin (re)starts a one shot timer, the level is only read
+# once the contacts have been quiet for debounce_ms. Debounced presses and
+# releases are queued with their time in a ring buffer by the timer callback.
+# get_event()/wait() turn them into gestures without blocking:
+#
+#   PRESS    the button went down
+#   RELEASE  the button went up
+#   CLICK    a short press, reported once double_ms passed without a second
+#            press (right on release when double_ms is 0)
+#   LONG     the button has been held for long_ms, reported while still held
+#   DOUBLE   a second press within double_ms of a short press' release
+#
+# Typical use:
+#
+#   btn = ButtonIRQ(34, timer=Timer(1))
+#   ev = btn.wait(20)
+#   if ev == btn.CLICK: ...
+#   elif ev == btn.LONG: ...
+
+import utime
+from array import array
+from machine import Pin, Timer
+
+_RAW_PRESS = const(1)
+_RAW_RELEASE = const(2)
+
+
+class ButtonIRQ(object):
+
+    PRESS = const(1)
+    RELEASE = const(2)
+    CLICK = const(3)
+    LONG = const(4)
+    DOUBLE = const(5)
+
+    def __init__(self, pin_num, active_low=False, pull_up=False, debounce_ms=20,
+                 long_ms=800, double_ms=300, timer=None, event_buffer=16):
+        self.debounce_ms = debounce_ms
+        self.long_ms = long_ms
+        self.double_ms = double_ms
+        self._active = 0 if active_low else 1
+        if pull_up:
+            self._pin = Pin(pin_num, Pin.IN, Pin.PULL_UP)
+        else:
+            self._pin = Pin(pin_num, Pin.IN)
+        self._timer = Timer(1) if timer is None else timer
+        # Ring buffer of debounced edges written by the timer callback, the
+        # kind and the ticks_ms() it was seen at. One slot is kept free to
+        # tell a full buffer from an empty one.
+        self._raw_kind = array('b', [0] * (event_buffer + 1))
+        self._raw_time = array('i', [0] * (event_buffer + 1))
+        self._raw_size = event_buffer + 1
+        self._raw_head = 0
+        self._raw_tail = 0
+        self._raw_overflow = 0
+        self._stable = self._pin.value() == self._active
+        # Gesture state, only touched by the reader
+        self._out = []
+        self._held = self._stable
+        self._press_time = 0
+        self._release_time = 0
+        self._long_sent = False
+        self._second = False
+        self._clicks = 0
+        self._enable_irq()
+
+    def _enable_irq(self):
+        self._pin.irq(trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING,
+                      handler=self._edge)
+
+    def _edge(self, pin):
+        # Restarts the debounce window on every bounce
+        self._timer.init(mode=Timer.ONE_SHOT, period=self.debounce_ms,
+                         callback=self._settle)
+
+    def _settle(self, timer):
+        pressed = self._pin.value() == self._active
+        if pressed == self._stable:
+            return
+        self._stable = pressed
+        head = self._raw_head
+        next_head = (head + 1) % self._raw_size
+        if next_head == self._raw_tail:
+            self._raw_overflow += 1
+            return
+        self._raw_kind[head] = _RAW_PRESS if pressed else _RAW_RELEASE
+        self._raw_time[head] = utime.ticks_ms()
+        self._raw_head = next_head
+
+    def pressed(self):
+        # Returns the debounced state of the button
+        return self._stable
+
+    def close(self):
+        self._pin.irq(handler=None)
+        self._timer.deinit()
+
+    def clear_events(self):
+        self._raw_tail = self._raw_head
+        self._raw_overflow = 0
+        self._out = []
+        self._held = self._stable
+        self._long_sent = self._held
+        self._second = False
+        self._clicks = 0
+
+    def get_event(self):
+        # Returns the oldest gesture event, or 0 if there is none
+        if not self._out:
+            self._update()
+            if not self._out:
+                return 0
+        return self._out.pop(0)
+
+    def wait(self, timeout_ms=-1, poll_ms=10):
+        # Blocks until an event arrives, or timeout_ms pass. Returns the event
+        # or 0 on timeout. Checks every poll_ms, like Rotary.wait(): a sleep
+        # shorter than a FreeRTOS tick (10 ms) spins on the ESP32.
+        start = utime.ticks_ms()
+        while True:
+            ev = self.get_event()
+            if ev:
+                return ev
+            if timeout_ms < 0:
+                utime.sleep_ms(poll_ms)
+                continue
+            left = timeout_ms - utime.ticks_diff(utime.ticks_ms(), start)
+            if left <= 0:
+                return 0
+            utime.sleep_ms(min(left, poll_ms))
+
+    def _update(self):
+        # Turns the queued edges into gestures, then reports the long press
+        # and click whose deadline passed
+        while self._raw_tail != self._raw_head:
+            tail = self._raw_tail
+            kind = self._raw_kind[tail]
+            now = self._raw_time[tail]
+            self._raw_tail = (tail + 1) % self._raw_size
+            if kind == _RAW_PRESS:
+                self._pressed(now)
+            else:
+                self._released(now)
+        self._deadlines(utime.ticks_ms())
+
+    def _deadlines(self, now):
+        if (self._held and not self._long_sent and not self._second and
+                utime.ticks_diff(now, self._press_time) >= self.long_ms):
+            self._long_sent = True
+            self._out.append(self.LONG)
+        if self._clicks and utime.ticks_diff(now, self._release_time) > self.double_ms:
+            self._clicks = 0
+            self._out.append(self.CLICK)
+
+    def _pressed(self, now):
+        self._deadlines(now)
+        self._out.append(self.PRESS)
+        self._held = True
+        self._press_time = now
+        self._long_sent = False
+        self._second = bool(self._clicks)
+        if self._second:
+            self._clicks = 0
+            self._out.append(self.DOUBLE)
+
+    def _released(self, now):
+        self._deadlines(now)
+        self._out.append(self.RELEASE)
+        self._held = False
+        self._release_time = now
+        if self._second or self._long_sent:
+            self._second = False
+        elif self.double_ms:
+            self._clicks = 1
+        else:
+            self._out.append(self.CLICK)
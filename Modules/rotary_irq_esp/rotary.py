@@ -8,6 +8,8 @@
 #   https://github.com/MikeTeachman/micropython-rotary
 
 import micropython
+import utime
+from array import array
 
 _DIR_CW = const(0x10)  # Clockwise step
 _DIR_CCW = const(0x20)  # Counter-clockwise step
@@ -36,13 +38,15 @@ _transition_table = [
     [_R_CCW_2, _R_START, _R_CCW_3, _R_START | _DIR_CCW],  # _R_CCW_3
     [_R_START, _R_START, _R_START, _R_START]]             # _R_ILLEGAL
 
+# Same CLK/DT order as the full step table, so a clockwise turn is reported
+# as _DIR_CW by both
 _transition_table_half_step = [
     [_R_CW_3,            _R_CW_2,  _R_CW_1,  _R_START],
-    [_R_CW_3 | _DIR_CCW, _R_START, _R_CW_1,  _R_START],
-    [_R_CW_3 | _DIR_CW,  _R_CW_2,  _R_START, _R_START],
+    [_R_CW_3 | _DIR_CW,  _R_START, _R_CW_1,  _R_START],
+    [_R_CW_3 | _DIR_CCW, _R_CW_2,  _R_START, _R_START],
     [_R_CW_3,            _R_CCW_2, _R_CCW_1, _R_START],
-    [_R_CW_3,            _R_CW_2,  _R_CCW_1, _R_START | _DIR_CW],
-    [_R_CW_3,            _R_CCW_2, _R_CW_3,  _R_START | _DIR_CCW]]
+    [_R_CW_3,            _R_CW_2,  _R_CCW_1, _R_START | _DIR_CCW],
+    [_R_CW_3,            _R_CCW_2, _R_CW_3,  _R_START | _DIR_CW]]
 
 _STATE_MASK = const(0x07)
 _DIR_MASK = const(0x30)
@@ -62,6 +66,12 @@ def _bound(value, incr, lower_bound, upper_bound):
     return min(upper_bound, max(lower_bound, value + incr))
 
 
+def _accel_span(min_val, max_val):
+    # Largest accelerated step for a range, so that short menus keep moving
+    # one item per detent
+    return max(1, (max_val - min_val) // 8)
+
+
 def _trigger(rotary_instance):
     for listener in rotary_instance._listener:
         listener()
@@ -73,7 +83,8 @@ class Rotary(object):
     RANGE_WRAP = const(2)
     RANGE_BOUNDED = const(3)
 
-    def __init__(self, min_val, max_val, reverse, range_mode, half_step):
+    def __init__(self, min_val, max_val, reverse, range_mode, half_step, event_buffer=16,
+                 accel=1, accel_us=40000):
         self._min_val = min_val
         self._max_val = max_val
         self._reverse = -1 if reverse else 1
@@ -82,9 +93,25 @@ class Rotary(object):
         self._state = _R_START
         self._half_step = half_step
         self._listener = []
+        # Ring buffer of step events written by the ISR, read by
+        # get_event()/drain() and waited for by wait(). One slot is kept free
+        # to tell a full buffer from an empty one, steps that don't fit are
+        # counted in _ev_overflow.
+        self._ev_buf = array('h', [0] * (event_buffer + 1))
+        self._ev_size = event_buffer + 1
+        self._ev_head = 0
+        self._ev_tail = 0
+        self._ev_overflow = 0
+        # Acceleration: a detent that comes less than _accel_us after the
+        # previous one in the same direction moves the value by
+        # _accel_us / interval, up to _accel times. accel=1 turns it off.
+        self._accel = accel
+        self._accel_us = accel_us
+        self._last_us = utime.ticks_us()
+        self._last_dir = 0
 
     def set(self, value=None, min_val=None,
-            max_val=None, reverse=None, range_mode=None):
+            max_val=None, reverse=None, range_mode=None, accel=None, accel_us=None):
         # disable DT and CLK pin interrupts
         self._hal_disable_irq()
 
@@ -98,7 +125,13 @@ class Rotary(object):
             self._reverse = -1 if reverse else 1
         if range_mode is not None:
             self._range_mode = range_mode
+        if accel is not None:
+            self._accel = accel
+        if accel_us is not None:
+            self._accel_us = accel_us
+        self._last_dir = 0
         self._state = _R_START
+        self._ev_tail = self._ev_head
 
         # enable DT and CLK pin interrupts
         self._hal_enable_irq()
@@ -112,6 +145,69 @@ class Rotary(object):
     def close(self):
         self._hal_close()
 
+    def events(self):
+        # Returns the number of step events waiting to be read
+        return (self._ev_head - self._ev_tail) % self._ev_size
+
+    def get_event(self):
+        # Returns the oldest step event (+1 or -1 per detent, after reverse),
+        # or 0 if there is none
+        tail = self._ev_tail
+        if tail == self._ev_head:
+            return 0
+        incr = self._ev_buf[tail]
+        self._ev_tail = (tail + 1) % self._ev_size
+        return incr
+
+    def drain(self):
+        # Reads every waiting step event and returns their sum
+        total = 0
+        while self._ev_tail != self._ev_head:
+            total += self.get_event()
+        return total
+
+    def clear_events(self):
+        self._ev_tail = self._ev_head
+        self._ev_overflow = 0
+
+    def wait(self, timeout_ms=-1, poll_ms=10):
+        # Blocks until at least one step event is waiting, or timeout_ms pass.
+        # Returns the number of events waiting, 0 on timeout. The events are
+        # left in the buffer: drain() gives their direction, and a turn that
+        # cut a wait short is still seen by whoever reads them next (steps
+        # that cancel each other out don't look like a timeout).
+        # The buffer is checked every poll_ms. Sleeping a whole FreeRTOS tick
+        # (10 ms) hands the CPU over, a shorter sleep on the ESP32 spins.
+        start = utime.ticks_ms()
+        while self._ev_tail == self._ev_head:
+            if timeout_ms < 0:
+                utime.sleep_ms(poll_ms)
+                continue
+            left = timeout_ms - utime.ticks_diff(utime.ticks_ms(), start)
+            if left <= 0:
+                return 0
+            utime.sleep_ms(min(left, poll_ms))
+        return self.events()
+
+    def _accelerate(self, incr):
+        # Scales a detent by how soon it followed the previous one
+        now = utime.ticks_us()
+        interval = utime.ticks_diff(now, self._last_us)
+        self._last_us = now
+        if incr != self._last_dir:
+            self._last_dir = incr
+            return incr
+        if interval >= self._accel_us:
+            return incr
+        scale = self._accel_us // max(interval, 1)
+        if scale > self._accel:
+            scale = self._accel
+        if self._range_mode != self.RANGE_UNBOUNDED:
+            span = _accel_span(self._min_val, self._max_val)
+            if scale > span:
+                scale = span
+        return incr * scale
+
     def add_listener(self, l):
         self._listener.append(l)
 
@@ -141,6 +237,17 @@ class Rotary(object):
 
         incr *= self._reverse
 
+        if incr:
+            head = self._ev_head
+            next_head = (head + 1) % self._ev_size
+            if next_head != self._ev_tail:
+                self._ev_buf[head] = incr
+                self._ev_head = next_head
+            else:
+                self._ev_overflow += 1
+            if self._accel > 1:
+                incr = self._accelerate(incr)
+
         if self._range_mode == self.RANGE_WRAP:
             self._value = _wrap(
                 self._value,
@@ -15,33 +15,73 @@ from sys import platform
 _esp8266_deny_pins = [16]
 
 
+def _check_pins(pin_num_clk, pin_num_dt):
+    if platform == 'esp8266':
+        if pin_num_clk in _esp8266_deny_pins:
+            raise ValueError(
+                '%s: Pin %d not allowed. Not Available for Interrupt: %s' %
+                (platform, pin_num_clk, _esp8266_deny_pins))
+        if pin_num_dt in _esp8266_deny_pins:
+            raise ValueError(
+                '%s: Pin %d not allowed. Not Available for Interrupt: %s' %
+                (platform, pin_num_dt, _esp8266_deny_pins))
+
+
 class RotaryIRQ(Rotary):
 
     def __init__(self, pin_num_clk, pin_num_dt, min_val=0, max_val=10,
-                 reverse=False, range_mode=Rotary.RANGE_UNBOUNDED, pull_up=False, half_step=False):
-
-        if platform == 'esp8266':
-            if pin_num_clk in _esp8266_deny_pins:
-                raise ValueError(
-                    '%s: Pin %d not allowed. Not Available for Interrupt: %s' %
-                    (platform, pin_num_clk, _esp8266_deny_pins))
-            if pin_num_dt in _esp8266_deny_pins:
-                raise ValueError(
-                    '%s: Pin %d not allowed. Not Available for Interrupt: %s' %
-                    (platform, pin_num_dt, _esp8266_deny_pins))
-
-        super().__init__(min_val, max_val, reverse, range_mode, half_step)
-
-        if pull_up == True:
-            self._pin_clk = Pin(pin_num_clk, Pin.IN, Pin.PULL_UP)
-            self._pin_dt = Pin(pin_num_dt, Pin.IN, Pin.PULL_UP)
-        else:
-            self._pin_clk = Pin(pin_num_clk, Pin.IN)
-            self._pin_dt = Pin(pin_num_dt, Pin.IN)
+                 reverse=False, range_mode=Rotary.RANGE_UNBOUNDED, pull_up=False, half_step=False,
+                 event_buffer=16, accel=1, accel_us=40000):
+
+        _check_pins(pin_num_clk, pin_num_dt)
+
+        super().__init__(min_val, max_val, reverse, range_mode, half_step, event_buffer,
+                         accel, accel_us)
+
+        self._pull_up = pull_up
+        self._pin_num_clk = pin_num_clk
+        self._pin_num_dt = pin_num_dt
+        self._pin_clk = self._make_pin(pin_num_clk)
+        self._pin_dt = self._make_pin(pin_num_dt)
 
         self._enable_clk_irq(self._process_rotary_pins)
         self._enable_dt_irq(self._process_rotary_pins)
 
+    def _make_pin(self, pin_num):
+        if self._pull_up == True:
+            return Pin(pin_num, Pin.IN, Pin.PULL_UP)
+        return Pin(pin_num, Pin.IN)
+
+    def pins(self):
+        # Returns the (clk, dt) pin numbers in use
+        return self._pin_num_clk, self._pin_num_dt
+
+    def swap_pins(self):
+        # Exchanges the roles of the CLK and DT pins, which reverses the
+        # direction of a live instance. The IRQ handlers are moved, not
+        # added, and no object is allocated.
+        self._hal_disable_irq()
+        self._pin_clk, self._pin_dt = self._pin_dt, self._pin_clk
+        self._pin_num_clk, self._pin_num_dt = self._pin_num_dt, self._pin_num_clk
+        self.set()
+
+    def repin(self, pin_num_clk, pin_num_dt):
+        # Moves a live instance to other pins: the IRQ handlers are detached
+        # from the old pins before being attached to the new ones. Pins that
+        # are already in use are reused.
+        _check_pins(pin_num_clk, pin_num_dt)
+        if (pin_num_clk, pin_num_dt) == (self._pin_num_dt, self._pin_num_clk):
+            self.swap_pins()
+            return
+        self._hal_disable_irq()
+        if pin_num_clk != self._pin_num_clk:
+            self._pin_clk = self._make_pin(pin_num_clk)
+            self._pin_num_clk = pin_num_clk
+        if pin_num_dt != self._pin_num_dt:
+            self._pin_dt = self._make_pin(pin_num_dt)
+            self._pin_num_dt = pin_num_dt
+        self.set()
+
     def _enable_clk_irq(self, callback=None):
         self._pin_clk.irq(
             trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING,
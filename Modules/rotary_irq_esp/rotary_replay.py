@@ -0,0 +1,258 @@
+# Host side (CPython) replay harness for the rotary encoder driver.
+#
+# Generates the CLK/DT waveform of an encoder turning at a given speed, with
+# optional contact bounce and timing jitter, and replays it through RotaryIRQ
+# on stand-in Pin objects. Pin interrupts are modeled the way MicroPython
+# handles them: an edge marks the pin's IRQ as pending, the handler runs
+# after the interrupt latency once the CPU is free, reads both pins as they
+# are at that moment and keeps the CPU busy for isr_us. Further edges on a
+# pin whose IRQ is still pending are merged into it.
+#
+# Every run reports the detents the waveform contains, the steps the driver
+# reported (missed ones and spurious ones in the wrong direction or in
+# excess), and the host time spent per ISR call.
+#
+# Time is virtual: `clock` only moves as the replay goes, utime.ticks_us()
+# and ticks_ms() read it.
+#
+# Run it with CPython from this directory:
+#
+#   python3 rotary_replay.py [detents] [seed]
+
+import builtins
+import random
+import sys
+import time
+
+# Number of detents per turn of a common mechanical encoder (EC11)
+DETENTS_PER_REV = 20
+# Quadrature states, CLK << 1 | DT, turning clockwise from the 11 rest state
+CW_SEQUENCE = (0b10, 0b00, 0b01, 0b11)
+# Sign of the steps each transition table (by half_step) must report for a
+# clockwise turn: +1 per detent, see Rotary.get_event()
+EXPECTED_SIGN = {False: 1, True: 1}
+
+
+class Clock:
+
+    # Virtual microsecond clock shared with the utime stand-in
+
+    def __init__(self):
+        self.us = 0
+
+
+clock = Clock()
+
+
+def _install_stand_ins():
+    # Provides const(), utime, micropython and the machine.Pin used by the
+    # driver when running on CPython
+    if not hasattr(builtins, "const"):
+        builtins.const = lambda value: value
+    try:
+        import utime
+    except ImportError:
+        utime = type(sys)("utime")
+        utime.ticks_us = lambda: int(clock.us)
+        utime.ticks_ms = lambda: int(clock.us // 1000)
+        utime.ticks_add = lambda ticks, delta: ticks + delta
+        utime.ticks_diff = lambda new, old: new - old
+        utime.sleep_ms = lambda ms: None
+        sys.modules["utime"] = utime
+    try:
+        import micropython
+    except ImportError:
+        micropython = type(sys)("micropython")
+        micropython.schedule = lambda func, arg: func(arg)
+        sys.modules["micropython"] = micropython
+    try:
+        import machine
+    except ImportError:
+        machine = type(sys)("machine")
+        machine.Pin = Pin
+        sys.modules["machine"] = machine
+
+
+class Pin:
+
+    # Stand-in for machine.Pin, its level is set by the replay
+
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+
+    def __init__(self, id, mode=-1, pull=-1):
+        self.id = id
+        self.level = 1
+        self.handler = None
+
+    def value(self):
+        return self.level
+
+    def irq(self, trigger=3, handler=None):
+        self.handler = handler
+
+
+_install_stand_ins()
+
+from rotary_irq_esp import RotaryIRQ
+
+
+def waveform(detents, rpm, half_step=False, bounce_us=0, bounces=0,
+             jitter=0.0, rng=random):
+    # Returns the edges of turning `detents` detents (clockwise if positive)
+    # at `rpm`, as a sorted list of (time_us, clk, dt) port states.
+    #
+    # bounce_us and bounces add up to `bounces` extra toggles in the
+    # bounce_us following each edge. jitter moves every transition by up to
+    # that fraction of the time between transitions.
+    per_detent = 2 if half_step else 4
+    period = 60000000 / (rpm * DETENTS_PER_REV * per_detent)
+    sequence = CW_SEQUENCE if detents > 0 else tuple(reversed(CW_SEQUENCE[:3])) + (0b11,)
+    state = 0b11
+    changes = []
+    for i in range(abs(detents) * per_detent):
+        new = sequence[i % 4]
+        t = (i + 1) * period + rng.uniform(-jitter, jitter) * period
+        # Only one of the two lines changes per transition
+        pin = 1 if (new ^ state) & 0b10 else 0
+        level = (new >> pin) & 1
+        changes.append((t, pin, level))
+        for n in range(rng.randint(0, bounces) if bounce_us else 0):
+            changes.append((t + rng.uniform(0, bounce_us), pin, level ^ 1 ^ (n & 1)))
+        if bounce_us and bounces:
+            changes.append((t + bounce_us, pin, level))
+        state = new
+    changes.sort()
+    # Turn the line changes into port states
+    edges = []
+    levels = [1, 1]
+    for t, pin, level in changes:
+        if levels[pin] == level:
+            continue
+        levels[pin] = level
+        edges.append((t, levels[1], levels[0]))
+    return edges
+
+
+def replay(edges, half_step=False, latency_us=20, latency_jitter_us=0,
+           isr_us=30, rng=random, **kwargs):
+    # Replays the edges through a fresh RotaryIRQ and returns (rotary,
+    # stats) where stats has the ISR calls and the host time they took.
+    # Extra keyword arguments go to RotaryIRQ.
+    rotary = RotaryIRQ(pin_num_clk=15, pin_num_dt=4, min_val=0, max_val=0,
+                       half_step=half_step, event_buffer=len(edges) + 1,
+                       **kwargs)
+    pins = (rotary._pin_dt, rotary._pin_clk)
+    pending = []
+    cpu_free = 0
+    calls = 0
+    host_ns = 0
+    edges = list(edges) + [(float("inf"), None, None)]
+    for t, clk, dt in edges:
+        # Run the interrupts due before this edge, in the order they fired
+        while pending:
+            due, pin = pending[0]
+            start = max(due, cpu_free)
+            if start > t:
+                break
+            pending.pop(0)
+            clock.us = start
+            handler = pin.handler
+            if handler is not None:
+                begin = time.perf_counter_ns()
+                handler(pin)
+                host_ns += time.perf_counter_ns() - begin
+                calls += 1
+            cpu_free = start + isr_us
+        if clk is None:
+            break
+        for pin, level in zip(pins, (dt, clk)):
+            if pin.level != level:
+                pin.level = level
+                if all(pin is not other for due, other in pending):
+                    due = t + latency_us + rng.uniform(0, latency_jitter_us)
+                    pending.append((due, pin))
+    return rotary, {"calls": calls, "host_us": host_ns / 1000 / max(calls, 1)}
+
+
+def direction(half_step=False):
+    # Returns the sign of the steps the driver reports for a slow, clean
+    # clockwise turn with the given transition table, raising AssertionError
+    # if it isn't EXPECTED_SIGN (an inverted table would otherwise only show
+    # up as every step being spurious)
+    rotary, stats = replay(waveform(4, 10, half_step), half_step)
+    total = rotary.drain()
+    sign = 1 if total > 0 else -1 if total < 0 else 0
+    expected = EXPECTED_SIGN[half_step]
+    assert sign == expected, "the {}-step table reports a clockwise turn of 4 detents as {} steps".format(
+        "half" if half_step else "full", total)
+    return sign
+
+
+def measure(detents, rpm, half_step=False, bounce_us=0, bounces=0, jitter=0.0,
+            latency_us=20, latency_jitter_us=0, isr_us=30, seed=1):
+    # Turns the encoder `detents` detents clockwise and returns a dict with
+    # the reported steps, missed and spurious ones and the ISR cost. Steps
+    # count as forward in the direction the table must report.
+    sign = direction(half_step)
+    rng = random.Random(seed)
+    edges = waveform(detents, rpm, half_step, bounce_us, bounces, jitter, rng)
+    rotary, stats = replay(edges, half_step, latency_us, latency_jitter_us,
+                           isr_us, rng)
+    forward = backward = 0
+    while True:
+        incr = rotary.get_event()
+        if not incr:
+            break
+        if incr * sign > 0:
+            forward += 1
+        else:
+            backward += 1
+    stats.update({
+        "edges": len(edges),
+        "forward": forward,
+        "backward": backward,
+        "missed": max(0, detents - forward),
+        "spurious": backward + max(0, forward - detents),
+    })
+    return stats
+
+
+# (name, measure() keyword arguments)
+SCENARIOS = (
+    ("clean", {}),
+    ("jitter 50%", {"jitter": 0.5}),
+    ("bounce 3x/300us", {"bounce_us": 300, "bounces": 3}),
+    ("bounce 5x/1ms", {"bounce_us": 1000, "bounces": 5}),
+    ("late isr <2ms", {"latency_us": 100, "latency_jitter_us": 2000}),
+    ("all of the above", {"bounce_us": 300, "bounces": 3, "jitter": 0.5,
+                          "latency_jitter_us": 300}),
+)
+RPMS = (60, 300, 600, 1200)
+
+
+def run(detents=200, seed=1):
+    # Measures every scenario at every speed with both transition tables
+    # and prints a table. Returns {(table, scenario, rpm): measure() dict}
+    results = {}
+    print("{} detents per run, {} detents per turn".format(detents, DETENTS_PER_REV))
+    print("{:<6}{:<18}{:>5}{:>8}{:>7}{:>7}{:>10}{:>10}".format(
+        "table", "scenario", "rpm", "edges", "missed", "spur", "isr calls", "isr us"))
+    for half_step in (False, True):
+        table = "half" if half_step else "full"
+        direction(half_step)
+        for name, kwargs in SCENARIOS:
+            for rpm in RPMS:
+                result = measure(detents, rpm, half_step, seed=seed, **kwargs)
+                results[(table, name, rpm)] = result
+                print("{:<6}{:<18}{:>5}{:>8}{:>7}{:>7}{:>10}{:>10.2f}".format(
+                    table, name, rpm, result["edges"], result["missed"],
+                    result["spurious"], result["calls"], result["host_us"]))
+    return results
+
+
+if __name__ == "__main__":
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,232 @@
+# Local catalog of exchange symbols, kept in a sorted index file on flash.
+#
+# The index is a file of fixed size records sorted by symbol: the symbol
+# padded with zero bytes to RECORD - 1 bytes and the length of its base asset
+# in the last byte (the quote asset is the rest of the symbol). Lookups are a
+# binary search over the file, so only a few records are read and nothing is
+# kept in memory.
+#
+# build() takes the (symbol, base asset) pairs one at a time, as they are
+# read from the exchange, and sorts them on flash: runs of run_size records
+# are sorted in memory and written to temporary files, then merged into the
+# index, at most `ways` files at a time so only a few are open at once. The
+# old index is only replaced once the new one is complete, and is moved aside
+# rather than removed first, so a reset at any point leaves one of the two on
+# flash.
+#
+# base_chars() and quote_chars() tell which characters can follow what has
+# been typed of a base or quote asset, for the input screen to offer only
+# those.
+#
+# Typical use:
+#
+#   catalog = SymbolCatalog("catalog.idx")
+#   catalog.build([("ETHBTC", "ETH"), ("BTCUSDT", "BTC")])
+#   catalog.find("BTCUSDT")        # ("BTC", "USDT")
+#   catalog.base_chars("BT")       # ("C", False)
+
+import os
+
+RECORD = 20
+
+
+def _record(symbol, base):
+    symbol = symbol.encode()
+    if len(symbol) >= RECORD or not 0 < len(base) < len(symbol):
+        return None
+    return symbol + bytes(RECORD - 1 - len(symbol)) + bytes([len(base)])
+
+
+def _symbol(record):
+    end = record.find(b"\0")
+    return record[:end if 0 <= end < RECORD - 1 else RECORD - 1]
+
+
+class SymbolCatalog:
+
+    def __init__(self, path="catalog.idx"):
+        self.path = path
+        # A reset during build() can leave only the old index, moved aside,
+        # or the old one next to the new one
+        try:
+            os.stat(self.path)
+        except OSError:
+            try:
+                os.rename(self.path + ".old", self.path)
+            except OSError:
+                pass
+        else:
+            try:
+                os.remove(self.path + ".old")
+            except OSError:
+                pass
+
+    def count(self):
+        # Number of symbols in the index, 0 if there is none
+        try:
+            return os.stat(self.path)[6] // RECORD
+        except OSError:
+            return 0
+
+    def build(self, entries, run_size=128, ways=8):
+        # Replaces the index with the (symbol, base asset) pairs of entries.
+        # Returns the number of symbols written.
+        runs = []
+        run = []
+        try:
+            for symbol, base in entries:
+                record = _record(symbol, base)
+                if record is None:
+                    continue
+                run.append(record)
+                if len(run) >= run_size:
+                    runs.append(self._write_run(run, len(runs)))
+                    run = []
+            if run or not runs:
+                runs.append(self._write_run(run, len(runs)))
+            # Merges the oldest runs into a new one until there are few
+            # enough for the final merge
+            number = len(runs)
+            while len(runs) > ways:
+                group = runs[:ways]
+                runs.append("{}.run{}".format(self.path, number))
+                number += 1
+                self._merge(group, runs[-1])
+                del runs[:ways]
+                for name in group:
+                    try:
+                        os.remove(name)
+                    except OSError:
+                        pass
+            count = self._merge(runs, self.path + ".new")
+        finally:
+            for name in runs:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+        # Not every filesystem renames over an existing file, so the old
+        # index is moved aside and only removed once the new one is in place
+        try:
+            os.rename(self.path, self.path + ".old")
+        except OSError:
+            pass
+        os.rename(self.path + ".new", self.path)
+        try:
+            os.remove(self.path + ".old")
+        except OSError:
+            pass
+        return count
+
+    def _write_run(self, run, number):
+        run.sort()
+        name = "{}.run{}".format(self.path, number)
+        with open(name, "wb") as f:
+            for record in run:
+                f.write(record)
+        return name
+
+    def _merge(self, runs, name):
+        # Merges the sorted runs into name, dropping duplicates
+        files = [open(run, "rb") for run in runs]
+        heads = [f.read(RECORD) for f in files]
+        count = 0
+        last = None
+        try:
+            with open(name, "wb") as out:
+                while True:
+                    low = None
+                    for i in range(len(heads)):
+                        if heads[i] and (low is None or heads[i] < heads[low]):
+                            low = i
+                    if low is None:
+                        break
+                    record = heads[low]
+                    heads[low] = files[low].read(RECORD)
+                    if record != last:
+                        out.write(record)
+                        last = record
+                        count += 1
+        finally:
+            for f in files:
+                f.close()
+        return count
+
+    def _read(self, f, index):
+        f.seek(index * RECORD)
+        return f.read(RECORD)
+
+    def _lower(self, f, prefix):
+        # Index of the first record whose symbol isn't below prefix
+        low = 0
+        high = self.count()
+        while low < high:
+            middle = (low + high) // 2
+            if _symbol(self._read(f, middle)) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _starting(self, prefix):
+        # Yields the records whose symbol starts with prefix, in order
+        prefix = prefix.encode()
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return
+        try:
+            f.seek(self._lower(f, prefix) * RECORD)
+            while True:
+                record = f.read(RECORD)
+                if len(record) < RECORD or not _symbol(record).startswith(prefix):
+                    break
+                yield record
+        finally:
+            f.close()
+
+    def find(self, symbol):
+        # Returns (base asset, quote asset) of symbol, None if it isn't listed
+        key = symbol.encode()
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return None
+        try:
+            record = self._read(f, self._lower(f, key))
+        finally:
+            f.close()
+        if len(record) < RECORD or _symbol(record) != key:
+            return None
+        base = record[RECORD - 1]
+        return symbol[:base], symbol[base:]
+
+    def base_chars(self, prefix):
+        # Returns (characters that can follow prefix in a base asset, True if
+        # prefix is a base asset itself)
+        chars = set()
+        exact = False
+        size = len(prefix)
+        for record in self._starting(prefix):
+            base = record[RECORD - 1]
+            if base == size:
+                exact = True
+            elif base > size:
+                chars.add(record[size])
+        return "".join(sorted(chr(c) for c in chars)), exact
+
+    def quote_chars(self, base, prefix):
+        # Returns (characters that can follow prefix in a quote asset of
+        # base, True if prefix is one itself)
+        chars = set()
+        exact = False
+        size = len(base) + len(prefix)
+        for record in self._starting(base + prefix):
+            if record[RECORD - 1] != len(base):
+                continue
+            symbol = _symbol(record)
+            if len(symbol) == size:
+                exact = True
+            else:
+                chars.add(symbol[size])
+        return "".join(sorted(chr(c) for c in chars)), exact
@@ -0,0 +1,171 @@
+# Live Binance prices from the <symbol>@miniTicker WebSocket streams.
+#
+# One combined stream carries the whole watchlist. The latest ticker of each
+# symbol is kept in memory in the format showPrice() takes (lastPrice,
+# highPrice, lowPrice, priceChangePercent), together with when it arrived.
+#
+# poll() never blocks once connected: call it from the main loop and it
+# handles the messages that arrived. It pings the server when the stream
+# goes quiet, and when the connection drops (or the server's 24 hour limit
+# ends it) it reconnects with an increasing delay and subscribes again.
+# A reconnect does block, but every step of it gives up after connect_ms
+# and the host is only looked up once, so a stream that's down holds the
+# loop up for at most a few short timeouts every backoff.
+#
+# Typical use:
+#
+#   stream = TickerStream(["BTCUSDT", "ETHUSDT"])
+#   while True:
+#       stream.poll()
+#       data = stream.get("BTCUSDT", max_age_ms=5000)
+
+import json
+import utime
+from ws_client import WebSocket
+
+STREAM_URL = "wss://stream.binance.com:9443"
+
+
+class TickerStream:
+
+    def __init__(self, symbols, url=STREAM_URL, idle_ms=30000,
+                 min_backoff_ms=1000, max_backoff_ms=30000, connect_ms=1500,
+                 max_message=4096):
+        self.url = url
+        # Timeout of each socket operation, and longest message taken
+        self.connect_ms = connect_ms
+        self.max_message = max_message
+        self.symbols = [symbol.upper() for symbol in symbols]
+        # A ping is sent after idle_ms without frames, the connection is
+        # dropped if nothing comes back within another idle_ms
+        self.idle_ms = idle_ms
+        self.min_backoff_ms = min_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.backoff_ms = min_backoff_ms
+        self.ws = None
+        self.retry_at = utime.ticks_ms()
+        self.last_frame = 0
+        self.pinged = False
+        self.next_id = 1
+        # symbol: (ticker dict, ticks_ms() it arrived)
+        self.prices = {}
+        # Messages handled and connections made
+        self.updates = 0
+        self.connects = 0
+
+    def _streams(self, symbols):
+        return [symbol.lower() + "@miniTicker" for symbol in symbols]
+
+    def connected(self):
+        return self.ws is not None
+
+    def get(self, symbol, max_age_ms=None):
+        # Returns the latest ticker of symbol, or None if there is none or
+        # it's older than max_age_ms
+        entry = self.prices.get(symbol)
+        if entry is None:
+            return None
+        if max_age_ms is not None and utime.ticks_diff(utime.ticks_ms(), entry[1]) > max_age_ms:
+            return None
+        return entry[0]
+
+    def set_symbols(self, symbols):
+        # Changes the watchlist, on the live connection if there is one
+        symbols = [symbol.upper() for symbol in symbols]
+        added = [symbol for symbol in symbols if symbol not in self.symbols]
+        removed = [symbol for symbol in self.symbols if symbol not in symbols]
+        self.symbols = symbols
+        for symbol in removed:
+            self.prices.pop(symbol, None)
+        if self.ws is None:
+            return
+        try:
+            if removed:
+                self._request("UNSUBSCRIBE", self._streams(removed))
+            if added:
+                self._request("SUBSCRIBE", self._streams(added))
+        except OSError:
+            self._drop()
+
+    def _request(self, method, params):
+        self.ws.send(json.dumps({"method": method, "params": params, "id": self.next_id}))
+        self.next_id += 1
+
+    def connect(self):
+        # Opens the combined stream of the watchlist (blocking, each step
+        # for up to connect_ms)
+        self.close()
+        self.ws = WebSocket(self.url + "/stream?streams=" + "/".join(self._streams(self.symbols)),
+                            self.connect_ms / 1000, self.max_message)
+        self.connects += 1
+        self.backoff_ms = self.min_backoff_ms
+        self.last_frame = utime.ticks_ms()
+        self.pinged = False
+
+    def poll(self):
+        # Handles what arrived and returns the number of tickers updated.
+        # Reconnects when the connection is down and the backoff has passed.
+        now = utime.ticks_ms()
+        if self.ws is None:
+            if not self.symbols or utime.ticks_diff(now, self.retry_at) < 0:
+                return 0
+            try:
+                self.connect()
+            except OSError as e:
+                print("Stream connection failed:", e)
+                self._drop()
+                return 0
+        count = 0
+        try:
+            frames = self.ws.frames
+            while True:
+                message = self.ws.poll()
+                if message is None:
+                    break
+                count += self._handle(message)
+            now = utime.ticks_ms()
+            if self.ws.frames != frames:
+                self.last_frame = now
+                self.pinged = False
+            elif utime.ticks_diff(now, self.last_frame) > self.idle_ms:
+                if self.pinged:
+                    raise OSError("stream timed out")
+                self.ws.ping()
+                self.pinged = True
+                self.last_frame = now
+        except (OSError, ValueError) as e:
+            print("Stream dropped:", e)
+            self._drop()
+        return count
+
+    def _handle(self, message):
+        data = json.loads(message)
+        # Combined streams wrap the event, replies to requests have an id
+        data = data.get("data", data)
+        if data.get("e") != "24hrMiniTicker":
+            return 0
+        symbol = data["s"]
+        if symbol not in self.symbols:
+            return 0
+        last = float(data["c"])
+        open_price = float(data["o"])
+        change = (last - open_price) * 100 / open_price if open_price else 0
+        self.prices[symbol] = ({"lastPrice": data["c"], "highPrice": data["h"],
+                                "lowPrice": data["l"],
+                                "priceChangePercent": "%.3f" % change},
+                               utime.ticks_ms())
+        self.updates += 1
+        return 1
+
+    def _drop(self):
+        # Closes the connection and schedules the next attempt
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+        self.retry_at = utime.ticks_add(utime.ticks_ms(), self.backoff_ms)
+        self.backoff_ms = min(self.backoff_ms * 2, self.max_backoff_ms)
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
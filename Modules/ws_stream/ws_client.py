@@ -0,0 +1,255 @@
+# Minimal WebSocket client (RFC 6455) for MicroPython and CPython.
+#
+# Connects with a blocking handshake, then reads frames without blocking:
+# poll() returns the next complete message or None when there's nothing to
+# read yet. Pings from the server are answered with pongs as they arrive,
+# fragmented messages are put back together and close frames are answered
+# and reported by raising OSError, like a dropped connection.
+#
+# Every socket operation gives up after `timeout` seconds, and the address
+# of a host is only looked up once, so a reconnect is bounded by a few short
+# timeouts. Messages longer than max_message bytes close the connection
+# with an OSError instead of being buffered.
+#
+# Typical use:
+#
+#   ws = WebSocket("wss://stream.binance.com:9443/ws/btcusdt@miniTicker")
+#   while True:
+#       message = ws.poll()
+#       if message is not None:
+#           print(message)
+
+import binascii
+import os
+import socket
+try:
+    import ssl
+except ImportError:
+    import ussl as ssl
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xa
+
+_EAGAIN = (11, 110, 115, 116)
+_WANT_READ = getattr(ssl, "SSLWantReadError", ())
+
+# (host, port): address, so reconnects don't wait for DNS again
+_addresses = {}
+
+
+def _split_url(url):
+    # Returns (secure, host, port, path)
+    scheme, rest = url.split("://", 1)
+    secure = scheme == "wss"
+    if "/" in rest:
+        host, path = rest.split("/", 1)
+        path = "/" + path
+    else:
+        host, path = rest, "/"
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    else:
+        port = 443 if secure else 80
+    return secure, host, port, path
+
+
+class WebSocket:
+
+    def __init__(self, url, timeout=10, max_message=4096):
+        self.url = url
+        self.timeout = timeout
+        self.max_message = max_message
+        self.sock = None
+        # Reads don't block once the handshake is done
+        self.open = False
+        self.buf = b""
+        self.fragments = []
+        self.fragment_op = None
+        # Frames received and pings answered
+        self.frames = 0
+        self.pongs = 0
+        self._connect()
+
+    def _connect(self):
+        secure, host, port, path = _split_url(self.url)
+        addr = _addresses.get((host, port))
+        if addr is None:
+            addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
+            _addresses[(host, port)] = addr
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(addr)
+            if secure:
+                if hasattr(ssl, "create_default_context"):
+                    sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+                else:
+                    sock = ssl.wrap_socket(sock, server_hostname=host)
+            self.sock = sock
+            key = binascii.b2a_base64(os.urandom(16)).strip().decode()
+            self._write(("GET {} HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\n"
+                         "Connection: Upgrade\r\nSec-WebSocket-Key: {}\r\n"
+                         "Sec-WebSocket-Version: 13\r\n\r\n").format(path, host, key).encode())
+            status = self._readline()
+            if len(status.split()) < 2 or status.split()[1] != b"101":
+                raise OSError("websocket handshake failed: " + status.decode().strip())
+            while self._readline() not in (b"\r\n", b"\n"):
+                pass
+        except:
+            sock.close()
+            self.sock = None
+            # The host may have moved, look it up again next time
+            _addresses.pop((host, port), None)
+            raise
+        sock.setblocking(False)
+        self.open = True
+
+    def _recv(self, size):
+        # Returns up to size bytes, b"" if nothing is waiting. Raises OSError
+        # when the connection is closed.
+        sock = self.sock
+        try:
+            data = sock.recv(size) if hasattr(sock, "recv") else sock.read(size)
+        except _WANT_READ:
+            return b""
+        except OSError as e:
+            if e.args and e.args[0] in _EAGAIN:
+                return b""
+            raise
+        if data is None:
+            return b""
+        if not data:
+            raise OSError("websocket closed by the server")
+        return data
+
+    def _readline(self):
+        # Blocking read of one handshake line, what's after it stays in buf
+        while b"\n" not in self.buf:
+            data = self.sock.recv(256) if hasattr(self.sock, "recv") else self.sock.read(256)
+            if not data:
+                raise OSError("websocket closed during the handshake")
+            self.buf += data
+        end = self.buf.index(b"\n") + 1
+        line, self.buf = self.buf[:end], self.buf[end:]
+        return line
+
+    def _write(self, data):
+        # Blocking write, even once reads don't block
+        sock = self.sock
+        if self.open:
+            sock.settimeout(self.timeout)
+        if hasattr(sock, "sendall"):
+            sock.sendall(data)
+        else:
+            sock.write(data)
+        if self.open:
+            sock.setblocking(False)
+
+    def send(self, data, opcode=None):
+        # Sends a text (str) or binary (bytes) message, masked as clients must
+        if opcode is None:
+            opcode = OP_TEXT if isinstance(data, str) else OP_BINARY
+        if isinstance(data, str):
+            data = data.encode()
+        length = len(data)
+        if length < 126:
+            header = bytes([0x80 | opcode, 0x80 | length])
+        elif length < 0x10000:
+            header = bytes([0x80 | opcode, 0x80 | 126, length >> 8, length & 0xff])
+        else:
+            header = bytes([0x80 | opcode, 0x80 | 127]) + length.to_bytes(8, "big")
+        mask = os.urandom(4)
+        payload = bytearray(data)
+        for i in range(length):
+            payload[i] ^= mask[i & 3]
+        self._write(header + mask + payload)
+
+    def ping(self, data=b""):
+        self.send(data, OP_PING)
+
+    def poll(self):
+        # Reads what has arrived and returns the next complete text (str) or
+        # binary (bytes) message, or None
+        while True:
+            frame = self._frame()
+            if frame is None:
+                return None
+            opcode, payload = frame
+            if opcode == OP_PING:
+                self.send(payload, OP_PONG)
+                self.pongs += 1
+            elif opcode == OP_CLOSE:
+                try:
+                    self.send(payload[:2], OP_CLOSE)
+                except OSError:
+                    pass
+                self.close()
+                raise OSError("websocket closed by the server")
+            elif opcode == OP_PONG:
+                pass
+            else:
+                return payload.decode() if opcode == OP_TEXT else payload
+
+    def _frame(self):
+        # Returns (opcode, payload) of the next complete frame or message,
+        # None if it hasn't fully arrived yet
+        # Reading stops once a whole message of the longest size could be
+        # buffered, the rest waits in the socket
+        while len(self.buf) < self.max_message + 14:
+            data = self._recv(512)
+            if not data:
+                break
+            self.buf += data
+        buf = self.buf
+        if len(buf) < 2:
+            return None
+        fin = buf[0] & 0x80
+        opcode = buf[0] & 0x0f
+        length = buf[1] & 0x7f
+        start = 2
+        if length == 126:
+            if len(buf) < 4:
+                return None
+            length = (buf[2] << 8) | buf[3]
+            start = 4
+        elif length == 127:
+            if len(buf) < 10:
+                return None
+            length = int.from_bytes(buf[2:10], "big")
+            start = 10
+        if buf[1] & 0x80:
+            start += 4
+        if length + sum(len(f) for f in self.fragments) > self.max_message:
+            self.close()
+            raise OSError("websocket message longer than {} bytes".format(self.max_message))
+        if len(buf) < start + length:
+            return None
+        payload = buf[start:start + length]
+        if buf[1] & 0x80:
+            mask = buf[start - 4:start]
+            payload = bytes(payload[i] ^ mask[i & 3] for i in range(length))
+        self.buf = buf[start + length:]
+        self.frames += 1
+        if opcode >= OP_CLOSE:
+            return opcode, payload
+        # Data frames, possibly fragmented
+        if opcode != OP_CONT:
+            self.fragment_op = opcode
+            self.fragments = []
+        self.fragments.append(payload)
+        if not fin:
+            return self._frame()
+        payload = b"".join(self.fragments)
+        self.fragments = []
+        return self.fragment_op, payload
+
+    def close(self):
+        self.open = False
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
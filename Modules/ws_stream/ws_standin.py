@@ -0,0 +1,218 @@
+# Host side (CPython) stand-in for the Binance WebSocket streams, used to test
+# TickerStream without the real service.
+#
+# The stand-in accepts /stream?streams=<symbol>@miniTicker/... over plain
+# ws:// on localhost and sends every subscribed symbol a 24hrMiniTicker event
+# each interval_ms. It pings the client every ping_ms and counts the pongs,
+# handles SUBSCRIBE/UNSUBSCRIBE requests and can drop every connection after
+# drop_ms like the real service does after 24 hours.
+#
+# run() drives a TickerStream against it and reports the updates received,
+# the age of the price on screen, pongs, reconnects and whether prices came
+# back after the drop and after a SUBSCRIBE.
+#
+# Run it with CPython from this directory:
+#
+#   python3 ws_standin.py [seconds] [interval_ms]
+
+import base64
+import hashlib
+import json
+import random
+import select
+import socketserver
+import sys
+import threading
+import time
+
+try:
+    import utime
+except ImportError:
+    utime = type(sys)("utime")
+    utime.ticks_ms = lambda: int(time.monotonic() * 1000)
+    utime.ticks_add = lambda ticks, delta: ticks + delta
+    utime.ticks_diff = lambda new, old: new - old
+    utime.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    sys.modules["utime"] = utime
+
+from ticker_stream import TickerStream
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC11B65"
+
+
+def _frame(opcode, payload, fin=True):
+    # Unmasked server frame
+    length = len(payload)
+    first = (0x80 if fin else 0) | opcode
+    if length < 126:
+        header = bytes([first, length])
+    elif length < 0x10000:
+        header = bytes([first, 126]) + length.to_bytes(2, "big")
+    else:
+        header = bytes([first, 127]) + length.to_bytes(8, "big")
+    return header + payload
+
+
+class StandIn(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            self.serve()
+        except ConnectionError:
+            # The client went away
+            pass
+
+    def serve(self):
+        server = self.server
+        sock = self.request
+        request = b""
+        while b"\r\n\r\n" not in request:
+            data = sock.recv(1024)
+            if not data:
+                return
+            request += data
+        lines = request.decode().split("\r\n")
+        path = lines[0].split()[1]
+        headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+        accept = base64.b64encode(hashlib.sha1(
+            headers["Sec-WebSocket-Key"].encode() + GUID).digest()).decode()
+        sock.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      "Connection: Upgrade\r\nSec-WebSocket-Accept: {}\r\n\r\n").format(accept).encode())
+        streams = path.split("streams=", 1)[1].split("/") if "streams=" in path else []
+        server.connections += 1
+        start = time.monotonic()
+        next_tick = next_ping = start
+        buf = b""
+        while not server.stopping:
+            now = time.monotonic()
+            if server.drop_ms and (now - start) * 1000 >= server.drop_ms:
+                break
+            if now >= next_tick:
+                next_tick += server.interval_ms / 1000
+                for stream in streams:
+                    sock.sendall(self.event(stream))
+            if server.ping_ms and now >= next_ping:
+                next_ping += server.ping_ms / 1000
+                sock.sendall(_frame(0x9, b"standin"))
+                server.pings += 1
+            if select.select([sock], [], [], 0.005)[0]:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                buf += data
+            while True:
+                frame, buf = self.client_frame(buf)
+                if frame is None:
+                    break
+                opcode, payload = frame
+                if opcode == 0x8:
+                    sock.sendall(_frame(0x8, payload[:2]))
+                    return
+                if opcode == 0x9:
+                    sock.sendall(_frame(0xa, payload))
+                elif opcode == 0xa:
+                    server.pongs += 1
+                elif opcode == 0x1:
+                    message = json.loads(payload)
+                    params = message.get("params", [])
+                    if message.get("method") == "SUBSCRIBE":
+                        streams += [s for s in params if s not in streams]
+                    elif message.get("method") == "UNSUBSCRIBE":
+                        streams = [s for s in streams if s not in params]
+                    sock.sendall(_frame(0x1, json.dumps(
+                        {"result": None, "id": message.get("id")}).encode()))
+
+    def event(self, stream):
+        # A miniTicker event for stream, split in two fragments now and then
+        symbol = stream.split("@")[0].upper()
+        price = 27000 + random.uniform(-50, 50)
+        data = json.dumps({"stream": stream, "data": {
+            "e": "24hrMiniTicker", "E": int(time.time() * 1000), "s": symbol,
+            "c": "%.2f" % price, "o": "26800.00", "h": "27250.00",
+            "l": "26500.00", "v": "12345.678", "q": "333333333.33"}}).encode()
+        if random.random() < 0.2:
+            half = len(data) // 2
+            return _frame(0x1, data[:half], False) + _frame(0x0, data[half:])
+        return _frame(0x1, data)
+
+    @staticmethod
+    def client_frame(buf):
+        # Returns ((opcode, payload), rest) for a complete masked frame
+        if len(buf) < 2:
+            return None, buf
+        length = buf[1] & 0x7f
+        start = 2
+        if length == 126:
+            length, start = int.from_bytes(buf[2:4], "big"), 4
+        elif length == 127:
+            length, start = int.from_bytes(buf[2:10], "big"), 10
+        if len(buf) < start + 4 + length:
+            return None, buf
+        mask = buf[start:start + 4]
+        payload = bytes(b ^ mask[i & 3] for i, b in enumerate(buf[start + 4:start + 4 + length]))
+        return (buf[0] & 0x0f, payload), buf[start + 4 + length:]
+
+
+def serve(interval_ms=250, ping_ms=1000, drop_ms=0):
+    # Starts the stand-in on a free port, returns the server
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StandIn)
+    server.daemon_threads = True
+    server.interval_ms = interval_ms
+    server.ping_ms = ping_ms
+    server.drop_ms = drop_ms
+    server.stopping = False
+    server.connections = server.pings = server.pongs = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(seconds=6, interval_ms=250):
+    # Streams BTCUSDT for `seconds` with the server dropping the connection
+    # halfway and ETHUSDT subscribed after a third, then prints the results
+    drop_ms = seconds * 500
+    server = serve(interval_ms, ping_ms=1000, drop_ms=drop_ms)
+    url = "ws://127.0.0.1:{}".format(server.server_address[1])
+    stream = TickerStream(["BTCUSDT"], url=url, idle_ms=2000, min_backoff_ms=200)
+    ages = []
+    eth_seen = after_drop = False
+    start = time.monotonic()
+    subscribed = False
+    while time.monotonic() - start < seconds:
+        elapsed = (time.monotonic() - start) * 1000
+        stream.poll()
+        if not subscribed and elapsed > seconds * 333 and stream.connected():
+            stream.set_symbols(["BTCUSDT", "ETHUSDT"])
+            subscribed = True
+        entry = stream.prices.get("BTCUSDT")
+        if entry is not None:
+            ages.append(utime.ticks_diff(utime.ticks_ms(), entry[1]))
+            if elapsed > drop_ms + 100 and stream.connects > 1:
+                after_drop = True
+        if stream.get("ETHUSDT") is not None:
+            eth_seen = True
+        time.sleep(0.05)
+    stream.close()
+    server.stopping = True
+    server.shutdown()
+    server.server_close()
+    results = {
+        "updates": stream.updates,
+        "updates_per_s": stream.updates / seconds,
+        "mean_age_ms": sum(ages) / max(len(ages), 1),
+        "max_age_ms": max(ages) if ages else None,
+        "pings": server.pings,
+        "pongs": server.pongs,
+        "connects": stream.connects,
+        "resumed_after_drop": after_drop,
+        "subscribed_symbol": eth_seen,
+    }
+    for name, value in results.items():
+        print("{:<20}{}".format(name, round(value, 1) if isinstance(value, float) else value))
+    return results
+
+
+if __name__ == "__main__":
+    results = run(*[int(arg) for arg in sys.argv[1:]])
+    if not (results["resumed_after_drop"] and results["subscribed_symbol"] and
+            results["pongs"]):
+        sys.exit(1)